@@ -4,27 +4,148 @@ from .models import *
 
 from django.utils.safestring import mark_safe 
 
-from django.http import HttpResponse
-from .pdf_utils import generate_artists_pdf, generate_tracks_pdf, generate_release_pdf
+from django.http import FileResponse, Http404, HttpResponseRedirect
+from django.urls import path, reverse
+from . import approximate_counts, export_jobs, facets, listener_sketches, smart_playlists, stats
+
+import datetime
 
 from django.contrib import messages
-from .models import Artist, Genre, Label, Release, Track, Playlist, Scrobble
+from django.contrib.admin.views.main import PAGE_VAR, ChangeList
+from django.db.models import Count
+from django.utils import formats
+from django.utils.functional import cached_property
+from django.utils.text import capfirst
+from django.utils.translation import gettext as _
+from .models import Artist, Genre, Label, Release, Track, Playlist, PlaylistEntry, Scrobble, SmartPlaylist
+
+# Запросы списков: все, что нужно колонкам, - в одном запросе страницы
+class ChangelistQueryMixin:
+    """Аннотации и prefetch_related для списка в get_queryset
+
+    list_annotations - {имя: выражение} для колонок-счетчиков и т.п.,
+    list_prefetch_related - связи "многие" для колонок. Связи "один"
+    (в том числе для __str__ связанных объектов) перечисляются в
+    стандартном list_select_related. Число запросов страницы списка не
+    зависит от числа строк - это проверяет catalog/tests.py.
+    """
+    list_annotations = {}
+    list_prefetch_related = []
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if self.list_annotations:
+            queryset = queryset.annotate(**self.list_annotations)
+        if self.list_prefetch_related:
+            queryset = queryset.prefetch_related(*self.list_prefetch_related)
+        return queryset
+
+
+# Большие списки: счетчики из статистики и переходы по датам из кэша
+class ApproximateChangeList(ChangeList):
+    """Переходы date_hierarchy по кэшированной гистограмме (год, месяц)
+
+    Годы и месяцы берутся из approximate_counts.date_histogram вместо
+    DISTINCT и MIN/MAX по всей таблице; дни выбранного месяца - запросом
+    в пределах месяца (по индексу на поле даты). Гистограмма общая для всей
+    таблицы: фильтры и поиск на годы и месяцы не влияют, переход может
+    привести к пустому периоду.
+    """
+
+    @cached_property
+    def next_page_url(self):
+        """Ссылка на следующую страницу, когда число строк известно только снизу"""
+        if self.paginator.count_is_lower_bound and len(self.result_list) == self.list_per_page:
+            return self.get_query_string({PAGE_VAR: self.page_num + 1})
+        return None
+
+    @cached_property
+    def date_drilldown(self):
+        field = self.date_hierarchy
+        year_field, month_field, day_field = f'{field}__year', f'{field}__month', f'{field}__day'
+        year, month, day = (self.params.get(name) for name in (year_field, month_field, day_field))
+
+        def link(filters):
+            return self.get_query_string(filters, [f'{field}__'])
+
+        histogram = approximate_counts.date_histogram(self.model, field)
+        if not year:
+            # Как в date_hierarchy: данные за один год (месяц) - сразу на уровень ниже
+            years = sorted({key[0] for key in histogram})
+            if len(years) != 1:
+                return {
+                    'back': None,
+                    'choices': [{'link': link({year_field: y}), 'title': str(y)} for y in years],
+                }
+            year = years[0]
+            months = [key[1] for key in histogram]
+            if len(months) == 1:
+                month = months[0]
+
+        if year and month and day:
+            date = datetime.date(int(year), int(month), int(day))
+            return {
+                'back': {
+                    'link': link({year_field: year, month_field: month}),
+                    'title': capfirst(formats.date_format(date, 'YEAR_MONTH_FORMAT')),
+                },
+                'choices': [{'title': capfirst(formats.date_format(date, 'MONTH_DAY_FORMAT'))}],
+            }
+        if year and month:
+            days = self.queryset.datetimes(field, 'day') if isinstance(
+                self.model._meta.get_field(field), models.DateTimeField
+            ) else self.queryset.dates(field, 'day')
+            return {
+                'back': {'link': link({year_field: year}), 'title': str(year)},
+                'choices': [
+                    {
+                        'link': link({year_field: year, month_field: month, day_field: date.day}),
+                        'title': capfirst(formats.date_format(date, 'MONTH_DAY_FORMAT')),
+                    }
+                    for date in days
+                ],
+            }
+        return {
+            'back': {'link': link({}), 'title': _('All dates')},
+            'choices': [
+                {
+                    'link': link({year_field: year, month_field: m}),
+                    'title': capfirst(formats.date_format(datetime.date(int(year), m, 1), 'YEAR_MONTH_FORMAT')),
+                }
+                for y, m in sorted(histogram) if y == int(year)
+            ],
+        }
+
+
+class ApproximateCountMixin:
+    """Список без полных COUNT(*) (см. catalog/approximate_counts.py)
+
+    Число строк - из статистики или "больше N", общий счетчик при фильтрах
+    не показывается, date_hierarchy строится по кэшированной гистограмме.
+    """
+    paginator = approximate_counts.ApproximateCountPaginator
+    show_full_result_count = False
+    change_list_template = 'admin/catalog/approximate_change_list.html'
+
+    def get_changelist(self, request, **kwargs):
+        return ApproximateChangeList
+
+
+# Действие для экспорта в PDF: выгрузка ставится в очередь (см. export_jobs),
+# файл строит команда run_export_worker
+def _enqueue_export(request, kind, object_ids):
+    job = export_jobs.enqueue(kind, object_ids, request.user)
+    messages.info(request, f'Выгрузка #{job.pk} поставлена в очередь')
+    return HttpResponseRedirect(reverse('admin:catalog_exportjob_status', args=[job.pk]))
 
-# Действие для экспорта в PDF
 def export_artists_to_pdf(modeladmin, request, queryset):
     """Экспорт выбранных исполнителей в PDF"""
-    pdf_buffer = generate_artists_pdf(queryset)
-    response = HttpResponse(pdf_buffer, content_type='application/pdf')
-    response['Content-Disposition'] = 'attachment; filename="artists_report.pdf"'
-    return response
+    return _enqueue_export(request, 'artists', queryset.values_list('pk', flat=True))
 export_artists_to_pdf.short_description = "Экспорт выбранных исполнителей в PDF"
 
 def export_tracks_to_pdf(modeladmin, request, queryset):
     """Экспорт выбранных треков в PDF"""
-    pdf_buffer = generate_tracks_pdf(queryset)
-    response = HttpResponse(pdf_buffer, content_type='application/pdf')
-    response['Content-Disposition'] = 'attachment; filename="tracks_report.pdf"'
-    return response
+    return _enqueue_export(request, 'tracks', queryset.values_list('pk', flat=True))
 export_tracks_to_pdf.short_description = "Экспорт выбранных треков в PDF"
 
 
@@ -35,7 +156,8 @@ export_tracks_to_pdf.short_description = "Экспорт выбранных тр
 # Действия для Artist
 def make_artists_featured(modeladmin, request, queryset):
     """Пометить исполнителей как избранных (добавляем в название)"""
-    updated = queryset.update(name=models.F('name') + ' ★')
+    with smart_playlists.tracking(Track.objects.filter(release__artist__in=queryset), {'artist'}):
+        updated = queryset.update(name=models.F('name') + ' ★')
     messages.success(request, f'{updated} исполнителей помечены как избранные')
 make_artists_featured.short_description = "Пометить как избранных"
 
@@ -48,26 +170,31 @@ clear_artist_biographies.short_description = "Очистить биографи
 # Действия для Track
 def publish_tracks(modeladmin, request, queryset):
     """Опубликовать выбранные треки"""
-    updated = queryset.update(status='published')
+    with facets.tracking(queryset), stats.tracking(queryset), smart_playlists.tracking(queryset, {'status'}):
+        updated = queryset.update(status='published')
     messages.success(request, f'{updated} треков опубликовано')
 publish_tracks.short_description = "Опубликовать треки"
 
 def draft_tracks(modeladmin, request, queryset):
     """Перевести треки в черновики"""
-    updated = queryset.update(status='draft')
+    with facets.tracking(queryset), stats.tracking(queryset), smart_playlists.tracking(queryset, {'status'}):
+        updated = queryset.update(status='draft')
     messages.info(request, f'{updated} треков переведены в черновики')
 draft_tracks.short_description = "В черновики"
 
 def archive_tracks(modeladmin, request, queryset):
     """Архивировать треки"""
-    updated = queryset.update(status='archived')
+    with facets.tracking(queryset), stats.tracking(queryset), smart_playlists.tracking(queryset, {'status'}):
+        updated = queryset.update(status='archived')
     messages.info(request, f'{updated} треков архивировано')
 archive_tracks.short_description = "Архивировать треки"
 
 # Действия для Release
 def mark_as_digital(modeladmin, request, queryset):
     """Пометить релизы как цифровые"""
-    updated = queryset.update(format='Digital')
+    tracks = Track.objects.filter(release__in=queryset)
+    with facets.tracking(tracks), smart_playlists.tracking(tracks, {'format'}):
+        updated = queryset.update(format='Digital')
     messages.success(request, f'{updated} релизов помечены как цифровые')
 mark_as_digital.short_description = "Пометить как цифровые"
 
@@ -108,7 +235,9 @@ def update_release_years(modeladmin, request, queryset):
     if 'apply' in request.POST:
         try:
             years_to_add = int(request.POST.get('years_to_add', 0))
-            updated = queryset.update(release_year=models.F('release_year') + years_to_add)
+            tracks = Track.objects.filter(release__in=queryset)
+            with facets.tracking(tracks), smart_playlists.tracking(tracks, {'year'}):
+                updated = queryset.update(release_year=models.F('release_year') + years_to_add)
             messages.success(request, f'Год выпуска обновлен для {updated} релизов')
             return None
         except ValueError:
@@ -123,9 +252,9 @@ update_release_years.short_description = "Обновить годы выпуск
 
 # Настройка для Исполнителей
 @admin.register(Artist)
-class ArtistAdmin(admin.ModelAdmin):
+class ArtistAdmin(ChangelistQueryMixin, admin.ModelAdmin):
     # Что показывать в списке
-    list_display = ['name', 'display_image', 'get_release_count', 'created_at']
+    list_display = ['name', 'display_image', 'get_release_count', 'get_unique_listeners', 'created_at']
     
     # По каким полям можно фильтровать
     list_filter = ['created_at']
@@ -141,6 +270,11 @@ class ArtistAdmin(admin.ModelAdmin):
     
     actions = [export_artists_to_pdf, make_artists_featured, clear_artist_biographies]
     
+    list_annotations = {
+        'release_count': Count('releases'),
+        'unique_listeners': listener_sketches.annotation('artist'),
+    }
+    
     fieldsets = (
         ('Основная информация', {
             'fields': ('name', 'biography', 'image')
@@ -165,9 +299,13 @@ class ArtistAdmin(admin.ModelAdmin):
     
     
     # Собственный метод для отображения количества релизов
-    @admin.display(description='Количество релизов')
+    @admin.display(description='Количество релизов', ordering='release_count')
     def get_release_count(self, obj):
-        return obj.releases.count()
+        return obj.release_count
+
+    @admin.display(description='Уникальных слушателей (~)', ordering='unique_listeners')
+    def get_unique_listeners(self, obj):
+        return obj.unique_listeners or 0
 
 # Настройка для Лейблов
 @admin.register(Label)
@@ -179,13 +317,14 @@ class LabelAdmin(admin.ModelAdmin):
 
 # Настройка для Жанров
 @admin.register(Genre)
-class GenreAdmin(admin.ModelAdmin):
+class GenreAdmin(ChangelistQueryMixin, admin.ModelAdmin):
     list_display = ['name', 'get_track_count']
     search_fields = ['name']
+    list_annotations = {'track_count': Count('tracks')}
     
-    @admin.display(description='Количество треков')
+    @admin.display(description='Количество треков', ordering='track_count')
     def get_track_count(self, obj):
-        return obj.tracks.count()
+        return obj.track_count
 
 # Встроенное отображение треков внутри релиза
 class TrackInline(admin.TabularInline):
@@ -196,7 +335,7 @@ class TrackInline(admin.TabularInline):
 
 # Настройка для Релизов
 @admin.register(Release)
-class ReleaseAdmin(admin.ModelAdmin):
+class ReleaseAdmin(ChangelistQueryMixin, admin.ModelAdmin):
     list_display = ['title', 'artist', 'has_streaming_links', 'display_cover', 'release_year', 'format', 'is_new', 'get_track_count']
     list_display_links = ['title']
     list_filter = ['format', 'release_year', 'artist']
@@ -213,14 +352,13 @@ class ReleaseAdmin(admin.ModelAdmin):
     
     actions = [mark_as_digital, duplicate_releases]
     
+    list_select_related = ['artist']
+    list_annotations = {'track_count': Count('tracks')}
+    
     def export_release_pdf(self, request, release_id):
         """Экспорт конкретного релиза в PDF"""
-        from .models import Release
-        release = Release.objects.get(id=release_id)
-        pdf_buffer = generate_release_pdf(release)
-        response = HttpResponse(pdf_buffer, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="release_{release.id}.pdf"'
-        return response
+        release = get_object_or_404(Release, pk=release_id)
+        return _enqueue_export(request, 'release', [release.pk])
     
     def get_urls(self):
         """Добавляем кастомный URL для экспорта релиза"""
@@ -248,9 +386,9 @@ class ReleaseAdmin(admin.ModelAdmin):
         return "Нет обложки"
     
     
-    @admin.display(description='Треков')
+    @admin.display(description='Треков', ordering='track_count')
     def get_track_count(self, obj):
-        return obj.tracks.count()
+        return obj.track_count
     
     @admin.display(description='ТЕСТ')
     def test_method(self, obj):
@@ -258,8 +396,8 @@ class ReleaseAdmin(admin.ModelAdmin):
 
 # Настройка для Треков
 @admin.register(Track)
-class TrackAdmin(admin.ModelAdmin):
-    list_display = ['title', 'get_artist_name', 'release', 'status', 'has_audio', 'has_lyrics', 'added_recently', 'get_duration', 'created_at']
+class TrackAdmin(ApproximateCountMixin, ChangelistQueryMixin, admin.ModelAdmin):
+    list_display = ['title', 'get_artist_name', 'release', 'status', 'has_audio', 'has_lyrics', 'added_recently', 'get_duration', 'get_unique_listeners', 'created_at']
     list_display_links = ['title']
     list_filter = ['release__artist', 'genres', 'release__release_year', 'status']
     search_fields = ['title', 'release__title', 'release__artist__name']
@@ -274,6 +412,10 @@ class TrackAdmin(admin.ModelAdmin):
     
     actions = [export_tracks_to_pdf, publish_tracks, draft_tracks, archive_tracks]
     
+    # Release.__str__ и колонка исполнителя читают release.artist
+    list_select_related = ['release__artist']
+    list_annotations = {'unique_listeners': listener_sketches.annotation('track')}
+    
     
     
     
@@ -326,31 +468,116 @@ class TrackAdmin(admin.ModelAdmin):
         seconds = obj.duration_seconds % 60
         return f"{minutes}:{seconds:02d}"
 
+    @admin.display(description='Уникальных слушателей (~)', ordering='unique_listeners')
+    def get_unique_listeners(self, obj):
+        return obj.unique_listeners or 0
+
 # Настройка для Плейлистов
 @admin.register(Playlist)
 class PlaylistAdmin(admin.ModelAdmin):
-    list_display = ['title', 'user', 'get_track_count', 'is_public', 'created_at']
+    list_display = ['title', 'user', 'track_count', 'total_duration', 'is_public', 'created_at']
     list_display_links = ['title']
     list_filter = ['is_public', 'created_at', 'user']
     search_fields = ['title', 'user__username']
     
     raw_id_fields = ['user']  # Для пользователей
     
-    readonly_fields = ['created_at']
+    # Итоги по трекам хранятся в самом плейлисте (catalog/playlist_stats.py)
+    readonly_fields = ['created_at', 'track_count', 'total_duration_seconds']
+    list_select_related = ['user']
     
     
     
     date_hierarchy = 'created_at'
     
     actions = [make_playlists_public, make_playlists_private]
-    
-    @admin.display(description='Треков')
-    def get_track_count(self, obj):
-        return obj.tracks.count()
+
+
+@admin.register(PlaylistEntry)
+class PlaylistEntryAdmin(admin.ModelAdmin):
+    list_display = ['playlist', 'track', 'position', 'added_at']
+    list_display_links = ['track']
+    search_fields = ['track__title', 'playlist__title']
+    raw_id_fields = ['playlist', 'track']
+    readonly_fields = ['added_at']
+    list_select_related = ['playlist__user', 'track__release__artist']
+
+# Смарт-плейлисты: состав ведется сигналами, пересборка - действием
+def rebuild_smart_playlists(modeladmin, request, queryset):
+    """Пересобрать состав смарт-плейлистов по правилам"""
+    for playlist in queryset:
+        smart_playlists.rebuild(playlist)
+    messages.success(request, f'Пересобрано смарт-плейлистов: {len(queryset)}')
+rebuild_smart_playlists.short_description = "Пересобрать по правилам"
+
+
+@admin.register(SmartPlaylist)
+class SmartPlaylistAdmin(admin.ModelAdmin):
+    list_display = ['title', 'user', 'order_by', 'limit', 'member_count', 'is_public', 'refreshed_at']
+    list_display_links = ['title']
+    list_filter = ['is_public', 'order_by']
+    search_fields = ['title', 'user__username']
+    raw_id_fields = ['user']
+    readonly_fields = ['member_count', 'refreshed_at', 'created_at']
+    list_select_related = ['user']
+    actions = [rebuild_smart_playlists]
+
+# Фоновые выгрузки PDF: только просмотр, статус и скачивание
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'created_by', 'status', 'get_progress', 'attempts', 'created_at', 'finished_at']
+    list_filter = ['status', 'kind']
+    list_select_related = ['created_by']
+    readonly_fields = [field.name for field in ExportJob._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if not request.user.is_superuser:
+            queryset = queryset.filter(created_by=request.user)
+        return queryset
+
+    @admin.display(description='Готово')
+    def get_progress(self, obj):
+        return f'{obj.percent}%'
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path('<int:job_id>/status/', self.admin_site.admin_view(self.status_view),
+                 name='catalog_exportjob_status'),
+            path('<int:job_id>/download/', self.admin_site.admin_view(self.download_view),
+                 name='catalog_exportjob_download'),
+        ]
+        return custom_urls + urls
+
+    def status_view(self, request, job_id):
+        """Ход выгрузки; страница обновляется, пока задача не завершена"""
+        job = get_object_or_404(self.get_queryset(request), pk=job_id)
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': str(job),
+            'job': job,
+            'refresh': job.status in ('queued', 'running'),
+        }
+        return render(request, 'admin/catalog/exportjob/status.html', context)
+
+    def download_view(self, request, job_id):
+        job = get_object_or_404(self.get_queryset(request), pk=job_id, status='done')
+        if not job.file:
+            raise Http404('Файл выгрузки уже удален')
+        return FileResponse(job.file.open('rb'), as_attachment=True,
+                            filename=job.file.name.rsplit('/', 1)[-1], content_type='application/pdf')
 
 # Настройка для Прослушиваний
 @admin.register(Scrobble)
-class ScrobbleAdmin(admin.ModelAdmin):
+class ScrobbleAdmin(ApproximateCountMixin, admin.ModelAdmin):
     list_display = ['user', 'track', 'listened_today', 'get_artist_name', 'scrobbled_at']
     list_display_links = ['track']
     list_filter = ['scrobbled_at', 'user']
@@ -361,6 +588,9 @@ class ScrobbleAdmin(admin.ModelAdmin):
     
     date_hierarchy = 'scrobbled_at'
     
+    # Track.__str__ и колонка исполнителя читают track.release.artist
+    list_select_related = ['user', 'track__release__artist']
+    
     @admin.display(description='Исполнитель')
     def get_artist_name(self, obj):
         return obj.track.release.artist.name
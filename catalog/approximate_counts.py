@@ -0,0 +1,137 @@
+"""Приблизительные счетчики для больших списков админки
+
+Список админки на каждой странице считает COUNT(*) по отфильтрованному
+queryset'у и по всей таблице, а date_hierarchy строит переходы по годам
+и месяцам через DISTINCT по всей таблице. На десятках миллионов строк это
+секунды. Здесь:
+
+- ApproximateCountPaginator: для списка без фильтров берет число строк из
+  CatalogStats (треки, релизы, исполнители) или из статистики SQLite
+  (sqlite_stat1, обновляется командой ANALYZE); с фильтрами или без
+  статистики считает не дальше COUNT_LIMIT строк и показывает "больше N";
+- date_histogram(): число строк по (год, месяц), один GROUP BY на
+  HISTOGRAM_TTL секунд в кэше; из него строятся переходы date_hierarchy.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db import DatabaseError, connection
+from django.db.models import Count
+from django.db.models.functions import ExtractMonth, ExtractYear
+from django.utils.functional import cached_property
+
+from . import stats
+from .models import Artist, Release, Track
+
+KEY_PREFIX = 'catalog:date_histogram'
+
+# Дальше этого числа строк отфильтрованный список не считается
+COUNT_LIMIT = getattr(settings, 'CATALOG_ADMIN_COUNT_LIMIT', 10000)
+HISTOGRAM_TTL = getattr(settings, 'CATALOG_ADMIN_HISTOGRAM_TTL', 3600)
+
+# Модель -> поле CatalogStats с числом ее строк
+STATS_FIELDS = {
+    Artist: 'artist_count',
+    Release: 'release_count',
+    Track: 'track_count',
+}
+
+
+def table_estimate(model):
+    """Число строк таблицы по sqlite_stat1 или None, если ANALYZE еще не запускался"""
+    if connection.vendor != 'sqlite':
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s', [model._meta.db_table])
+            rows = cursor.fetchall()
+    except DatabaseError:  # таблицы sqlite_stat1 нет
+        return None
+    # Первое число stat - строк в таблице на момент ANALYZE
+    counts = [int(stat.split()[0]) for stat, in rows if stat and stat.split()[0].isdigit()]
+    return max(counts) if counts else None
+
+
+def estimated_total(model):
+    """Число строк модели без COUNT(*): CatalogStats или sqlite_stat1; None - неизвестно"""
+    if model in STATS_FIELDS:
+        return getattr(stats.get(), STATS_FIELDS[model])
+    return table_estimate(model)
+
+
+class ApproximateCountPaginator(Paginator):
+    """Paginator без полного COUNT(*)
+
+    count_is_estimate - число взято из статистики, count_is_lower_bound -
+    строк больше count (подсчет остановлен на COUNT_LIMIT); тогда открываются
+    и страницы дальше num_pages, пока в них есть строки.
+    """
+    count_is_estimate = False
+    count_is_lower_bound = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:  # список без фильтров и поиска
+            total = estimated_total(queryset.model)
+            # Маленькой оценке не верим: при count <= list_per_page админка
+            # читает список без LIMIT, а устаревшая статистика может занижать
+            if total is not None and total > COUNT_LIMIT:
+                self.count_is_estimate = True
+                return total
+        # COUNT по подзапросу с LIMIT: не дальше COUNT_LIMIT + 1 строк
+        count = queryset.order_by()[:COUNT_LIMIT + 1].count()
+        if count > COUNT_LIMIT:
+            self.count_is_lower_bound = True
+            return COUNT_LIMIT
+        return count
+
+    def validate_number(self, number):
+        # count вычисляется первым: он выставляет count_is_lower_bound
+        if not (self.count and self.count_is_lower_bound):
+            return super().validate_number(number)
+        # Строк больше count: страницы за num_pages тоже есть
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(self.error_messages['invalid_page'])
+        if number < 1:
+            raise EmptyPage(self.error_messages['min_page'])
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not (self.count and self.count_is_lower_bound):
+            return super().page(number)
+        # Без обрезки последней страницы по count: его граница - не конец списка
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page])
+        if not rows and number > 1:
+            raise EmptyPage(self.error_messages['no_results'])
+        return self._get_page(rows, number, self)
+
+
+# Гистограмма дат
+
+def _histogram_key(model, field):
+    return f'{KEY_PREFIX}:{model._meta.label_lower}:{field}'
+
+
+def date_histogram(model, field):
+    """{(год, месяц): число строк} по полю даты, из кэша не старше HISTOGRAM_TTL"""
+    key = _histogram_key(model, field)
+    histogram = cache.get(key)
+    if histogram is None:
+        rows = (
+            model._default_manager.order_by()
+            .annotate(histogram_year=ExtractYear(field), histogram_month=ExtractMonth(field))
+            .values_list('histogram_year', 'histogram_month')
+            .annotate(n=Count('pk'))
+        )
+        histogram = {(year, month): n for year, month, n in rows if year is not None}
+        cache.set(key, histogram, HISTOGRAM_TTL)
+    return histogram
+
+
+def invalidate_histogram(model, field):
+    cache.delete(_histogram_key(model, field))
@@ -0,0 +1,294 @@
+"""Автодополнение по префиксу (search-as-you-type)
+
+Индекс живет в памяти процесса: отсортированный список ключей
+(нормализованное название и каждый его "хвост" с начала слова), поиск
+диапазона по префиксу - bisect. Внутри диапазона результаты ранжируются
+по популярности: Artist.popularity_score, Track.play_count, для релиза -
+сумма play_count его треков; для префиксов из 1-2 символов топы готовы
+заранее. Индекс загружается лениво при первом запросе, обновляется
+инкрементально сигналами и целиком перечитывается в фоне раз в
+CATALOG_AUTOCOMPLETE_TTL секунд (изменения из других процессов и
+F()-обновления play_count, которые не посылают сигналов).
+"""
+import heapq
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Sum
+from django.urls import reverse
+
+from .fuzzy_search import normalize
+from .models import Artist, Release, Track
+
+logger = logging.getLogger(__name__)
+
+KINDS = ('artist', 'release', 'track')
+
+# Верхняя граница диапазона ключей с заданным префиксом
+_MAX_CHAR = '\U0010ffff'
+
+# Сколько готовых ответов держать в кэше
+RESULT_CACHE_SIZE = 1024
+
+# Префиксы не длиннее этого покрывают большую часть каталога: топ для них
+# считается при загрузке и ведется инкрементально, а не сортировкой диапазона
+SHORT_PREFIX = 2
+
+# Наибольший limit ответа (и длина заранее посчитанных топов)
+MAX_LIMIT = 20
+
+
+def _keys_for(normalized):
+    """Ключи, по которым объект находится: вся строка и хвосты с начала каждого слова"""
+    words = normalized.split()
+    return {' '.join(words[i:]) for i in range(len(words))}
+
+
+def _short_prefixes(keys):
+    """Короткие префиксы ключей объекта"""
+    return {key[:length] for key in keys for length in range(1, SHORT_PREFIX + 1) if len(key) >= length}
+
+
+def _rank(entry, pk):
+    return entry['weight'], -pk
+
+
+class PrefixIndex:
+    """Отсортированный массив ключей с популярностью для каждого объекта
+
+    Истекший по ttl индекс перечитывается в фоновом потоке: до замены
+    запросы обслуживает старый, изменения за время чтения повторяются на
+    новом.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self._reloading = None  # журнал изменений во время фоновой загрузки
+        self._keys = []      # отсортированные (ключ, kind, id)
+        self._entries = {}   # (kind, id) -> {'label', 'subtitle', 'weight', 'keys'}
+        self._tops = {}      # (короткий префикс, kind) -> [(вес, -id)] по убыванию, до MAX_LIMIT
+        self._stale_tops = set()  # топы, из которых ушел объект: пересчитать при чтении
+        self._results = {}
+
+    # Загрузка
+
+    def load(self):
+        """Перечитывает индекс из базы"""
+        keys = []
+        entries = {}
+
+        for pk, name, weight in Artist.objects.order_by().values_list(
+            'pk', 'name', 'popularity_score'
+        ).iterator():
+            self._collect(keys, entries, 'artist', pk, name, '', weight)
+
+        releases = Release.objects.order_by().values_list(
+            'pk', 'title', 'artist__name'
+        ).annotate(weight=Sum('tracks__play_count'))
+        for pk, title, artist_name, weight in releases.iterator():
+            self._collect(keys, entries, 'release', pk, title, artist_name, weight or 0)
+
+        for pk, title, artist_name, weight in Track.objects.order_by().values_list(
+            'pk', 'title', 'release__artist__name', 'play_count'
+        ).iterator():
+            self._collect(keys, entries, 'track', pk, title, artist_name, weight)
+
+        keys.sort()
+        tops = self._build_tops(entries)
+        with self._lock:
+            journal = self._reloading
+            self._keys = keys
+            self._entries = entries
+            self._tops = tops
+            self._stale_tops = set()
+            self._results = {}
+            self._loaded_at = time.monotonic()
+            self._reloading = None
+            # Изменения, пришедшие, пока индекс читался из базы
+            for method, args in journal or ():
+                method(*args)
+
+    @staticmethod
+    def _collect(keys, entries, kind, pk, label, subtitle, weight):
+        object_keys = _keys_for(normalize(label))
+        entries[(kind, pk)] = {
+            'label': label,
+            'subtitle': subtitle,
+            'weight': weight,
+            'keys': object_keys,
+        }
+        keys.extend((key, kind, pk) for key in object_keys)
+
+    @staticmethod
+    def _build_tops(entries):
+        heaps = {}
+        for (kind, pk), entry in entries.items():
+            rank = _rank(entry, pk)
+            for prefix in _short_prefixes(entry['keys']):
+                heap = heaps.setdefault((prefix, kind), [])
+                if len(heap) < MAX_LIMIT:
+                    heapq.heappush(heap, rank)
+                elif rank > heap[0]:
+                    heapq.heapreplace(heap, rank)
+        return {slot: sorted(heap, reverse=True) for slot, heap in heaps.items()}
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None:
+            self.load()
+        elif (
+            self.ttl is not None
+            and time.monotonic() - self._loaded_at > self.ttl
+            and self._reloading is None
+        ):
+            self._reloading = []
+            threading.Thread(target=self._reload, name='autocomplete-reload', daemon=True).start()
+
+    def _reload(self):
+        try:
+            self.load()
+        except Exception:
+            logger.exception('Не удалось перечитать индекс автодополнения')
+            with self._lock:
+                self._reloading = None
+                self._loaded_at = time.monotonic()  # следующая попытка - через ttl
+        finally:
+            close_old_connections()
+
+    @property
+    def loaded(self):
+        return self._loaded_at is not None
+
+    # Инкрементальные обновления
+
+    def update(self, kind, pk, label, subtitle='', weight=None):
+        """Добавляет объект или обновляет его название/популярность"""
+        with self._lock:
+            if self._loaded_at is None:
+                return  # индекс еще не загружен - прочитает актуальные данные сам
+            if self._reloading is not None:
+                self._reloading.append((self.update, (kind, pk, label, subtitle, weight)))
+            entry = self._entries.get((kind, pk))
+            new_keys = _keys_for(normalize(label))
+            if entry is None:
+                entry = {'keys': set(), 'weight': 0}
+                self._entries[(kind, pk)] = entry
+            old_keys, old_rank = entry['keys'], _rank(entry, pk)
+            for key in old_keys - new_keys:
+                self._remove_key((key, kind, pk))
+            for key in new_keys - old_keys:
+                insort(self._keys, (key, kind, pk))
+            entry.update(label=label, subtitle=subtitle, keys=new_keys)
+            if weight is not None:
+                entry['weight'] = weight
+            self._update_tops(kind, old_keys, old_rank, new_keys, _rank(entry, pk))
+            self._forget_results(old_keys | new_keys)
+
+    def remove(self, kind, pk):
+        """Удаляет объект из индекса"""
+        with self._lock:
+            if self._reloading is not None:
+                self._reloading.append((self.remove, (kind, pk)))
+            entry = self._entries.pop((kind, pk), None)
+            if entry is None:
+                return
+            for key in entry['keys']:
+                self._remove_key((key, kind, pk))
+            self._update_tops(kind, entry['keys'], _rank(entry, pk), set(), None)
+            self._forget_results(entry['keys'])
+
+    def _remove_key(self, item):
+        position = bisect_left(self._keys, item)
+        if position < len(self._keys) and self._keys[position] == item:
+            del self._keys[position]
+
+    def _update_tops(self, kind, old_keys, old_rank, new_keys, new_rank):
+        """Переносит объект в топах коротких префиксов (new_rank None - объект удален)"""
+        new_prefixes = _short_prefixes(new_keys)
+        for prefix in _short_prefixes(old_keys):
+            top = self._tops.get((prefix, kind))
+            if top is None or old_rank not in top:
+                continue
+            top.remove(old_rank)
+            # На освободившееся место может претендовать объект вне топа
+            if prefix not in new_prefixes or new_rank < old_rank:
+                self._stale_tops.add((prefix, kind))
+        if new_rank is None:
+            return
+        for prefix in new_prefixes:
+            top = self._tops.setdefault((prefix, kind), [])
+            if (prefix, kind) in self._stale_tops or new_rank in top:
+                continue
+            if len(top) < MAX_LIMIT or new_rank > top[-1]:
+                insort(top, new_rank, key=lambda rank: (-rank[0], -rank[1]))
+                del top[MAX_LIMIT:]
+
+    def _forget_results(self, keys):
+        """Сбрасывает готовые ответы для префиксов, под которые попадают ключи"""
+        self._results = {
+            (prefix, limit): result for (prefix, limit), result in self._results.items()
+            if not any(key.startswith(prefix) for key in keys)
+        }
+
+    # Поиск
+
+    def _range(self, prefix):
+        start = bisect_left(self._keys, (prefix,))
+        end = bisect_left(self._keys, (prefix + _MAX_CHAR,))
+        return self._keys[start:end]
+
+    def _top(self, prefix, kind, limit):
+        """[id] лучших по популярности объектов kind с ключом на prefix"""
+        if len(prefix) <= SHORT_PREFIX:
+            slot = (prefix, kind)
+            if slot in self._stale_tops:
+                candidates = {pk for _key, key_kind, pk in self._range(prefix) if key_kind == kind}
+                self._tops[slot] = heapq.nlargest(
+                    MAX_LIMIT, (_rank(self._entries[(kind, pk)], pk) for pk in candidates)
+                )
+                self._stale_tops.discard(slot)
+            return [-negative_pk for _weight, negative_pk in self._tops.get(slot, [])[:limit]]
+
+        candidates = {pk for _key, key_kind, pk in self._range(prefix) if key_kind == kind}
+        return heapq.nlargest(limit, candidates, key=lambda pk: _rank(self._entries[(kind, pk)], pk))
+
+    def complete(self, prefix, limit=5):
+        """Топ-limit объектов каждого типа, название которых начинается с prefix"""
+        prefix = normalize(prefix)
+        limit = min(limit, MAX_LIMIT)
+        if not prefix:
+            return {kind: [] for kind in KINDS}
+
+        with self._lock:
+            self._ensure_loaded()
+            cached = self._results.get((prefix, limit))
+            if cached is not None:
+                return cached
+
+            result = {
+                kind: [self._as_dict(kind, pk) for pk in self._top(prefix, kind, limit)]
+                for kind in KINDS
+            }
+
+            if len(self._results) >= RESULT_CACHE_SIZE:
+                self._results = {}
+            self._results[(prefix, limit)] = result
+            return result
+
+    def _as_dict(self, kind, pk):
+        entry = self._entries[(kind, pk)]
+        return {
+            'id': pk,
+            'label': entry['label'],
+            'subtitle': entry['subtitle'],
+            'url': reverse(f'{kind}-detail', kwargs={'pk': pk}),
+        }
+
+
+# Общий индекс процесса
+index = PrefixIndex(ttl=getattr(settings, 'CATALOG_AUTOCOMPLETE_TTL', 300))
@@ -0,0 +1,219 @@
+"""Очередь фоновых выгрузок PDF в базе (модель ExportJob)
+
+Действия админки не строят PDF в запросе, а ставят задачу (enqueue) и
+ведут на страницу статуса. Команда run_export_worker забирает задачи из
+очереди, строит файл функциями pdf_utils и сохраняет его в MEDIA_ROOT
+(exports/), откуда его отдает страница статуса.
+
+- Захват задачи (claim) - один условный UPDATE: задача переходит в
+  running, только если она еще в очереди и выполняющихся меньше
+  CONCURRENCY, а у ее пользователя - меньше USER_CONCURRENCY, поэтому
+  несколько воркеров не превышают лимиты.
+- Ошибка - повтор через RETRY_DELAY * 2^(попытка-1) секунд, после
+  MAX_ATTEMPTS попыток задача помечается failed.
+- Воркер периодически отмечается в heartbeat_at; задачи упавшего воркера
+  (нет отклика STALE_AFTER секунд) возвращаются в очередь. Результат
+  записывается, только если задача все еще за этим воркером.
+- Готовые файлы хранятся TTL секунд, затем cleanup() удаляет их вместе с
+  задачами; завершившиеся ошибкой задачи удаляются через тот же срок.
+"""
+import json
+import os
+import socket
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from . import pdf_utils
+from .models import Artist, ExportJob, Release, Track
+
+CONCURRENCY = getattr(settings, 'CATALOG_EXPORT_CONCURRENCY', 2)
+USER_CONCURRENCY = getattr(settings, 'CATALOG_EXPORT_USER_CONCURRENCY', 1)
+MAX_ATTEMPTS = getattr(settings, 'CATALOG_EXPORT_MAX_ATTEMPTS', 3)
+RETRY_DELAY = getattr(settings, 'CATALOG_EXPORT_RETRY_DELAY', 30)
+STALE_AFTER = getattr(settings, 'CATALOG_EXPORT_STALE_AFTER', 600)
+TTL = getattr(settings, 'CATALOG_EXPORT_TTL', 24 * 3600)
+
+# Не чаще, чем раз в столько секунд, записывать ход выгрузки в базу
+HEARTBEAT_INTERVAL = 2
+
+
+def _ids(object_ids):
+    """Условие pk IN (id из JSON): без отдельного параметра на каждый id"""
+    return RawSQL('SELECT value FROM json_each(%s)', [json.dumps(object_ids)])
+
+
+def _artists(job, progress):
+    artists = Artist.objects.filter(pk__in=_ids(job.object_ids))
+    return 'artists_report.pdf', pdf_utils.generate_artists_pdf(artists, progress)
+
+
+def _tracks(job, progress):
+    tracks = Track.objects.filter(pk__in=_ids(job.object_ids))
+    return 'tracks_report.pdf', pdf_utils.generate_tracks_pdf(tracks, progress)
+
+
+def _release(job, progress):
+    release = Release.objects.get(pk=job.object_ids[0])
+    return f'release_{release.pk}.pdf', pdf_utils.generate_release_pdf(release)
+
+
+# Вид выгрузки -> функция (задача, progress) -> (имя файла, буфер)
+EXPORTERS = {
+    'artists': _artists,
+    'tracks': _tracks,
+    'release': _release,
+}
+
+
+def enqueue(kind, object_ids, user=None):
+    """Ставит выгрузку в очередь. Возвращает задачу"""
+    if kind not in EXPORTERS:
+        raise ValueError(f'Неизвестная выгрузка {kind!r}')
+    object_ids = [int(pk) for pk in object_ids]
+    return ExportJob.objects.create(
+        kind=kind, object_ids=object_ids, total=len(object_ids),
+        created_by=user if user is not None and user.is_authenticated else None,
+    )
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+# Выбор и выполнение задач
+
+def _running():
+    return ExportJob.objects.filter(status='running').order_by()
+
+
+def claim(worker):
+    """Забирает следующую задачу из очереди или возвращает None"""
+    now = timezone.now()
+    busy_users = (
+        _running().exclude(created_by=None).values('created_by')
+        .annotate(n=Count('pk')).filter(n__gte=USER_CONCURRENCY).values('created_by')
+    )
+    candidates = list(
+        ExportJob.objects.filter(status='queued', run_after__lte=now)
+        .exclude(created_by__in=busy_users)
+        .order_by('run_after', 'pk').values_list('pk', flat=True)[:10]
+    )
+    # Число выполняющихся задач (всех и того же пользователя); без них подзапрос дает NULL
+    running = Subquery(_running().values('status').annotate(n=Count('pk')).values('n'))
+    user_running = Subquery(
+        _running().filter(created_by=OuterRef('created_by'))
+        .values('created_by').annotate(n=Count('pk')).values('n')
+    )
+    for pk in candidates:
+        # Проверка очереди и обоих лимитов - в том же UPDATE, что и смена статуса
+        claimed = (
+            ExportJob.objects.filter(pk=pk, status='queued')
+            .alias(running=running, user_running=user_running)
+            .filter(Q(running__lt=CONCURRENCY) | Q(running=None))
+            .filter(Q(created_by=None) | Q(user_running__lt=USER_CONCURRENCY) | Q(user_running=None))
+            .update(status='running', locked_by=worker, heartbeat_at=now,
+                    started_at=now, attempts=F('attempts') + 1)
+        )
+        if claimed:
+            return ExportJob.objects.get(pk=pk)
+    return None
+
+
+def _owned(job, worker):
+    """Задача, пока ее выполняет worker (после recover_stale ее мог забрать другой)"""
+    return ExportJob.objects.filter(pk=job.pk, status='running', locked_by=worker)
+
+
+def run(job):
+    """Выполняет захваченную задачу: файл в MEDIA_ROOT или повтор/ошибка"""
+    worker = job.locked_by
+    last_beat = timezone.now()
+
+    def progress(processed):
+        nonlocal last_beat
+        now = timezone.now()
+        if (now - last_beat).total_seconds() >= HEARTBEAT_INTERVAL:
+            _owned(job, worker).update(processed=processed, heartbeat_at=now)
+            last_beat = now
+
+    try:
+        name, buffer = EXPORTERS[job.kind](job, progress)
+        job.file.save(name, File(buffer), save=False)
+    except Exception as error:
+        _fail(job, error)
+        return job
+    now = timezone.now()
+    job.status = 'done'
+    job.processed = job.total
+    job.error = ''
+    job.finished_at = now
+    job.expires_at = now + timedelta(seconds=TTL)
+    if not _save_owned(job, worker, ['status', 'processed', 'error', 'file', 'finished_at', 'expires_at']):
+        # Задачу вернули в очередь как зависшую: результат не наш, файл лишний
+        job.file.delete(save=False)
+        job.refresh_from_db()
+    return job
+
+
+def _save_owned(job, worker, fields):
+    """Сохраняет поля задачи, только если она все еще у worker. Возвращает, удалось ли"""
+    values = {field: getattr(job, field) for field in fields}
+    if 'file' in values:
+        values['file'] = job.file.name
+    return bool(_owned(job, worker).update(**values))
+
+
+def _fail(job, error):
+    """Повтор с нарастающей задержкой или окончательная ошибка"""
+    worker = job.locked_by
+    now = timezone.now()
+    job.error = f'{type(error).__name__}: {error}'
+    job.locked_by = ''
+    if job.attempts < MAX_ATTEMPTS:
+        job.status = 'queued'
+        job.run_after = now + timedelta(seconds=RETRY_DELAY * 2 ** (job.attempts - 1))
+    else:
+        job.status = 'failed'
+        job.finished_at = now
+        job.expires_at = now + timedelta(seconds=TTL)
+    if not _save_owned(job, worker, ['status', 'error', 'locked_by', 'run_after', 'finished_at', 'expires_at']):
+        job.refresh_from_db()
+        return False
+    return True
+
+
+def run_next(worker):
+    """Забирает и выполняет одну задачу. Возвращает ее или None, если очередь пуста"""
+    job = claim(worker)
+    return run(job) if job is not None else None
+
+
+# Обслуживание
+
+def recover_stale():
+    """Возвращает в очередь задачи воркеров без отклика STALE_AFTER секунд. Возвращает их число"""
+    deadline = timezone.now() - timedelta(seconds=STALE_AFTER)
+    stale = _running().filter(heartbeat_at__lt=deadline)
+    recovered = 0
+    for job in stale:
+        # Упавшая посреди выгрузки попытка тоже считается
+        if _fail(job, RuntimeError(f'воркер {job.locked_by} не отвечает')):
+            recovered += 1
+    return recovered
+
+
+def cleanup():
+    """Удаляет просроченные файлы и завершенные задачи. Возвращает число задач"""
+    expired = ExportJob.objects.filter(status__in=['done', 'failed'], expires_at__lt=timezone.now())
+    removed = 0
+    for job in expired.iterator():
+        if job.file:
+            job.file.delete(save=False)
+        job.delete()
+        removed += 1
+    return removed
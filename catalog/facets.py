@@ -0,0 +1,244 @@
+"""Фасетный просмотр треков: жанр, формат, год выпуска, статус, лейбл
+
+Счетчики фасетов берутся из свертки TrackFacetCount, а не из COUNT/GROUP BY
+по трекам. Ячейка свертки - (жанр, лейбл, формат, год, статус); строки с
+genre=NULL хранят итог по всем трекам, строки с конкретным жанром - по
+трекам этого жанра (трек с несколькими жанрами входит в несколько таких
+строк, но в итоговую - один раз).
+
+Свертка поддерживается по принципу "снимок до - снимок после": перед
+изменением считаем вклад затронутых треков, после - еще раз, и применяем
+разницу. Полная пересборка - команда rebuild_facets.
+"""
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+
+from .models import Genre, Label, Release, Track, TrackFacetCount
+
+# Поля ячейки свертки в порядке ключа
+KEY_FIELDS = ('genre_id', 'label_id', 'format', 'release_year', 'status')
+
+# Фасеты: имя параметра -> поле свертки
+FACETS = {
+    'genre': 'genre_id',
+    'format': 'format',
+    'year': 'release_year',
+    'status': 'status',
+    'label': 'label_id',
+}
+
+# Треков на странице результатов
+PAGE_SIZE = 50
+
+
+# Поддержка свертки
+
+def snapshot(tracks):
+    """Вклад треков из queryset в свертку: Counter {ключ ячейки: количество}"""
+    tracks = tracks.order_by()
+    release_fields = ('release__label_id', 'release__format', 'release__release_year', 'status')
+    counts = Counter()
+
+    for row in tracks.values(*release_fields).annotate(n=Count('pk')):
+        counts[(None, *(row[field] for field in release_fields))] += row['n']
+
+    genre_rows = (
+        tracks.filter(genres__isnull=False)
+        .values('genres', *release_fields)
+        .annotate(n=Count('pk'))
+    )
+    for row in genre_rows:
+        counts[(row['genres'], *(row[field] for field in release_fields))] += row['n']
+
+    return counts
+
+
+def apply_delta(before, after):
+    """Применяет к свертке разницу двух снимков"""
+    delta = Counter(after)
+    delta.subtract(before)
+
+    with transaction.atomic():
+        for key, n in delta.items():
+            if not n:
+                continue
+            lookup = dict(zip(KEY_FIELDS, key))
+            updated = TrackFacetCount.objects.filter(**lookup).update(count=F('count') + n)
+            if not updated and n > 0:
+                TrackFacetCount.objects.create(count=n, **lookup)
+
+
+@contextmanager
+def tracking(tracks):
+    """Обновляет свертку после массового изменения треков (queryset.update не шлет сигналов)
+
+        with facets.tracking(queryset):
+            queryset.update(status='published')
+
+    Треки фиксируются по pk до изменения, поэтому queryset может
+    фильтровать и по изменяемым полям.
+    """
+    tracks = Track.objects.filter(pk__in=list(tracks.values_list('pk', flat=True)))
+    before = snapshot(tracks)
+    yield
+    apply_delta(before, snapshot(tracks))
+
+
+def move_label_to_none(label):
+    """Перед удалением лейбла переносит его ячейки в "без лейбла" (Release.label - SET_NULL)"""
+    rows = TrackFacetCount.objects.filter(label=label).values(*KEY_FIELDS, 'count')
+    moved = Counter()
+    for row in rows:
+        moved[(row['genre_id'], None, *(row[field] for field in KEY_FIELDS[2:]))] += row['count']
+    apply_delta(Counter(), moved)
+
+
+def rebuild():
+    """Полная пересборка свертки. Возвращает число ячеек"""
+    counts = snapshot(Track.objects.all())
+    with transaction.atomic():
+        TrackFacetCount.objects.all().delete()
+        TrackFacetCount.objects.bulk_create(
+            (
+                TrackFacetCount(count=n, **dict(zip(KEY_FIELDS, key)))
+                for key, n in counts.items()
+            ),
+            batch_size=1000,
+        )
+    return len(counts)
+
+
+# Фильтры и выборка
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_filters(params):
+    """Фильтры из GET-параметров: genre, format, year_from, year_to, status, label.
+
+    format, status и label можно передавать несколько раз (логическое ИЛИ),
+    label=none - релизы без лейбла.
+    """
+    labels = []
+    for value in params.getlist('label'):
+        if value == 'none':
+            labels.append(None)
+        elif _int_or_none(value) is not None:
+            labels.append(int(value))
+
+    return {
+        'genre': _int_or_none(params.get('genre')),
+        'format': [value for value in params.getlist('format') if value],
+        'year_from': _int_or_none(params.get('year_from')),
+        'year_to': _int_or_none(params.get('year_to')),
+        'status': [value for value in params.getlist('status') if value],
+        'label': labels,
+    }
+
+
+def _filter_rollup(rows, filters, skip=None):
+    """Фильтрует свертку по всем фасетам, кроме skip"""
+    if skip != 'genre':
+        rows = rows.filter(genre_id=filters['genre']) if filters['genre'] else rows.filter(genre__isnull=True)
+    if skip != 'format' and filters['format']:
+        rows = rows.filter(format__in=filters['format'])
+    if skip != 'year':
+        if filters['year_from'] is not None:
+            rows = rows.filter(release_year__gte=filters['year_from'])
+        if filters['year_to'] is not None:
+            rows = rows.filter(release_year__lte=filters['year_to'])
+    if skip != 'status' and filters['status']:
+        rows = rows.filter(status__in=filters['status'])
+    if skip != 'label' and filters['label']:
+        rows = rows.filter(_label_q(filters['label'], 'label_id'))
+    return rows
+
+
+def _label_q(labels, field):
+    """Условие по лейблу; None в списке - релизы без лейбла"""
+    q = Q(**{f'{field}__in': [label for label in labels if label is not None]})
+    if None in labels:
+        q |= Q(**{f'{field}__isnull': True})
+    return q
+
+
+def facet_counts(filters):
+    """Счетчики по каждому фасету с учетом остальных фильтров (как в интернет-магазинах)"""
+    result = {}
+    for facet, field in FACETS.items():
+        rows = _filter_rollup(TrackFacetCount.objects.all(), filters, skip=facet)
+        if facet == 'genre':
+            rows = rows.filter(genre__isnull=False)
+        values = (
+            rows.values(field)
+            .annotate(n=Sum('count'))
+            .filter(n__gt=0)
+            .order_by(field)
+        )
+        result[facet] = [(row[field], row['n']) for row in values]
+    return result
+
+
+def total_count(filters):
+    """Количество треков, подходящих под все фильтры"""
+    rows = _filter_rollup(TrackFacetCount.objects.all(), filters)
+    return rows.aggregate(n=Sum('count'))['n'] or 0
+
+
+def filter_tracks(filters):
+    """Треки, подходящие под фильтры"""
+    tracks = Track.objects.select_related('release__artist', 'release__label')
+    if filters['genre']:
+        tracks = tracks.filter(genres__id=filters['genre'])
+    if filters['format']:
+        tracks = tracks.filter(release__format__in=filters['format'])
+    if filters['year_from'] is not None:
+        tracks = tracks.filter(release__release_year__gte=filters['year_from'])
+    if filters['year_to'] is not None:
+        tracks = tracks.filter(release__release_year__lte=filters['year_to'])
+    if filters['status']:
+        tracks = tracks.filter(status__in=filters['status'])
+    if filters['label']:
+        tracks = tracks.filter(_label_q(filters['label'], 'release__label_id'))
+    return tracks.order_by('-pk')
+
+
+def browse(filters, page=1):
+    """Страница результатов и счетчики фасетов с подписями"""
+    page = max(page, 1)
+    offset = (page - 1) * PAGE_SIZE
+    tracks = list(filter_tracks(filters)[offset:offset + PAGE_SIZE])
+    counts = facet_counts(filters)
+    total = total_count(filters)
+
+    genre_names = Genre.objects.in_bulk([value for value, _ in counts['genre']])
+    label_names = Label.objects.in_bulk([value for value, _ in counts['label'] if value is not None])
+    formats = dict(Release.FORMAT_CHOICES)
+    statuses = dict(Track.STATUS_CHOICES)
+
+    def titled(facet, title):
+        return [
+            {'value': value, 'title': title(value), 'count': n}
+            for value, n in counts[facet]
+        ]
+
+    return {
+        'tracks': tracks,
+        'total': total,
+        'page': page,
+        'pages': max((total + PAGE_SIZE - 1) // PAGE_SIZE, 1),
+        'facets': {
+            'genre': titled('genre', lambda v: genre_names[v].name if v in genre_names else str(v)),
+            'format': titled('format', lambda v: formats.get(v, v)),
+            'year': titled('year', str),
+            'status': titled('status', lambda v: statuses.get(v, v)),
+            'label': titled('label', lambda v: label_names[v].name if v in label_names else 'Без лейбла'),
+        },
+    }
@@ -0,0 +1,197 @@
+"""Нечеткий поиск с опечатками на триграммном индексе
+
+Названия исполнителей, релизов и треков нормализуются (регистр, диакритика,
+пунктуация) и раскладываются на триграммы при индексации. При поиске из
+индекса выбираются только термины, у которых есть общие триграммы с
+запросом (постинг-списки по индексу kind+trigram), затем кандидаты
+ранжируются по сходству Жаккара, как similarity() в pg_trgm.
+"""
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Artist, Release, SearchTerm, SearchTrigram, Track
+from .search_index import in_rank_order
+
+# Минимальное сходство, с которым термин считается совпадением
+SIMILARITY_THRESHOLD = 0.3
+
+# Сколько кандидатов с наибольшим числом общих триграмм проверять
+MAX_CANDIDATES = 200
+
+# Размер пачки при пересборке индекса
+REBUILD_BATCH_SIZE = 2000
+
+# Откуда берется индексируемый текст для каждого типа объектов
+SOURCES = {
+    'artist': (Artist, 'name'),
+    'release': (Release, 'title'),
+    'track': (Track, 'title'),
+}
+
+
+def normalize(text):
+    """Нижний регистр, без диакритики и пунктуации: 'Beyoncé!' -> 'beyonce'"""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    chars = []
+    for char in decomposed:
+        if unicodedata.combining(char):
+            continue
+        chars.append(char if char.isalnum() else ' ')
+    return ' '.join(''.join(chars).casefold().split())
+
+
+def trigrams(normalized):
+    """Множество триграмм строки (каждое слово дополняется пробелами, как в pg_trgm)"""
+    grams = set()
+    for word in normalized.split():
+        padded = f'  {word} '
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+def similarity(shared, query_count, term_count):
+    """Сходство Жаккара по числу общих и собственных триграмм"""
+    union = query_count + term_count - shared
+    return shared / union if union else 0.0
+
+
+# Индексация
+
+def index_object(kind, object_id, text):
+    """Добавляет или обновляет термин объекта в индексе"""
+    normalized = normalize(text)[:300]
+    term = SearchTerm.objects.filter(kind=kind, object_id=object_id).first()
+    if term is not None and term.normalized == normalized:
+        return
+
+    with transaction.atomic():
+        if term is not None:
+            term.delete()
+        grams = trigrams(normalized)
+        term = SearchTerm.objects.create(
+            kind=kind,
+            object_id=object_id,
+            normalized=normalized,
+            trigram_count=len(grams),
+        )
+        SearchTrigram.objects.bulk_create(
+            SearchTrigram(term=term, kind=kind, trigram=gram) for gram in grams
+        )
+
+
+def unindex_object(kind, object_id):
+    """Удаляет термин объекта из индекса"""
+    SearchTerm.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def rebuild():
+    """Полная пересборка триграммного индекса. Возвращает число терминов по типам"""
+    counts = {}
+    with transaction.atomic():
+        SearchTrigram.objects.all().delete()
+        SearchTerm.objects.all().delete()
+
+        for kind, (model, field) in SOURCES.items():
+            rows = model.objects.order_by().values_list('pk', field)
+            batch = []
+            counts[kind] = 0
+            for object_id, text in rows.iterator(chunk_size=REBUILD_BATCH_SIZE):
+                batch.append((object_id, normalize(text)[:300]))
+                if len(batch) >= REBUILD_BATCH_SIZE:
+                    counts[kind] += _bulk_index(kind, batch)
+                    batch = []
+            if batch:
+                counts[kind] += _bulk_index(kind, batch)
+    return counts
+
+
+def _bulk_index(kind, batch):
+    terms = []
+    grams_by_term = []
+    for object_id, normalized in batch:
+        grams = trigrams(normalized)
+        terms.append(SearchTerm(
+            kind=kind,
+            object_id=object_id,
+            normalized=normalized,
+            trigram_count=len(grams),
+        ))
+        grams_by_term.append(grams)
+
+    SearchTerm.objects.bulk_create(terms)
+    SearchTrigram.objects.bulk_create(
+        (
+            SearchTrigram(term=term, kind=kind, trigram=gram)
+            for term, grams in zip(terms, grams_by_term)
+            for gram in grams
+        ),
+        batch_size=REBUILD_BATCH_SIZE,
+    )
+    return len(terms)
+
+
+# Поиск
+
+def fuzzy_ids(kind, query, threshold=SIMILARITY_THRESHOLD, limit=20):
+    """pk объектов, похожих на запрос, по убыванию сходства"""
+    grams = trigrams(normalize(query))
+    if not grams:
+        return []
+
+    # Сходство не может быть выше shared / len(grams), поэтому термины
+    # с меньшим числом общих триграмм отбрасываются еще в SQL
+    min_shared = max(1, int(threshold * len(grams)))
+    candidates = (
+        SearchTrigram.objects
+        .filter(kind=kind, trigram__in=grams)
+        .values('term_id')
+        .annotate(shared=Count('id'))
+        .filter(shared__gte=min_shared)
+        .order_by('-shared')[:MAX_CANDIDATES]
+    )
+    shared_by_term = {row['term_id']: row['shared'] for row in candidates}
+    if not shared_by_term:
+        return []
+
+    scored = []
+    terms = SearchTerm.objects.filter(pk__in=shared_by_term).values_list(
+        'pk', 'object_id', 'trigram_count'
+    )
+    for term_id, object_id, term_count in terms:
+        score = similarity(shared_by_term[term_id], len(grams), term_count)
+        if score >= threshold:
+            scored.append((score, object_id))
+
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    return [object_id for score, object_id in scored[:limit]]
+
+
+def search_artists(query, limit=20):
+    """Исполнители с похожим именем"""
+    ids = fuzzy_ids('artist', query, limit=limit)
+    return in_rank_order(Artist.objects.all(), ids)
+
+
+def search_releases(query, limit=20):
+    """Релизы с похожим названием"""
+    ids = fuzzy_ids('release', query, limit=limit)
+    return in_rank_order(Release.objects.select_related('artist'), ids)
+
+
+def search_tracks(query, limit=20, include_artists=False):
+    """Треки с похожим названием (и, по желанию, треки похожих исполнителей)"""
+    ids = fuzzy_ids('track', query, limit=limit)
+    if include_artists and len(ids) < limit:
+        artist_ids = fuzzy_ids('artist', query, limit=5)
+        artist_tracks = (
+            Track.objects
+            .filter(release__artist_id__in=artist_ids)
+            .exclude(pk__in=ids)
+            .order_by('-play_count')
+            .values_list('pk', flat=True)[:limit - len(ids)]
+        )
+        ids.extend(artist_tracks)
+    return in_rank_order(Track.objects.select_related('release__artist'), ids)
@@ -0,0 +1,265 @@
+"""Живой топ треков и исполнителей за последние 5 и 60 минут
+
+Для каждого окна и вида объекта держится скользящий Count-Min sketch:
+кольцо слотов (окно 5 минут - 10 слотов по 30 секунд, 60 минут - 12 по 5
+минут), у каждого слота своя матрица счетчиков, плюс общая сумма по
+окну. Когда слот выходит из окна, его матрица вычитается из суммы и
+обнуляется. Рядом - ограниченная min-куча из TOP_SIZE самых частых
+объектов по оценке sketch'а.
+
+Прием прослушиваний кормит счетчики пачкой (сигнал scrobbles_ingested):
+обновление векторное, на прослушивание приходятся микросекунды.
+Прослушивания учитываются по scrobbled_at: старше окна - отбрасываются,
+из будущего - попадают в текущий слот.
+
+Состояние живет в памяти процесса. Если задан CATALOG_LIVE_PERSIST_INTERVAL
+(секунд), оно периодически сохраняется в LiveCounterState и
+восстанавливается после перезапуска.
+"""
+import heapq
+import io
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from .models import LiveCounterState, Track
+
+# Окна: имя -> (длительность, длительность слота), секунд
+WINDOWS = {
+    '5m': (300, 30),
+    '60m': (3600, 300),
+}
+KINDS = ('track', 'artist')
+
+# Размер кучи - сколько объектов помнит топ окна
+TOP_SIZE = 100
+
+# Count-Min: ошибка оценки ~ e/WIDTH от числа событий в окне с вероятностью 1 - e^-DEPTH
+DEPTH = 4
+WIDTH = 2048
+
+# Хеш строки: splitmix64(x ^ seed) по модулю WIDTH (WIDTH - степень двойки)
+SEEDS = np.random.default_rng(20240601).integers(0, 1 << 63, size=DEPTH, dtype=np.uint64)
+ROWS = np.arange(DEPTH)
+
+STATE_NAME = 'heavy_hitters'
+
+
+def _columns(items):
+    """Столбцы sketch'а для объектов: массив DEPTH x len(items)"""
+    x = np.asarray(items, dtype=np.int64).astype(np.uint64) ^ SEEDS[:, None]
+    with np.errstate(over='ignore'):
+        x = x + np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    x ^= x >> np.uint64(31)
+    return (x & np.uint64(WIDTH - 1)).astype(np.intp)
+
+
+class SlidingCountMin:
+    """Count-Min sketch по скользящему окну из кольца слотов + топ в min-куче"""
+
+    def __init__(self, duration, slot_seconds, top_size=TOP_SIZE):
+        self.slot_seconds = slot_seconds
+        self.slot_count = duration // slot_seconds
+        self.top_size = top_size
+        self.slots = np.zeros((self.slot_count, DEPTH, WIDTH), dtype=np.int32)
+        self.total = np.zeros((DEPTH, WIDTH), dtype=np.int32)
+        self.current = 0  # номер последнего слота (время // slot_seconds)
+        self.counts = {}  # объект в топе -> оценка
+        self._heap = []   # (оценка, объект), с устаревшими записями
+
+    # Слоты
+
+    def _advance(self, now):
+        """Сдвигает окно к моменту now; вышедшие слоты вычитаются из суммы"""
+        slot = int(now // self.slot_seconds)
+        if slot <= self.current:
+            return
+        if slot - self.current >= self.slot_count:
+            self.slots[:] = 0
+            self.total[:] = 0
+        else:
+            for number in range(self.current + 1, slot + 1):
+                position = number % self.slot_count
+                self.total -= self.slots[position]
+                self.slots[position] = 0
+        self.current = slot
+        self._refresh_top()
+
+    def add(self, items, timestamps, now=None):
+        """Учитывает события: объекты и их время (секунды эпохи)"""
+        self._advance(time.time() if now is None else now)
+        items = np.asarray(items, dtype=np.int64)
+        slots = np.minimum(np.asarray(timestamps, dtype=np.float64) // self.slot_seconds, self.current)
+        fresh = slots > self.current - self.slot_count
+        items, slots = items[fresh], slots[fresh].astype(np.int64)
+        if not len(items):
+            return
+
+        columns = _columns(items)
+        positions = slots % self.slot_count
+        np.add.at(self.slots, (positions[None, :], ROWS[:, None], columns), 1)
+        np.add.at(self.total, (ROWS[:, None], columns), 1)
+
+        unique = np.unique(items)
+        for item, count in zip(unique.tolist(), self._estimates(unique).tolist()):
+            self._offer(item, count)
+
+    def _estimates(self, items):
+        return self.total[ROWS[:, None], _columns(items)].min(axis=0)
+
+    def estimate(self, item):
+        return int(self._estimates([item])[0])
+
+    # Куча
+
+    def _offer(self, item, count):
+        if item in self.counts:
+            self.counts[item] = count
+        elif len(self.counts) < self.top_size:
+            self.counts[item] = count
+        else:
+            smallest, smallest_item = self._peek_min()
+            if count <= smallest:
+                return
+            heapq.heappop(self._heap)
+            del self.counts[smallest_item]
+            self.counts[item] = count
+        heapq.heappush(self._heap, (count, item))
+        if len(self._heap) > 4 * self.top_size:
+            self._rebuild_heap()
+
+    def _peek_min(self):
+        """Наименьшая актуальная запись кучи (устаревшие выбрасываются)"""
+        heap = self._heap
+        while heap and self.counts.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0]
+
+    def _rebuild_heap(self):
+        self._heap = [(count, item) for item, count in self.counts.items()]
+        heapq.heapify(self._heap)
+
+    def _refresh_top(self):
+        """Переоценивает топ после выхода слотов из окна"""
+        if not self.counts:
+            return
+        items = list(self.counts)
+        estimates = self._estimates(items).tolist()
+        self.counts = {item: count for item, count in zip(items, estimates) if count > 0}
+        self._rebuild_heap()
+
+    def top(self, limit, now=None):
+        """[(объект, оценка), ...] по убыванию"""
+        self._advance(time.time() if now is None else now)
+        return sorted(self.counts.items(), key=lambda pair: (-pair[1], pair[0]))[:limit]
+
+    # Сохранение
+
+    def state(self):
+        items = np.array(list(self.counts), dtype=np.int64)
+        return {
+            'slots': self.slots, 'total': self.total, 'current': np.int64(self.current),
+            'top_items': items, 'top_counts': self._estimates(items) if len(items) else items,
+        }
+
+    def load(self, state):
+        if state['slots'].shape != self.slots.shape:
+            return  # поменялись размеры окна - начинаем с нуля
+        self.slots = state['slots'].copy()
+        self.total = state['total'].copy()
+        self.current = int(state['current'])
+        self.counts = dict(zip(state['top_items'].tolist(), state['top_counts'].tolist()))
+        self._rebuild_heap()
+
+
+class LiveTop:
+    """Скользящие топы по всем окнам и видам объектов"""
+
+    def __init__(self):
+        self.windows = {
+            (window, kind): SlidingCountMin(duration, slot_seconds)
+            for window, (duration, slot_seconds) in WINDOWS.items()
+            for kind in KINDS
+        }
+        self._track_artist = {}
+        self._lock = threading.Lock()
+        self._restored = False
+        self._persisted_at = time.monotonic()
+
+    def _artists(self, track_ids):
+        """id исполнителей треков (кэш процесса, промахи - одним запросом)"""
+        missing = {track_id for track_id in track_ids if track_id not in self._track_artist}
+        if missing:
+            self._track_artist.update(
+                Track.objects.filter(pk__in=missing).values_list('pk', 'release__artist_id')
+            )
+        return [self._track_artist.get(track_id) for track_id in track_ids]
+
+    def record(self, scrobbles):
+        """Учитывает пачку прослушиваний во всех окнах"""
+        self._restore()
+        track_ids = [scrobble.track_id for scrobble in scrobbles]
+        artist_ids = self._artists(track_ids)
+        stamps = [scrobble.scrobbled_at.timestamp() for scrobble in scrobbles]
+        known = [i for i, artist_id in enumerate(artist_ids) if artist_id is not None]
+        now = time.time()
+        with self._lock:
+            for (window, kind), sketch in self.windows.items():
+                if kind == 'track':
+                    sketch.add(track_ids, stamps, now)
+                else:
+                    sketch.add([artist_ids[i] for i in known], [stamps[i] for i in known], now)
+        self._maybe_persist()
+
+    def snapshot(self, window, kind, limit=TOP_SIZE):
+        """[(id, оценка), ...] для окна ('5m', '60m') и вида ('track', 'artist')"""
+        self._restore()
+        with self._lock:
+            return self.windows[(window, kind)].top(limit)
+
+    # Сохранение в базу
+
+    def persist(self):
+        buffer = io.BytesIO()
+        with self._lock:
+            arrays = {
+                f'{window}:{kind}:{name}': value
+                for (window, kind), sketch in self.windows.items()
+                for name, value in sketch.state().items()
+            }
+            np.savez_compressed(buffer, **arrays)
+        LiveCounterState.objects.update_or_create(
+            name=STATE_NAME, defaults={'state': buffer.getvalue()}
+        )
+        self._persisted_at = time.monotonic()
+
+    def _maybe_persist(self):
+        interval = getattr(settings, 'CATALOG_LIVE_PERSIST_INTERVAL', 0)
+        if interval and time.monotonic() - self._persisted_at >= interval:
+            self.persist()
+
+    def _restore(self):
+        """Один раз при первом обращении подхватывает сохраненное состояние"""
+        if self._restored:
+            return
+        self._restored = True
+        if not getattr(settings, 'CATALOG_LIVE_PERSIST_INTERVAL', 0):
+            return
+        saved = LiveCounterState.objects.filter(name=STATE_NAME).values_list('state', flat=True).first()
+        if saved is None:
+            return
+        arrays = np.load(io.BytesIO(bytes(saved)))
+        with self._lock:
+            for (window, kind), sketch in self.windows.items():
+                prefix = f'{window}:{kind}:'
+                names = ('slots', 'total', 'current', 'top_items', 'top_counts')
+                if all(prefix + name in arrays for name in names):
+                    sketch.load({name: arrays[prefix + name] for name in names})
+
+
+# Общий трекер процесса
+tracker = LiveTop()
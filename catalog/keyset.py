@@ -0,0 +1,122 @@
+"""Keyset-пагинация (seek) для списков
+
+Вместо OFFSET следующая страница начинается "после" последней строки
+предыдущей: WHERE (поля сортировки, pk) > (значения последней строки).
+Стоимость страницы не растет с ее номером, если под сортировку есть
+индекс, а вставки между запросами не сдвигают страницы.
+
+Курсор - подписанная (django.core.signing) строка со значениями полей
+сортировки крайней строки и направлением, снаружи непрозрачная.
+Подделанный или устаревший курсор дает первую страницу.
+
+Поля сортировки должны быть NOT NULL. К ним всегда добавляется pk, так
+что порядок однозначен.
+"""
+from datetime import date, datetime
+
+from django.core import signing
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, Q
+from django.utils.dateparse import parse_date, parse_datetime
+
+PAGE_SIZE = 50
+
+SALT = 'catalog.keyset'
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return parse_datetime(value['dt'])
+        return parse_date(value['d'])
+    return value
+
+
+def encode_cursor(values, backwards=False):
+    return signing.dumps({'v': [_encode_value(v) for v in values], 'b': backwards}, salt=SALT)
+
+
+def decode_cursor(cursor, key_count):
+    """(значения, назад ли) или None для пустого/негодного курсора"""
+    if not cursor:
+        return None
+    try:
+        payload = signing.loads(cursor, salt=SALT)
+        values = [_decode_value(v) for v in payload['v']]
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        return None
+    if len(values) != key_count:
+        return None  # курсор от другой сортировки
+    return values, bool(payload.get('b'))
+
+
+def _column(model, name):
+    """Внешний ключ - по его столбцу: order_by('release') сортирует по Meta.ordering релиза"""
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return name
+    return field.attname if field.many_to_one else name
+
+
+def _keys(queryset, ordering):
+    """[(поле, по убыванию)] с pk в конце"""
+    ordering = list(ordering or queryset.query.order_by or queryset.model._meta.ordering)
+    keys = [(_column(queryset.model, name.lstrip('-')), name.startswith('-')) for name in ordering]
+    if not any(field in ('pk', 'id') for field, _ in keys):
+        keys.append(('pk', keys[0][1] if keys else False))
+    return keys
+
+
+def _after(keys, values, backwards):
+    """Условие "строго после values" в порядке keys (при backwards - "строго до")"""
+    condition = None
+    for (field, descending), value in reversed(list(zip(keys, values))):
+        lookup = 'lt' if descending != backwards else 'gt'
+        step = Q(**{f'{field}__{lookup}': value})
+        condition = step if condition is None else step | (Q(**{field: value}) & condition)
+    return condition
+
+
+def paginate(queryset, cursor=None, ordering=None, page_size=PAGE_SIZE):
+    """Страница queryset'а: {'items', 'next', 'previous'} (next/previous - курсоры или None)
+
+    ordering - список полей как в order_by(); по умолчанию - сортировка
+    queryset'а или модели.
+    """
+    keys = _keys(queryset, ordering)
+    annotations = {f'keyset_{i}': F(field) for i, (field, _) in enumerate(keys)}
+    queryset = queryset.annotate(**annotations)
+
+    decoded = decode_cursor(cursor, len(keys))
+    values, backwards = decoded if decoded else (None, False)
+    if values is not None:
+        queryset = queryset.filter(_after(keys, values, backwards))
+
+    queryset = queryset.order_by(*(
+        ('-' if descending != backwards else '') + field for field, descending in keys
+    ))
+    rows = list(queryset[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+
+    def key_of(row):
+        return [getattr(row, name) for name in annotations]
+
+    has_next = has_more if not backwards else True
+    has_previous = values is not None and (has_more if backwards else True)
+    return {
+        'items': rows,
+        'next': encode_cursor(key_of(rows[-1])) if rows and has_next else None,
+        'previous': encode_cursor(key_of(rows[0]), backwards=True) if rows and has_previous else None,
+    }
@@ -0,0 +1,22 @@
+# catalog/management/commands/archive_scrobbles.py
+from django.core.management.base import BaseCommand
+
+from catalog import scrobble_archive
+
+
+class Command(BaseCommand):
+    help = 'Move scrobbles from closed months into the columnar NumPy archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hot-months', type=int, default=None,
+                            help='Recent months to keep in the database (default: CATALOG_SCROBBLE_HOT_MONTHS)')
+
+    def handle(self, *args, **options):
+        before = scrobble_archive.cutoff(options['hot_months'])
+        self.stdout.write(f"Archiving scrobbles older than {before:%Y-%m-%d} to {scrobble_archive.archive_dir()}")
+
+        def progress(month, moved):
+            self.stdout.write(f'✓ {month}: {moved} scrobbles archived')
+
+        total = scrobble_archive.archive(options['hot_months'], progress)
+        self.stdout.write(self.style.SUCCESS(f'Archived {total} scrobbles'))
@@ -0,0 +1,23 @@
+# catalog/management/commands/build_recommendations.py
+from django.core.management.base import BaseCommand
+
+from catalog import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Refresh "listeners also played" track neighbours (incremental by default, run periodically)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Recompute neighbours for every track instead of only tracks with new activity')
+
+    def handle(self, *args, **options):
+        def progress(done, total):
+            self.stdout.write(f'✓ Neighbours saved for {done} of {total} tracks')
+
+        if options['full']:
+            count = recommendations.build(progress)
+        else:
+            count = recommendations.refresh(progress)
+
+        self.stdout.write(self.style.SUCCESS(f'Recommendations updated for {count} tracks'))
@@ -0,0 +1,23 @@
+# catalog/management/commands/build_similar_artists.py
+from django.core.management.base import BaseCommand
+
+from catalog import similar_artists
+
+
+class Command(BaseCommand):
+    help = 'Recompute similar artists from genre and co-listen vectors (run periodically, e.g. nightly)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild-genres', action='store_true',
+                            help='Also rebuild the artist-genre bridge table from scratch')
+
+    def handle(self, *args, **options):
+        if options['rebuild_genres']:
+            rows = similar_artists.rebuild_genres()
+            self.stdout.write(f'✓ Artist-genre bridge rebuilt: {rows} rows')
+
+        def progress(done, total):
+            self.stdout.write(f'✓ Similar artists saved for {done} of {total} artists')
+
+        count = similar_artists.build(progress)
+        self.stdout.write(self.style.SUCCESS(f'Similar artists computed for {count} artists'))
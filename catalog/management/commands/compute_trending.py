@@ -0,0 +1,15 @@
+# catalog/management/commands/compute_trending.py
+from django.core.management.base import BaseCommand
+
+from catalog import trending, widget_cache
+from catalog.models import TrendingScore
+
+
+class Command(BaseCommand):
+    help = 'Recompute the trending top-K tables from recent scrobbles (run every minute or so)'
+
+    def handle(self, *args, **options):
+        count = trending.recompute()
+        # bulk_create не шлет сигналов - сбрасываем виджеты вручную
+        widget_cache.invalidate_for(TrendingScore)
+        self.stdout.write(self.style.SUCCESS(f'Trending recomputed: {count} entries'))
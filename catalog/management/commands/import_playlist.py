@@ -0,0 +1,67 @@
+# catalog/management/commands/import_playlist.py
+import xml.etree.ElementTree as ElementTree
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog import playlist_io
+from catalog.models import Playlist
+
+
+class Command(BaseCommand):
+    help = 'Import an M3U, XSPF or JSON playlist file, matching entries to catalog tracks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Playlist file')
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--playlist', type=int, help='Append to the playlist with this id')
+        target.add_argument('--user', help='Create a new playlist for this username or id')
+        parser.add_argument('--title', help='Title of the new playlist (default: file name)')
+        parser.add_argument('--format', choices=sorted(playlist_io.FORMATS),
+                            help='File format (default: guessed from the extension)')
+        parser.add_argument('--chunk-size', type=int, default=playlist_io.IMPORT_CHUNK_SIZE,
+                            help='Entries matched and inserted per batch')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if options['playlist']:
+            playlist = Playlist.objects.filter(pk=options['playlist']).first()
+            if playlist is None:
+                raise CommandError(f"Playlist #{options['playlist']} not found")
+        else:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None and options['user'].isdigit():
+                user = User.objects.filter(pk=int(options['user'])).first()
+            if user is None:
+                raise CommandError(f"User {options['user']!r} not found")
+            title = options['title'] or path.replace('\\', '/').rsplit('/', 1)[-1].rsplit('.', 1)[0]
+            playlist = Playlist.objects.create(user=user, title=title)
+
+        file_format = options['format'] or playlist_io.guess_format(path)
+        self.stdout.write(f'Importing {path} ({file_format}) into playlist #{playlist.pk} "{playlist.title}"...')
+
+        def progress(totals):
+            self.stdout.write(
+                f"✓ {totals['read']} read: {totals['added']} added, "
+                f"{totals['unmatched']} unmatched, {totals['skipped']} already in playlist"
+            )
+
+        # XSPF разбирается по байтам, остальные форматы - как текст
+        if file_format == 'xspf':
+            stream = open(path, 'rb')
+        else:
+            stream = open(path, encoding='utf-8-sig', newline='')
+        with stream:
+            try:
+                totals = playlist_io.import_entries(
+                    playlist, playlist_io.read_entries(stream, file_format), options['chunk_size'], progress
+                )
+            except (ValueError, ElementTree.ParseError) as error:
+                raise CommandError(f'Malformed file: {error}')
+
+        for example in totals['unmatched_examples']:
+            self.stdout.write(self.style.WARNING(f'Not in catalog: {example}'))
+        self.stdout.write(self.style.SUCCESS(
+            f"Added {totals['added']} tracks to playlist #{playlist.pk} "
+            f"({totals['unmatched']} unmatched, {totals['skipped']} duplicates skipped)"
+        ))
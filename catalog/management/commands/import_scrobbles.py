@@ -0,0 +1,52 @@
+# catalog/management/commands/import_scrobbles.py
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog import scrobble_import
+
+
+class Command(BaseCommand):
+    help = 'Import a listening history export (CSV, JSON array or NDJSON) for one user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Export file')
+        parser.add_argument('--user', required=True, help='Username or id of the listener')
+        parser.add_argument('--format', choices=['csv', 'tsv', 'json'],
+                            help='File format (default: guessed from the extension)')
+        parser.add_argument('--offset', type=int, default=0,
+                            help='Skip the first N rows (resume an interrupted import)')
+        parser.add_argument('--chunk-size', type=int, default=scrobble_import.DEFAULT_CHUNK_SIZE,
+                            help='Rows written per transaction')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['user']).first()
+        if user is None and options['user'].isdigit():
+            user = User.objects.filter(pk=int(options['user'])).first()
+        if user is None:
+            raise CommandError(f"User {options['user']!r} not found")
+
+        file_format = options['format'] or scrobble_import.guess_format(options['path'])
+        self.stdout.write(f"Importing {options['path']} ({file_format}) for {user.username}...")
+
+        def progress(position, totals):
+            self.stdout.write(
+                f"✓ Row {position}: {totals['imported']} imported, "
+                f"{totals['unmatched']} unmatched, {totals['invalid']} invalid "
+                f"(resume with --offset {position})"
+            )
+
+        with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+            rows = scrobble_import.read_rows(stream, file_format)
+            try:
+                totals = scrobble_import.import_rows(
+                    rows, user.pk, options['chunk_size'], options['offset'], progress
+                )
+            except ValueError as error:
+                raise CommandError(f'Malformed file: {error}')
+
+        for example in totals['unmatched_examples']:
+            self.stdout.write(self.style.WARNING(f'Not in catalog: {example}'))
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {totals['imported']} scrobbles "
+            f"({totals['unmatched']} unmatched, {totals['invalid']} invalid rows skipped)"
+        ))
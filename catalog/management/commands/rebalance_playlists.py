@@ -0,0 +1,19 @@
+# catalog/management/commands/rebalance_playlists.py
+from django.core.management.base import BaseCommand
+
+from catalog import playlist_order
+
+
+class Command(BaseCommand):
+    help = 'Renumber playlist position keys where inserts have used up the gaps (run periodically, e.g. nightly)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-gap', type=int, default=playlist_order.MIN_GAP,
+                            help='Rebalance playlists whose adjacent position keys are closer than this')
+
+    def handle(self, *args, **options):
+        def progress(playlist_id, rows):
+            self.stdout.write(f'✓ Playlist #{playlist_id}: {rows} entries renumbered')
+
+        count = playlist_order.rebalance_crowded(options['min_gap'], progress)
+        self.stdout.write(self.style.SUCCESS(f'Rebalanced {count} playlists'))
@@ -0,0 +1,15 @@
+# catalog/management/commands/rebuild_facets.py
+from django.core.management.base import BaseCommand
+
+from catalog import facets
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the facet counts rollup (TrackFacetCount) from the Track table'
+
+    def handle(self, *args, **options):
+        self.stdout.write("Rebuilding facet counts...")
+
+        cells = facets.rebuild()
+
+        self.stdout.write(self.style.SUCCESS(f'Facet counts rebuilt: {cells} cells'))
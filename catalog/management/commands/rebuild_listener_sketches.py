@@ -0,0 +1,17 @@
+# catalog/management/commands/rebuild_listener_sketches.py
+from django.core.management.base import BaseCommand
+
+from catalog import listener_sketches
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the HyperLogLog unique-listener sketches from scrobbles and the archive'
+
+    def handle(self, *args, **options):
+        self.stdout.write("Rebuilding listener sketches...")
+
+        def progress(period):
+            self.stdout.write(f'✓ {period}')
+
+        count = listener_sketches.rebuild(progress)
+        self.stdout.write(self.style.SUCCESS(f'Listener sketches rebuilt for {count} tracks and artists'))
@@ -0,0 +1,27 @@
+# catalog/management/commands/rebuild_search_index.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog import fuzzy_search, search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text (SQLite FTS5) and trigram search indexes for tracks, releases and artists'
+
+    def handle(self, *args, **options):
+        self.stdout.write("Rebuilding full-text search index...")
+
+        with transaction.atomic():
+            counts = search_index.rebuild()
+
+        for kind, count in counts.items():
+            self.stdout.write(f'✓ Indexed {count} {kind} documents')
+
+        self.stdout.write("Rebuilding trigram index...")
+
+        counts = fuzzy_search.rebuild()
+
+        for kind, count in counts.items():
+            self.stdout.write(f'✓ Indexed {count} {kind} terms')
+
+        self.stdout.write(self.style.SUCCESS('Search indexes rebuilt'))
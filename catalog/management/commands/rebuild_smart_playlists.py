@@ -0,0 +1,21 @@
+# catalog/management/commands/rebuild_smart_playlists.py
+from django.core.management.base import BaseCommand
+
+from catalog import smart_playlists
+from catalog.models import SmartPlaylist
+
+
+class Command(BaseCommand):
+    help = 'Rebuild smart playlist members from their rules (repairs drift after bulk updates that skip signals)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ids', nargs='*', type=int, help='Smart playlist ids (default: all)')
+
+    def handle(self, *args, **options):
+        playlists = SmartPlaylist.objects.order_by('pk')
+        if options['ids']:
+            playlists = playlists.filter(pk__in=options['ids'])
+        for playlist in playlists:
+            count = smart_playlists.rebuild(playlist)
+            self.stdout.write(f'✓ #{playlist.pk} "{playlist.title}": {count} matching tracks')
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {len(playlists)} smart playlists'))
@@ -0,0 +1,22 @@
+# catalog/management/commands/recompute_stats.py
+from django.core.management.base import BaseCommand
+
+from catalog import stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the CatalogStats row from scratch (repairs counter drift)'
+
+    def handle(self, *args, **options):
+        before = stats.get()
+        self.stdout.write(f"Current stats: {before}")
+
+        after = stats.recompute()
+
+        for field in ('artist_count', 'release_count', 'track_count', 'duration_sum',
+                      'draft_count', 'published_count', 'archived_count'):
+            old, new = getattr(before, field), getattr(after, field)
+            if old != new:
+                self.stdout.write(self.style.WARNING(f'Drift in {field}: {old} -> {new}'))
+
+        self.stdout.write(self.style.SUCCESS(f'Stats recomputed: {after}'))
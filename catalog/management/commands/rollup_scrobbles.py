@@ -0,0 +1,26 @@
+# catalog/management/commands/rollup_scrobbles.py
+from django.core.management.base import BaseCommand
+
+from catalog import scrobble_rollups
+
+
+class Command(BaseCommand):
+    help = 'Fold new scrobbles into the hourly/daily rollup tables (run periodically, e.g. from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Drop all rollups and fold every scrobble from scratch, '
+                                 'archived months included (read from the archive files)')
+        parser.add_argument('--chunk-size', type=int, default=scrobble_rollups.CHUNK_SIZE,
+                            help='Scrobble ids folded per transaction')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Scrobbles behind the rollups: {scrobble_rollups.lag()}")
+
+        def progress(done, last):
+            self.stdout.write(f'✓ Folded up to scrobble #{done} of #{last}')
+
+        fold = scrobble_rollups.rebuild if options['rebuild'] else scrobble_rollups.fold_new
+        chunks = fold(options['chunk_size'], progress)
+
+        self.stdout.write(self.style.SUCCESS(f'Rollups are up to date ({chunks} chunks folded)'))
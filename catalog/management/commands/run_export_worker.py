@@ -0,0 +1,55 @@
+# catalog/management/commands/run_export_worker.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from catalog import export_jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued PDF export jobs (retries failures, recovers stale jobs, removes expired files)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run queued jobs and exit when the queue is empty')
+        parser.add_argument('--poll', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--cleanup-every', type=float, default=300.0,
+                            help='Seconds between stale job recovery and expired file cleanup')
+        parser.add_argument('--cleanup', action='store_true', help='Only recover stale jobs and remove expired files')
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            self._maintain()
+            return
+
+        worker = export_jobs.worker_name()
+        self.stdout.write(f'Export worker {worker} started')
+        last_cleanup = None
+        try:
+            while True:
+                if last_cleanup is None or time.monotonic() - last_cleanup >= options['cleanup_every']:
+                    self._maintain()
+                    last_cleanup = time.monotonic()
+
+                job = export_jobs.run_next(worker)
+                if job is not None:
+                    self._report(job)
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['poll'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopped')
+
+    def _maintain(self):
+        recovered = export_jobs.recover_stale()
+        removed = export_jobs.cleanup()
+        if recovered or removed:
+            self.stdout.write(f'Recovered {recovered} stale jobs, removed {removed} expired jobs')
+
+    def _report(self, job):
+        if job.status == 'done':
+            self.stdout.write(self.style.SUCCESS(f'✓ #{job.pk} {job.kind}: {job.file.name}'))
+        elif job.status == 'queued':
+            self.stdout.write(self.style.WARNING(f'↻ #{job.pk} {job.kind}: {job.error}, retry at {job.run_after:%H:%M:%S}'))
+        else:
+            self.stdout.write(self.style.ERROR(f'✗ #{job.pk} {job.kind}: {job.error}'))
@@ -0,0 +1,27 @@
+# catalog/management/commands/verify_playlist_stats.py
+from django.core.management.base import BaseCommand
+
+from catalog import playlist_stats
+
+
+class Command(BaseCommand):
+    help = 'Compare stored playlist track counts and durations with the real entries (--fix repairs drift)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help='Write the exact totals for playlists that drifted')
+
+    def handle(self, *args, **options):
+        drifted = playlist_stats.mismatches()
+        for pk, (count, duration), (exact_count, exact_duration) in drifted:
+            self.stdout.write(self.style.WARNING(
+                f'Playlist #{pk}: tracks {count} -> {exact_count}, duration {duration}s -> {exact_duration}s'
+            ))
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('All playlist totals are exact'))
+        elif options['fix']:
+            fixed = playlist_stats.fix([pk for pk, _, _ in drifted])
+            self.stdout.write(self.style.SUCCESS(f'Fixed {fixed} playlists'))
+        else:
+            self.stdout.write(self.style.ERROR(f'{len(drifted)} playlists drifted, run with --fix to repair'))
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+# Токенизатор unicode61 приводит регистр и убирает диакритику,
+# prefix='2 3' ускоряет префиксные запросы ("beyon"*)
+FTS_OPTIONS = "tokenize='unicode61 remove_diacritics 2', prefix='2 3'"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0009_artist_featured_artist_popularity_score_and_more'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                f'CREATE VIRTUAL TABLE catalog_track_fts USING fts5('
+                f'title, release_title, artist_name, {FTS_OPTIONS})',
+                f'CREATE VIRTUAL TABLE catalog_release_fts USING fts5('
+                f'title, artist_name, {FTS_OPTIONS})',
+                f'CREATE VIRTUAL TABLE catalog_artist_fts USING fts5('
+                f'name, biography, {FTS_OPTIONS})',
+                'INSERT INTO catalog_track_fts(rowid, title, release_title, artist_name) '
+                'SELECT t.id, t.title, r.title, a.name FROM catalog_track t '
+                'JOIN catalog_release r ON r.id = t.release_id '
+                'JOIN catalog_artist a ON a.id = r.artist_id',
+                'INSERT INTO catalog_release_fts(rowid, title, artist_name) '
+                'SELECT r.id, r.title, a.name FROM catalog_release r '
+                'JOIN catalog_artist a ON a.id = r.artist_id',
+                'INSERT INTO catalog_artist_fts(rowid, name, biography) '
+                "SELECT a.id, a.name, COALESCE(a.biography, '') FROM catalog_artist a",
+            ],
+            reverse_sql=[
+                'DROP TABLE catalog_track_fts',
+                'DROP TABLE catalog_release_fts',
+                'DROP TABLE catalog_artist_fts',
+            ],
+        ),
+    ]
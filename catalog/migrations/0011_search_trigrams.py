@@ -0,0 +1,97 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:40
+
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Копии fuzzy_search.normalize и trigrams на момент миграции
+def normalize(text):
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    chars = []
+    for char in decomposed:
+        if unicodedata.combining(char):
+            continue
+        chars.append(char if char.isalnum() else ' ')
+    return ' '.join(''.join(chars).casefold().split())
+
+
+def trigrams(normalized):
+    grams = set()
+    for word in normalized.split():
+        padded = f'  {word} '
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+def fill_search_trigrams(apps, schema_editor):
+    SearchTerm = apps.get_model('catalog', 'SearchTerm')
+    SearchTrigram = apps.get_model('catalog', 'SearchTrigram')
+    sources = {
+        'artist': (apps.get_model('catalog', 'Artist'), 'name'),
+        'release': (apps.get_model('catalog', 'Release'), 'title'),
+        'track': (apps.get_model('catalog', 'Track'), 'title'),
+    }
+
+    for kind, (model, field) in sources.items():
+        rows = model.objects.order_by().values_list('pk', field)
+        terms = []
+        for object_id, text in rows.iterator(chunk_size=5000):
+            normalized = normalize(text)[:300]
+            terms.append((SearchTerm(
+                kind=kind, object_id=object_id, normalized=normalized, trigram_count=len(trigrams(normalized)),
+            )))
+            if len(terms) >= 5000:
+                _bulk_index(SearchTerm, SearchTrigram, kind, terms)
+                terms = []
+        _bulk_index(SearchTerm, SearchTrigram, kind, terms)
+
+
+def _bulk_index(SearchTerm, SearchTrigram, kind, terms):
+    SearchTerm.objects.bulk_create(terms)
+    SearchTrigram.objects.bulk_create(
+        (SearchTrigram(term=term, kind=kind, trigram=gram) for term in terms for gram in trigrams(term.normalized)),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0010_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('artist', 'Исполнитель'), ('release', 'Релиз'), ('track', 'Трек')], max_length=10, verbose_name='Тип объекта')),
+                ('object_id', models.BigIntegerField(verbose_name='ID объекта')),
+                ('normalized', models.CharField(max_length=300, verbose_name='Нормализованное название')),
+                ('trigram_count', models.PositiveSmallIntegerField(default=0, verbose_name='Количество триграмм')),
+            ],
+            options={
+                'verbose_name': 'Поисковый термин',
+                'verbose_name_plural': 'Поисковые термины',
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SearchTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=10, verbose_name='Тип объекта')),
+                ('trigram', models.CharField(max_length=3, verbose_name='Триграмма')),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigrams', to='catalog.searchterm', verbose_name='Термин')),
+            ],
+            options={
+                'verbose_name': 'Триграмма',
+                'verbose_name_plural': 'Триграммы',
+                'indexes': [models.Index(fields=['kind', 'trigram', 'term'], name='catalog_trigram_lookup_idx')],
+            },
+        ),
+        migrations.RunPython(fill_search_trigrams, migrations.RunPython.noop),
+    ]
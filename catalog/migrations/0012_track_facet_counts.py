@@ -0,0 +1,58 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_track_facet_counts(apps, schema_editor):
+    Track = apps.get_model('catalog', 'Track')
+    TrackFacetCount = apps.get_model('catalog', 'TrackFacetCount')
+
+    release_fields = ('release__label_id', 'release__format', 'release__release_year', 'status')
+    tracks = Track.objects.order_by()
+    # Итог по всем трекам (genre=NULL) и по каждому жанру трека
+    rows = [
+        (None, row) for row in tracks.values(*release_fields).annotate(n=Count('pk'))
+    ] + [
+        (row['genres'], row) for row in
+        tracks.filter(genres__isnull=False).values('genres', *release_fields).annotate(n=Count('pk'))
+    ]
+    TrackFacetCount.objects.bulk_create(
+        (
+            TrackFacetCount(
+                genre_id=genre_id, label_id=row['release__label_id'], format=row['release__format'],
+                release_year=row['release__release_year'], status=row['status'], count=row['n'],
+            )
+            for genre_id, row in rows
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0011_search_trigrams'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackFacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('format', models.CharField(choices=[('Digital', 'Цифровой'), ('CD', 'CD'), ('Vinyl', 'Винил'), ('Cassette', 'Кассета')], max_length=20, verbose_name='Формат')),
+                ('release_year', models.IntegerField(verbose_name='Год выпуска')),
+                ('status', models.CharField(choices=[('draft', 'Черновик'), ('published', 'Опубликован'), ('archived', 'В архиве')], max_length=20, verbose_name='Статус трека')),
+                ('count', models.IntegerField(default=0, verbose_name='Количество треков')),
+                ('genre', models.ForeignKey(blank=True, help_text='Пусто - итог по всем трекам независимо от жанра', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='facet_counts', to='catalog.genre', verbose_name='Жанр')),
+                ('label', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='facet_counts', to='catalog.label', verbose_name='Лейбл')),
+            ],
+            options={
+                'verbose_name': 'Счетчик фасета',
+                'verbose_name_plural': 'Счетчики фасетов',
+                'unique_together': {('genre', 'label', 'format', 'release_year', 'status')},
+            },
+        ),
+        migrations.RunPython(fill_track_facet_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:45
+
+from django.db import migrations, models
+from django.db.models import Count, F, Q, Sum
+
+
+def fill_catalog_stats(apps, schema_editor):
+    Artist = apps.get_model('catalog', 'Artist')
+    Release = apps.get_model('catalog', 'Release')
+    Track = apps.get_model('catalog', 'Track')
+    CatalogStats = apps.get_model('catalog', 'CatalogStats')
+
+    totals = Track.objects.aggregate(
+        track_count=Count('id'),
+        duration_sum=Sum('duration_seconds'),
+        duration_sum_squares=Sum(F('duration_seconds') * F('duration_seconds')),
+        draft_count=Count('id', filter=Q(status='draft')),
+        published_count=Count('id', filter=Q(status='published')),
+        archived_count=Count('id', filter=Q(status='archived')),
+    )
+    CatalogStats.objects.create(
+        pk=1,
+        artist_count=Artist.objects.count(),
+        release_count=Release.objects.count(),
+        **{field: value or 0 for field, value in totals.items()}
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0012_track_facet_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('artist_count', models.IntegerField(default=0, verbose_name='Исполнителей')),
+                ('release_count', models.IntegerField(default=0, verbose_name='Релизов')),
+                ('track_count', models.IntegerField(default=0, verbose_name='Треков')),
+                ('duration_sum', models.BigIntegerField(default=0, verbose_name='Суммарная длительность, с')),
+                ('duration_sum_squares', models.BigIntegerField(default=0, verbose_name='Сумма квадратов длительностей')),
+                ('draft_count', models.IntegerField(default=0, verbose_name='Черновиков')),
+                ('published_count', models.IntegerField(default=0, verbose_name='Опубликовано')),
+                ('archived_count', models.IntegerField(default=0, verbose_name='В архиве')),
+                ('recomputed_at', models.DateTimeField(blank=True, null=True, verbose_name='Последний пересчет')),
+            ],
+            options={
+                'verbose_name': 'Статистика каталога',
+                'verbose_name_plural': 'Статистика каталога',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(fields=['duration_seconds'], name='catalog_track_duration_idx'),
+        ),
+        migrations.RunPython(fill_catalog_stats, migrations.RunPython.noop),
+    ]
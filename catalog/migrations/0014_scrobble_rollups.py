@@ -0,0 +1,104 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0013_catalog_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Свертка')),
+                ('last_scrobble_id', models.BigIntegerField(default=0, verbose_name='Последний учтенный Scrobble.id')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Отметка свертки',
+                'verbose_name_plural': 'Отметки сверток',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArtistListensDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateField(verbose_name='День')),
+                ('count', models.IntegerField(default=0, verbose_name='Прослушиваний')),
+                ('artist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='listens_daily', to='catalog.artist', verbose_name='Исполнитель')),
+            ],
+            options={
+                'verbose_name': 'Прослушивания исполнителя за день',
+                'verbose_name_plural': 'Прослушивания исполнителей по дням',
+                'indexes': [models.Index(fields=['artist', 'bucket'], name='catalog_ald_artist_idx')],
+                'unique_together': {('bucket', 'artist')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ArtistListensHourly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(verbose_name='Час')),
+                ('count', models.IntegerField(default=0, verbose_name='Прослушиваний')),
+                ('artist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='listens_hourly', to='catalog.artist', verbose_name='Исполнитель')),
+            ],
+            options={
+                'verbose_name': 'Прослушивания исполнителя за час',
+                'verbose_name_plural': 'Прослушивания исполнителей по часам',
+                'indexes': [models.Index(fields=['artist', 'bucket'], name='catalog_alh_artist_idx')],
+                'unique_together': {('bucket', 'artist')},
+            },
+        ),
+        migrations.CreateModel(
+            name='TrackListensDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateField(verbose_name='День')),
+                ('count', models.IntegerField(default=0, verbose_name='Прослушиваний')),
+                ('track', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='listens_daily', to='catalog.track', verbose_name='Трек')),
+            ],
+            options={
+                'verbose_name': 'Прослушивания трека за день',
+                'verbose_name_plural': 'Прослушивания треков по дням',
+                'indexes': [models.Index(fields=['track', 'bucket'], name='catalog_tld_track_idx')],
+                'unique_together': {('bucket', 'track')},
+            },
+        ),
+        migrations.CreateModel(
+            name='TrackListensHourly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(verbose_name='Час')),
+                ('count', models.IntegerField(default=0, verbose_name='Прослушиваний')),
+                ('track', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='listens_hourly', to='catalog.track', verbose_name='Трек')),
+            ],
+            options={
+                'verbose_name': 'Прослушивания трека за час',
+                'verbose_name_plural': 'Прослушивания треков по часам',
+                'indexes': [models.Index(fields=['track', 'bucket'], name='catalog_tlh_track_idx')],
+                'unique_together': {('bucket', 'track')},
+            },
+        ),
+        migrations.CreateModel(
+            name='UserListensDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateField(verbose_name='День')),
+                ('count', models.IntegerField(default=0, verbose_name='Прослушиваний')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='listens_daily', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Прослушивания пользователя за день',
+                'verbose_name_plural': 'Прослушивания пользователей по дням',
+                'indexes': [models.Index(fields=['user', 'bucket'], name='catalog_uld_user_idx')],
+                'unique_together': {('bucket', 'user')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0014_scrobble_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListenerSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('track', 'Трек'), ('artist', 'Исполнитель')], max_length=10, verbose_name='Тип')),
+                ('object_id', models.IntegerField(verbose_name='ID объекта')),
+                ('period', models.CharField(max_length=7, verbose_name='Период')),
+                ('registers', models.BinaryField(verbose_name='Регистры (zlib)')),
+                ('estimate', models.IntegerField(default=0, verbose_name='Оценка уникальных слушателей')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Скетч слушателей',
+                'verbose_name_plural': 'Скетчи слушателей',
+                'unique_together': {('kind', 'object_id', 'period')},
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0015_listener_sketches'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('track', 'Трек'), ('artist', 'Исполнитель'), ('genre', 'Жанр')], max_length=10, verbose_name='Тип')),
+                ('object_id', models.IntegerField(verbose_name='ID объекта')),
+                ('rank', models.PositiveIntegerField(verbose_name='Место')),
+                ('score', models.FloatField(verbose_name='Счет')),
+                ('computed_at', models.DateTimeField(verbose_name='Рассчитан')),
+                ('genre', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='trending_scores', to='catalog.genre', verbose_name='Жанр')),
+            ],
+            options={
+                'verbose_name': 'Место в тренде',
+                'verbose_name_plural': 'Тренды',
+                'ordering': ['kind', 'genre', 'rank'],
+                'indexes': [models.Index(fields=['kind', 'genre', 'rank'], name='catalog_trending_rank_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0016_trending_scores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LiveCounterState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Счетчик')),
+                ('state', models.BinaryField(verbose_name='Состояние (npz)')),
+                ('saved_at', models.DateTimeField(auto_now=True, verbose_name='Сохранено')),
+            ],
+            options={
+                'verbose_name': 'Состояние живого счетчика',
+                'verbose_name_plural': 'Состояния живых счетчиков',
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0017_live_counter_state'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='artist',
+            index=models.Index(fields=['name'], name='catalog_artist_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='release',
+            index=models.Index(fields=['-release_year', 'title'], name='catalog_release_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scrobble',
+            index=models.Index(fields=['user', '-scrobbled_at', '-id'], name='catalog_scrobble_history_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(fields=['release', 'position'], name='catalog_track_order_idx'),
+        ),
+    ]
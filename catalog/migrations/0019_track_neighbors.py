@@ -0,0 +1,46 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0018_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommenderState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Задача')),
+                ('last_scrobble_id', models.BigIntegerField(default=0, verbose_name='Последний учтенный Scrobble.id')),
+                ('last_favorite_id', models.BigIntegerField(default=0, verbose_name='Последний учтенный Favorite.id')),
+                ('built_at', models.DateTimeField(blank=True, null=True, verbose_name='Полный пересчет')),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True, verbose_name='Последнее обновление')),
+            ],
+            options={
+                'verbose_name': 'Состояние рекомендаций',
+                'verbose_name_plural': 'Состояния рекомендаций',
+            },
+        ),
+        migrations.CreateModel(
+            name='TrackNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='Косинусная близость')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='Место')),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.track', verbose_name='Похожий трек')),
+                ('track', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='catalog.track', verbose_name='Трек')),
+            ],
+            options={
+                'verbose_name': 'Похожий трек',
+                'verbose_name_plural': 'Похожие треки',
+                'ordering': ['track', 'rank'],
+                'indexes': [models.Index(fields=['track', 'rank'], name='catalog_neighbor_rank_idx')],
+                'unique_together': {('track', 'neighbor')},
+            },
+        ),
+    ]
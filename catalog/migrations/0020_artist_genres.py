@@ -0,0 +1,63 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_artist_genres(apps, schema_editor):
+    Track = apps.get_model('catalog', 'Track')
+    ArtistGenre = apps.get_model('catalog', 'ArtistGenre')
+
+    rows = (
+        Track.genres.through.objects.order_by()
+        .values_list('track__release__artist_id', 'genre_id')
+        .annotate(n=Count('track_id'))
+    )
+    ArtistGenre.objects.bulk_create(
+        (ArtistGenre(artist_id=artist_id, genre_id=genre_id, track_count=n) for artist_id, genre_id, n in rows),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0019_track_neighbors'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArtistGenre',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('track_count', models.PositiveIntegerField(verbose_name='Треков в жанре')),
+                ('artist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='genre_links', to='catalog.artist', verbose_name='Исполнитель')),
+                ('genre', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='artist_links', to='catalog.genre', verbose_name='Жанр')),
+            ],
+            options={
+                'verbose_name': 'Жанр исполнителя',
+                'verbose_name_plural': 'Жанры исполнителей',
+                'indexes': [models.Index(fields=['genre', 'artist'], name='catalog_artistgenre_genre_idx')],
+                'unique_together': {('artist', 'genre')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SimilarArtist',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='Близость')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='Место')),
+                ('artist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_links', to='catalog.artist', verbose_name='Исполнитель')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.artist', verbose_name='Похожий исполнитель')),
+            ],
+            options={
+                'verbose_name': 'Похожий исполнитель',
+                'verbose_name_plural': 'Похожие исполнители',
+                'ordering': ['artist', 'rank'],
+                'indexes': [models.Index(fields=['artist', 'rank'], name='catalog_similar_artist_idx')],
+                'unique_together': {('artist', 'similar')},
+            },
+        ),
+        migrations.RunPython(fill_artist_genres, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+# Шаг ключа порядка, как playlist_order.GAP
+GAP = 1 << 20
+
+
+def copy_playlist_tracks(apps, schema_editor):
+    Playlist = apps.get_model('catalog', 'Playlist')
+    PlaylistEntry = apps.get_model('catalog', 'PlaylistEntry')
+
+    # Порядка у старой связи нет - берем порядок добавления (id строки)
+    rows = Playlist.tracks.through.objects.order_by('playlist_id', 'id').values_list('playlist_id', 'track_id')
+    batch, previous, position = [], None, 0
+    for playlist_id, track_id in rows.iterator(chunk_size=5000):
+        position = position + GAP if playlist_id == previous else GAP
+        previous = playlist_id
+        batch.append(PlaylistEntry(playlist_id=playlist_id, track_id=track_id, position=position))
+        if len(batch) >= 5000:
+            PlaylistEntry.objects.bulk_create(batch)
+            batch = []
+    PlaylistEntry.objects.bulk_create(batch)
+
+
+def copy_playlist_entries_back(apps, schema_editor):
+    Playlist = apps.get_model('catalog', 'Playlist')
+    PlaylistEntry = apps.get_model('catalog', 'PlaylistEntry')
+
+    Playlist.tracks.through.objects.bulk_create(
+        (
+            Playlist.tracks.through(playlist_id=playlist_id, track_id=track_id)
+            for playlist_id, track_id in PlaylistEntry.objects.order_by('playlist_id', 'position')
+            .values_list('playlist_id', 'track_id').iterator(chunk_size=5000)
+        ),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0020_artist_genres'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlaylistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.BigIntegerField(verbose_name='Ключ порядка')),
+                ('added_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Добавлен')),
+                ('playlist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='catalog.playlist', verbose_name='Плейлист')),
+                ('track', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='playlist_entries', to='catalog.track', verbose_name='Трек')),
+            ],
+            options={
+                'verbose_name': 'Трек в плейлисте',
+                'verbose_name_plural': 'Треки в плейлистах',
+                'ordering': ['playlist', 'position'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='playlistentry',
+            index=models.Index(fields=['playlist', 'position'], name='catalog_playlist_entry_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='playlistentry',
+            unique_together={('playlist', 'track')},
+        ),
+        # Сменить M2M на through-модель через AlterField нельзя: переносим
+        # строки catalog_playlist_tracks в новую таблицу и пересоздаем поле
+        migrations.RunPython(copy_playlist_tracks, copy_playlist_entries_back),
+        migrations.RemoveField(
+            model_name='playlist',
+            name='tracks',
+        ),
+        migrations.AddField(
+            model_name='playlist',
+            name='tracks',
+            field=models.ManyToManyField(blank=True, related_name='playlists', through='catalog.PlaylistEntry', through_fields=('playlist', 'track'), to='catalog.track', verbose_name='Треки'),
+        ),
+    ]
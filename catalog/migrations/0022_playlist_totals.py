@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:07
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_playlist_totals(apps, schema_editor):
+    Playlist = apps.get_model('catalog', 'Playlist')
+    PlaylistEntry = apps.get_model('catalog', 'PlaylistEntry')
+
+    entries = PlaylistEntry.objects.filter(playlist=OuterRef('pk')).order_by().values('playlist')
+    Playlist.objects.update(
+        track_count=Coalesce(Subquery(entries.annotate(n=Count('pk')).values('n')), Value(0)),
+        total_duration_seconds=Coalesce(
+            Subquery(entries.annotate(total=Sum('track__duration_seconds')).values('total')), Value(0)
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0021_playlist_entries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playlist',
+            name='total_duration_seconds',
+            field=models.PositiveIntegerField(default=0, verbose_name='Общая длительность, с'),
+        ),
+        migrations.AddField(
+            model_name='playlist',
+            name='track_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Треков'),
+        ),
+        migrations.RunPython(fill_playlist_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0022_playlist_totals'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SmartPlaylist',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200, verbose_name='Название')),
+                ('rules', models.JSONField(help_text='Например {"all": [["genre", "=", "Jazz"], ["duration", "<", 300]]}', verbose_name='Правила')),
+                ('order_by', models.CharField(choices=[('-play_count', 'Больше прослушиваний'), ('play_count', 'Меньше прослушиваний'), ('-added', 'Новые треки'), ('added', 'Старые треки'), ('-year', 'Новые релизы'), ('year', 'Старые релизы'), ('duration', 'Короткие'), ('-duration', 'Длинные')], default='-play_count', max_length=20, verbose_name='Сортировка')),
+                ('limit', models.PositiveIntegerField(blank=True, null=True, verbose_name='Не больше треков')),
+                ('is_public', models.BooleanField(default=False, verbose_name='Публичный')),
+                ('member_count', models.PositiveIntegerField(default=0, verbose_name='Подходящих треков')),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True, verbose_name='Полная пересборка')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='smart_playlists', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Смарт-плейлист',
+                'verbose_name_plural': 'Смарт-плейлисты',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SmartPlaylistMember',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sort_value', models.BigIntegerField(null=True, verbose_name='Ключ сортировки')),
+                ('smart_playlist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='members', to='catalog.smartplaylist', verbose_name='Смарт-плейлист')),
+                ('track', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='smart_playlist_members', to='catalog.track', verbose_name='Трек')),
+            ],
+            options={
+                'verbose_name': 'Трек смарт-плейлиста',
+                'verbose_name_plural': 'Треки смарт-плейлистов',
+                'indexes': [models.Index(fields=['smart_playlist', 'sort_value', 'track'], name='catalog_smart_member_idx')],
+                'unique_together': {('smart_playlist', 'track')},
+            },
+        ),
+    ]
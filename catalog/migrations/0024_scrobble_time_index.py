@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0023_smart_playlists'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='scrobble',
+            index=models.Index(fields=['scrobbled_at', 'id'], name='catalog_scrobble_time_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:44
+
+from django.db import migrations, models
+
+
+def fill_rule_fields(apps, schema_editor):
+    from catalog.smart_playlists import rule_fields_key
+
+    SmartPlaylist = apps.get_model('catalog', 'SmartPlaylist')
+    for playlist in SmartPlaylist.objects.only('rules'):
+        try:
+            playlist.rule_fields = rule_fields_key(playlist.rules)
+        except (AttributeError, IndexError, TypeError):
+            continue  # некорректные правила: пустое rule_fields - перепроверять всегда
+        playlist.save(update_fields=['rule_fields'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0025_export_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='smartplaylist',
+            name='rule_fields',
+            field=models.CharField(blank=True, editable=False, max_length=200, verbose_name='Поля правил'),
+        ),
+        migrations.RunPython(fill_rule_fields, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0026_smart_playlist_rule_fields'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='playlistentry',
+            name='position',
+            field=models.BigIntegerField(blank=True, verbose_name='Ключ порядка'),
+        ),
+    ]
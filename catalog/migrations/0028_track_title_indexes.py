@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:51
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0027_playlist_entry_position_blank'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(fields=['title'], name='catalog_track_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(django.db.models.functions.text.Lower('title'), name='catalog_track_title_lower_idx'),
+        ),
+    ]
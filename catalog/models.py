@@ -1,4 +1,7 @@
+from collections import defaultdict
+
 from django.db import models
+from django.db.models.functions import Lower
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.utils import timezone
@@ -84,6 +87,10 @@ class Artist(models.Model):
         verbose_name = "Исполнитель"
         verbose_name_plural = "Исполнители"
         ordering = ['name']
+        indexes = [
+            # Keyset-пагинация списков в порядке сортировки по умолчанию
+            models.Index(fields=['name'], name='catalog_artist_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -220,6 +227,9 @@ class Release(models.Model):
         verbose_name = "Релиз"
         verbose_name_plural = "Релизы"
         ordering = ['-release_year', 'title']
+        indexes = [
+            models.Index(fields=['-release_year', 'title'], name='catalog_release_order_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title} - {self.artist.name}"
@@ -319,6 +329,15 @@ class Track(models.Model):
         verbose_name = "Трек"
         verbose_name_plural = "Треки"
         ordering = ['release', 'position']
+        indexes = [
+            # Самый длинный/короткий трек без сканирования таблицы
+            models.Index(fields=['duration_seconds'], name='catalog_track_duration_idx'),
+            # Keyset-пагинация в порядке сортировки по умолчанию
+            models.Index(fields=['release', 'position'], name='catalog_track_order_idx'),
+            # Поиск треков по названию при импорте прослушиваний
+            models.Index(fields=['title'], name='catalog_track_title_idx'),
+            models.Index(Lower('title'), name='catalog_track_title_lower_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title} - {self.release.artist.name}"
@@ -378,8 +397,8 @@ class Playlist(models.Model):
     )
     tracks = models.ManyToManyField(
         Track,
-        #through='TrackFeature',
-        #through_fields=('playlist', 'track'),
+        through='PlaylistEntry',
+        through_fields=('playlist', 'track'),
         blank=True,
         related_name='playlists',
         verbose_name="Треки"
@@ -389,6 +408,10 @@ class Playlist(models.Model):
         verbose_name="Публичный"
     )
     
+    # Денормализованные итоги по трекам (см. catalog/playlist_stats.py)
+    track_count = models.PositiveIntegerField(default=0, verbose_name="Треков")
+    total_duration_seconds = models.PositiveIntegerField(default=0, verbose_name="Общая длительность, с")
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -400,13 +423,9 @@ class Playlist(models.Model):
     def __str__(self):
         return f"{self.title} ({self.user.username})"
     
-    @admin.display(description="Треков")
-    def track_count(self):
-        return self.tracks.count()
-
-    @admin.display(description="Общая длительность")
+    @admin.display(description="Общая длительность", ordering='total_duration_seconds')
     def total_duration(self):
-        total_seconds = sum(track.duration_seconds for track in self.tracks.all())
+        total_seconds = self.total_duration_seconds
         minutes = total_seconds // 60
         seconds = total_seconds % 60
         return f"{minutes}м {seconds}с"
@@ -433,6 +452,12 @@ class Scrobble(models.Model):
         verbose_name = "Прослушивание"
         verbose_name_plural = "Прослушивания"
         ordering = ['-scrobbled_at']
+        indexes = [
+            # История пользователя, новые сверху
+            models.Index(fields=['user', '-scrobbled_at', '-id'], name='catalog_scrobble_history_idx'),
+            # Сортировка списка админки и переходы по датам (date_hierarchy)
+            models.Index(fields=['scrobbled_at', 'id'], name='catalog_scrobble_time_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.track.title}"
@@ -477,6 +502,127 @@ class Scrobble(models.Model):
 #    def __str__(self):
 #        return f"{self.track.title} в {self.playlist.title} (позиция {self.position})"
 
+class PlaylistEntryQuerySet(models.QuerySet):
+    """Строкам без position дает ключи в конце плейлиста
+
+    playlist.tracks.add() и track.playlists.add() создают строки через
+    bulk_create без position.
+    """
+
+    def next_positions(self, playlist_id, count):
+        """count ключей после последнего трека плейлиста"""
+        from .playlist_order import GAP
+        last = self.model.objects.filter(playlist_id=playlist_id).aggregate(last=models.Max('position'))['last'] or 0
+        return [last + GAP * number for number in range(1, count + 1)]
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        unplaced = defaultdict(list)
+        for entry in objs:
+            if entry.position is None:
+                unplaced[entry.playlist_id].append(entry)
+        for playlist_id, entries in unplaced.items():
+            for entry, position in zip(entries, self.next_positions(playlist_id, len(entries))):
+                entry.position = position
+        return super().bulk_create(objs, *args, **kwargs)
+
+
+# Трек в плейлисте с порядком (см. catalog/playlist_order.py)
+class PlaylistEntry(models.Model):
+    """Позиция - разреженный ключ: вставка и перемещение меняют одну строку"""
+    playlist = models.ForeignKey(Playlist, on_delete=models.CASCADE, related_name='entries', verbose_name="Плейлист")
+    track = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='playlist_entries', verbose_name="Трек")
+    # Пустой - в конец плейлиста (save() и PlaylistEntryQuerySet.bulk_create)
+    position = models.BigIntegerField(blank=True, verbose_name="Ключ порядка")
+    added_at = models.DateTimeField(default=timezone.now, verbose_name="Добавлен")
+
+    class Meta:
+        verbose_name = "Трек в плейлисте"
+        verbose_name_plural = "Треки в плейлистах"
+        ordering = ['playlist', 'position']
+        unique_together = ['playlist', 'track']  # Один трек может быть только один раз в плейлисте
+        indexes = [models.Index(fields=['playlist', 'position'], name='catalog_playlist_entry_idx')]
+
+    objects = PlaylistEntryQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.track_id} в {self.playlist_id} (ключ {self.position})"
+
+    def save(self, *args, **kwargs):
+        if self.position is None:  # без явного места - в конец плейлиста
+            self.position = PlaylistEntry.objects.next_positions(self.playlist_id, 1)[0]
+        super().save(*args, **kwargs)
+
+
+# Смарт-плейлист: состав по правилам (см. catalog/smart_playlists.py)
+class SmartPlaylist(models.Model):
+    ORDER_CHOICES = [
+        ('-play_count', 'Больше прослушиваний'),
+        ('play_count', 'Меньше прослушиваний'),
+        ('-added', 'Новые треки'),
+        ('added', 'Старые треки'),
+        ('-year', 'Новые релизы'),
+        ('year', 'Старые релизы'),
+        ('duration', 'Короткие'),
+        ('-duration', 'Длинные'),
+    ]
+
+    title = models.CharField(max_length=200, verbose_name="Название")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='smart_playlists', verbose_name="Пользователь")
+    rules = models.JSONField(
+        verbose_name="Правила",
+        help_text='Например {"all": [["genre", "=", "Jazz"], ["duration", "<", 300]]}'
+    )
+    order_by = models.CharField(max_length=20, choices=ORDER_CHOICES, default='-play_count', verbose_name="Сортировка")
+    limit = models.PositiveIntegerField(null=True, blank=True, verbose_name="Не больше треков")
+    is_public = models.BooleanField(default=False, verbose_name="Публичный")
+    # Поля, упомянутые в правилах ('|genre|status|'): по ним retest() выбирает плейлисты в базе
+    rule_fields = models.CharField(max_length=200, blank=True, editable=False, verbose_name="Поля правил")
+
+    # Сколько треков подходит под правила (без лимита), ведется инкрементально
+    member_count = models.PositiveIntegerField(default=0, verbose_name="Подходящих треков")
+    refreshed_at = models.DateTimeField(null=True, blank=True, verbose_name="Полная пересборка")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Смарт-плейлист"
+        verbose_name_plural = "Смарт-плейлисты"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.title} ({self.user.username})"
+
+    def clean(self):
+        from .smart_playlists import InvalidRule, validate
+        try:
+            validate(self)
+        except InvalidRule as error:
+            raise ValidationError({'rules': str(error)})
+
+    @property
+    def track_count(self):
+        return min(self.member_count, self.limit) if self.limit else self.member_count
+
+
+class SmartPlaylistMember(models.Model):
+    """Трек, подходящий под правила, с ключом сортировки; лимит применяется при чтении"""
+    smart_playlist = models.ForeignKey(SmartPlaylist, on_delete=models.CASCADE, related_name='members',
+                                       verbose_name="Смарт-плейлист")
+    track = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='smart_playlist_members', verbose_name="Трек")
+    sort_value = models.BigIntegerField(null=True, verbose_name="Ключ сортировки")
+
+    class Meta:
+        verbose_name = "Трек смарт-плейлиста"
+        verbose_name_plural = "Треки смарт-плейлистов"
+        unique_together = ['smart_playlist', 'track']
+        indexes = [
+            models.Index(fields=['smart_playlist', 'sort_value', 'track'], name='catalog_smart_member_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.track_id} в {self.smart_playlist_id} ({self.sort_value})"
+
 # ДОБАВЛЯЕМ НОВУЮ МОДЕЛЬ ДЛЯ ДОКУМЕНТОВ
 class Document(models.Model):
     """Модель для хранения документов связанных с музыкой"""
@@ -559,4 +705,382 @@ class Favorite(models.Model):
         unique_together = ['user', 'track']
     
     def __str__(self):
-        return f"{self.user.username} - {self.track.title}"
\ No newline at end of file
+        return f"{self.user.username} - {self.track.title}"
+
+# Триграммный индекс для нечеткого поиска (см. catalog/fuzzy_search.py)
+class SearchTerm(models.Model):
+    """Нормализованное название объекта каталога"""
+    KIND_CHOICES = [
+        ('artist', 'Исполнитель'),
+        ('release', 'Релиз'),
+        ('track', 'Трек'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name="Тип объекта")
+    object_id = models.BigIntegerField(verbose_name="ID объекта")
+    normalized = models.CharField(max_length=300, verbose_name="Нормализованное название")
+    trigram_count = models.PositiveSmallIntegerField(default=0, verbose_name="Количество триграмм")
+
+    class Meta:
+        verbose_name = "Поисковый термин"
+        verbose_name_plural = "Поисковые термины"
+        unique_together = ['kind', 'object_id']
+
+    def __str__(self):
+        return f"{self.kind}:{self.object_id} {self.normalized}"
+
+
+class SearchTrigram(models.Model):
+    """Триграмма термина (постинг-список триграммного индекса)"""
+    term = models.ForeignKey(
+        SearchTerm,
+        on_delete=models.CASCADE,
+        related_name='trigrams',
+        verbose_name="Термин"
+    )
+    # Тип дублируется из термина, чтобы выборка шла по одному индексу
+    kind = models.CharField(max_length=10, verbose_name="Тип объекта")
+    trigram = models.CharField(max_length=3, verbose_name="Триграмма")
+
+    class Meta:
+        verbose_name = "Триграмма"
+        verbose_name_plural = "Триграммы"
+        indexes = [
+            models.Index(fields=['kind', 'trigram', 'term'], name='catalog_trigram_lookup_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.trigram!r} -> {self.term_id}"
+
+
+# Предрассчитанные счетчики для фасетного просмотра (см. catalog/facets.py)
+class TrackFacetCount(models.Model):
+    """Количество треков в ячейке genre x label x format x release_year x status"""
+    genre = models.ForeignKey(
+        Genre,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='facet_counts',
+        verbose_name="Жанр",
+        help_text="Пусто - итог по всем трекам независимо от жанра"
+    )
+    label = models.ForeignKey(
+        Label,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='facet_counts',
+        verbose_name="Лейбл"
+    )
+    format = models.CharField(max_length=20, choices=Release.FORMAT_CHOICES, verbose_name="Формат")
+    release_year = models.IntegerField(verbose_name="Год выпуска")
+    status = models.CharField(max_length=20, choices=Track.STATUS_CHOICES, verbose_name="Статус трека")
+    count = models.IntegerField(default=0, verbose_name="Количество треков")
+
+    class Meta:
+        verbose_name = "Счетчик фасета"
+        verbose_name_plural = "Счетчики фасетов"
+        unique_together = ['genre', 'label', 'format', 'release_year', 'status']
+
+    def __str__(self):
+        return f"{self.genre_id}/{self.label_id}/{self.format}/{self.release_year}/{self.status}: {self.count}"
+
+
+# Статистика каталога (одна строка, обновляется сигналами - см. catalog/stats.py)
+class CatalogStats(models.Model):
+    artist_count = models.IntegerField(default=0, verbose_name="Исполнителей")
+    release_count = models.IntegerField(default=0, verbose_name="Релизов")
+    track_count = models.IntegerField(default=0, verbose_name="Треков")
+    duration_sum = models.BigIntegerField(default=0, verbose_name="Суммарная длительность, с")
+    duration_sum_squares = models.BigIntegerField(default=0, verbose_name="Сумма квадратов длительностей")
+    draft_count = models.IntegerField(default=0, verbose_name="Черновиков")
+    published_count = models.IntegerField(default=0, verbose_name="Опубликовано")
+    archived_count = models.IntegerField(default=0, verbose_name="В архиве")
+    recomputed_at = models.DateTimeField(blank=True, null=True, verbose_name="Последний пересчет")
+
+    class Meta:
+        verbose_name = "Статистика каталога"
+        verbose_name_plural = "Статистика каталога"
+
+    def __str__(self):
+        return f"{self.artist_count} исполнителей, {self.release_count} релизов, {self.track_count} треков"
+
+    @property
+    def avg_duration(self):
+        """Средняя длительность трека, с"""
+        if not self.track_count:
+            return None
+        return self.duration_sum / self.track_count
+
+    @property
+    def duration_stddev(self):
+        """Стандартное отклонение длительности, с"""
+        if not self.track_count:
+            return None
+        mean = self.duration_sum / self.track_count
+        variance = self.duration_sum_squares / self.track_count - mean * mean
+        return max(variance, 0) ** 0.5
+
+
+# Свертки прослушиваний по времени (см. catalog/scrobble_rollups.py)
+class TrackListensHourly(models.Model):
+    bucket = models.DateTimeField(verbose_name="Час")
+    track = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='listens_hourly', verbose_name="Трек")
+    count = models.IntegerField(default=0, verbose_name="Прослушиваний")
+
+    class Meta:
+        verbose_name = "Прослушивания трека за час"
+        verbose_name_plural = "Прослушивания треков по часам"
+        unique_together = ['bucket', 'track']
+        indexes = [models.Index(fields=['track', 'bucket'], name='catalog_tlh_track_idx')]
+
+
+class TrackListensDaily(models.Model):
+    bucket = models.DateField(verbose_name="День")
+    track = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='listens_daily', verbose_name="Трек")
+    count = models.IntegerField(default=0, verbose_name="Прослушиваний")
+
+    class Meta:
+        verbose_name = "Прослушивания трека за день"
+        verbose_name_plural = "Прослушивания треков по дням"
+        unique_together = ['bucket', 'track']
+        indexes = [models.Index(fields=['track', 'bucket'], name='catalog_tld_track_idx')]
+
+
+class ArtistListensHourly(models.Model):
+    bucket = models.DateTimeField(verbose_name="Час")
+    artist = models.ForeignKey(Artist, on_delete=models.CASCADE, related_name='listens_hourly', verbose_name="Исполнитель")
+    count = models.IntegerField(default=0, verbose_name="Прослушиваний")
+
+    class Meta:
+        verbose_name = "Прослушивания исполнителя за час"
+        verbose_name_plural = "Прослушивания исполнителей по часам"
+        unique_together = ['bucket', 'artist']
+        indexes = [models.Index(fields=['artist', 'bucket'], name='catalog_alh_artist_idx')]
+
+
+class ArtistListensDaily(models.Model):
+    bucket = models.DateField(verbose_name="День")
+    artist = models.ForeignKey(Artist, on_delete=models.CASCADE, related_name='listens_daily', verbose_name="Исполнитель")
+    count = models.IntegerField(default=0, verbose_name="Прослушиваний")
+
+    class Meta:
+        verbose_name = "Прослушивания исполнителя за день"
+        verbose_name_plural = "Прослушивания исполнителей по дням"
+        unique_together = ['bucket', 'artist']
+        indexes = [models.Index(fields=['artist', 'bucket'], name='catalog_ald_artist_idx')]
+
+
+class UserListensDaily(models.Model):
+    bucket = models.DateField(verbose_name="День")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='listens_daily', verbose_name="Пользователь")
+    count = models.IntegerField(default=0, verbose_name="Прослушиваний")
+
+    class Meta:
+        verbose_name = "Прослушивания пользователя за день"
+        verbose_name_plural = "Прослушивания пользователей по дням"
+        unique_together = ['bucket', 'user']
+        indexes = [models.Index(fields=['user', 'bucket'], name='catalog_uld_user_idx')]
+
+
+class RollupWatermark(models.Model):
+    """До какого Scrobble.id прослушивания уже учтены в свертке"""
+    name = models.CharField(max_length=50, unique=True, verbose_name="Свертка")
+    last_scrobble_id = models.BigIntegerField(default=0, verbose_name="Последний учтенный Scrobble.id")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Отметка свертки"
+        verbose_name_plural = "Отметки сверток"
+
+    def __str__(self):
+        return f"{self.name}: {self.last_scrobble_id}"
+
+
+class ListenerSketch(models.Model):
+    """HyperLogLog уникальных слушателей трека/исполнителя (см. catalog/listener_sketches.py)"""
+    KIND_CHOICES = [
+        ('track', 'Трек'),
+        ('artist', 'Исполнитель'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name="Тип")
+    object_id = models.IntegerField(verbose_name="ID объекта")
+    # 'all' - за все время, 'YYYY-MM' - за месяц
+    period = models.CharField(max_length=7, verbose_name="Период")
+    registers = models.BinaryField(verbose_name="Регистры (zlib)")
+    estimate = models.IntegerField(default=0, verbose_name="Оценка уникальных слушателей")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Скетч слушателей"
+        verbose_name_plural = "Скетчи слушателей"
+        unique_together = ['kind', 'object_id', 'period']
+
+    def __str__(self):
+        return f"{self.kind} #{self.object_id} ({self.period}): ~{self.estimate}"
+
+
+class TrendingScore(models.Model):
+    """Материализованный топ по затухающему счету прослушиваний (см. catalog/trending.py)"""
+    KIND_CHOICES = [
+        ('track', 'Трек'),
+        ('artist', 'Исполнитель'),
+        ('genre', 'Жанр'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name="Тип")
+    # Для треков: топ внутри жанра (NULL - общий топ)
+    genre = models.ForeignKey(Genre, on_delete=models.CASCADE, null=True, blank=True,
+                              related_name='trending_scores', verbose_name="Жанр")
+    object_id = models.IntegerField(verbose_name="ID объекта")
+    rank = models.PositiveIntegerField(verbose_name="Место")
+    score = models.FloatField(verbose_name="Счет")
+    computed_at = models.DateTimeField(verbose_name="Рассчитан")
+
+    class Meta:
+        verbose_name = "Место в тренде"
+        verbose_name_plural = "Тренды"
+        ordering = ['kind', 'genre', 'rank']
+        indexes = [models.Index(fields=['kind', 'genre', 'rank'], name='catalog_trending_rank_idx')]
+
+    def __str__(self):
+        return f"{self.kind} #{self.object_id}: {self.rank} ({self.score:.2f})"
+
+
+class LiveCounterState(models.Model):
+    """Сохраненное состояние живых счетчиков (см. catalog/heavy_hitters.py)"""
+    name = models.CharField(max_length=50, unique=True, verbose_name="Счетчик")
+    state = models.BinaryField(verbose_name="Состояние (npz)")
+    saved_at = models.DateTimeField(auto_now=True, verbose_name="Сохранено")
+
+    class Meta:
+        verbose_name = "Состояние живого счетчика"
+        verbose_name_plural = "Состояния живых счетчиков"
+
+    def __str__(self):
+        return f"{self.name} ({self.saved_at:%d.%m.%Y %H:%M:%S})"
+
+
+# Рекомендации "с этим треком также слушают" (см. catalog/recommendations.py)
+class TrackNeighbor(models.Model):
+    track = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='neighbors', verbose_name="Трек")
+    neighbor = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='+', verbose_name="Похожий трек")
+    score = models.FloatField(verbose_name="Косинусная близость")
+    rank = models.PositiveSmallIntegerField(verbose_name="Место")
+
+    class Meta:
+        verbose_name = "Похожий трек"
+        verbose_name_plural = "Похожие треки"
+        ordering = ['track', 'rank']
+        unique_together = ['track', 'neighbor']
+        indexes = [models.Index(fields=['track', 'rank'], name='catalog_neighbor_rank_idx')]
+
+    def __str__(self):
+        return f"{self.track_id} -> {self.neighbor_id} ({self.score:.3f})"
+
+
+class RecommenderState(models.Model):
+    """До каких Scrobble.id и Favorite.id учтены соседи треков"""
+    name = models.CharField(max_length=50, unique=True, verbose_name="Задача")
+    last_scrobble_id = models.BigIntegerField(default=0, verbose_name="Последний учтенный Scrobble.id")
+    last_favorite_id = models.BigIntegerField(default=0, verbose_name="Последний учтенный Favorite.id")
+    built_at = models.DateTimeField(null=True, blank=True, verbose_name="Полный пересчет")
+    refreshed_at = models.DateTimeField(null=True, blank=True, verbose_name="Последнее обновление")
+
+    class Meta:
+        verbose_name = "Состояние рекомендаций"
+        verbose_name_plural = "Состояния рекомендаций"
+
+    def __str__(self):
+        return self.name
+
+
+# Мост исполнитель-жанр и похожие исполнители (см. catalog/similar_artists.py)
+class ArtistGenre(models.Model):
+    """Сколько треков исполнителя в жанре; заменяет join через релизы и треки"""
+    artist = models.ForeignKey(Artist, on_delete=models.CASCADE, related_name='genre_links', verbose_name="Исполнитель")
+    genre = models.ForeignKey(Genre, on_delete=models.CASCADE, related_name='artist_links', verbose_name="Жанр")
+    track_count = models.PositiveIntegerField(verbose_name="Треков в жанре")
+
+    class Meta:
+        verbose_name = "Жанр исполнителя"
+        verbose_name_plural = "Жанры исполнителей"
+        unique_together = ['artist', 'genre']
+        indexes = [models.Index(fields=['genre', 'artist'], name='catalog_artistgenre_genre_idx')]
+
+    def __str__(self):
+        return f"{self.artist_id} / {self.genre_id}: {self.track_count}"
+
+
+class SimilarArtist(models.Model):
+    artist = models.ForeignKey(Artist, on_delete=models.CASCADE, related_name='similar_links', verbose_name="Исполнитель")
+    similar = models.ForeignKey(Artist, on_delete=models.CASCADE, related_name='+', verbose_name="Похожий исполнитель")
+    score = models.FloatField(verbose_name="Близость")
+    rank = models.PositiveSmallIntegerField(verbose_name="Место")
+
+    class Meta:
+        verbose_name = "Похожий исполнитель"
+        verbose_name_plural = "Похожие исполнители"
+        ordering = ['artist', 'rank']
+        unique_together = ['artist', 'similar']
+        indexes = [models.Index(fields=['artist', 'rank'], name='catalog_similar_artist_idx')]
+
+    def __str__(self):
+        return f"{self.artist_id} -> {self.similar_id} ({self.score:.3f})"
+
+
+# Фоновые задачи выгрузки PDF (см. catalog/export_jobs.py)
+class ExportJob(models.Model):
+    KIND_CHOICES = [
+        ('artists', 'Исполнители'),
+        ('tracks', 'Треки'),
+        ('release', 'Релиз'),
+    ]
+    STATUS_CHOICES = [
+        ('queued', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Готово'),
+        ('failed', 'Ошибка'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name="Выгрузка")
+    object_ids = models.JSONField(verbose_name="id объектов")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued', verbose_name="Статус")
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name='export_jobs', verbose_name="Пользователь")
+
+    processed = models.PositiveIntegerField(default=0, verbose_name="Обработано строк")
+    total = models.PositiveIntegerField(default=0, verbose_name="Всего строк")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток")
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+
+    run_after = models.DateTimeField(default=timezone.now, verbose_name="Не раньше")
+    locked_by = models.CharField(max_length=100, blank=True, verbose_name="Воркер")
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name="Последний отклик воркера")
+
+    file = models.FileField(upload_to='exports/', blank=True, verbose_name="Файл")
+    expires_at = models.DateTimeField(null=True, blank=True, verbose_name="Файл хранится до")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Начата")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Завершена")
+
+    class Meta:
+        verbose_name = "Выгрузка PDF"
+        verbose_name_plural = "Выгрузки PDF"
+        ordering = ['-created_at']
+        indexes = [
+            # Выбор следующей задачи воркером
+            models.Index(fields=['status', 'run_after'], name='catalog_exportjob_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} ({self.get_status_display()})"
+
+    @property
+    def percent(self):
+        if self.status == 'done':
+            return 100
+        return self.processed * 100 // self.total if self.total else 0
@@ -1,3 +1,5 @@
+import itertools
+import tempfile
 from io import BytesIO
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
@@ -5,15 +7,98 @@ from reportlab.lib.units import mm
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib import colors
+from django.db.models import Count
 from django.utils import timezone
 
-def generate_artists_pdf(artists):
+# Как часто (в строках) сообщать о ходе выгрузки в progress(число строк)
+PROGRESS_EVERY = 100
+
+# Строк в одной таблице отчета (примерно страница A4). Одна большая Table
+# верстается за квадратичное время: при каждом переносе на новую страницу
+# ReportLab заново меряет весь остаток. Небольшие таблицы с повтором
+# заголовка (repeatRows) верстаются по очереди и сразу освобождаются.
+ROWS_PER_TABLE = 40
+
+# Строк, читаемых из базы за один запрос (iterator)
+CHUNK_SIZE = 2000
+
+# До этого размера PDF держится в памяти, дальше - во временном файле
+SPOOL_SIZE = 5 * 1024 * 1024
+
+# Flowables, которые doc.build() держит в очереди впереди текущего
+LOOKAHEAD = 4
+
+
+class FlowableStream(list):
+    """Очередь flowables для doc.build(), дочитываемая из итератора по мере верстки
+
+    doc.build() принимает список и снимает элементы с его начала, поэтому
+    список наполняется из генератора не больше чем на LOOKAHEAD элементов:
+    строки отчета не собираются в памяти целиком.
+    """
+
+    def __init__(self, flowables, lookahead=LOOKAHEAD):
+        super().__init__()
+        self._source = iter(flowables)
+        self._lookahead = lookahead
+
+    def _fill(self):
+        while self._source is not None and super().__len__() < self._lookahead:
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                self._source = None
+
+    def __len__(self):
+        self._fill()
+        return super().__len__()
+
+    def __getitem__(self, index):
+        self._fill()
+        return super().__getitem__(index)
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self._fill()
+
+
+def _report_tables(header, rows, col_widths, style, progress):
+    """Таблицы по ROWS_PER_TABLE строк с заголовком в каждой"""
+    chunk = [header]
+    number = 0
+    for number, row in enumerate(rows, start=1):
+        chunk.append(row)
+        if len(chunk) > ROWS_PER_TABLE:
+            yield Table(chunk, colWidths=col_widths, style=style, repeatRows=1)
+            chunk = [header]
+        if progress and number % PROGRESS_EVERY == 0:
+            progress(number)
+    if len(chunk) > 1 or not number:
+        yield Table(chunk, colWidths=col_widths, style=style, repeatRows=1)
+
+
+def _fit_widths(doc, widths):
+    """Ширины колонок пропорционально widths во всю ширину страницы"""
+    scale = doc.width / sum(widths)
+    return [width * scale for width in widths]
+
+
+def build_report(heading, header, rows, widths, style, progress=None):
+    """PDF-отчет из заголовка и строк таблицы; rows - итератор, читается один раз
+
+    Возвращает файл (в памяти до SPOOL_SIZE, дальше на диске), открытый
+    с начала.
+    """
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    doc = SimpleDocTemplate(output, pagesize=A4, pageCompression=1)
+    tables = _report_tables(header, rows, _fit_widths(doc, widths), style, progress)
+    doc.build(FlowableStream(itertools.chain(heading, tables)))
+    output.seek(0)
+    return output
+
+
+def generate_artists_pdf(artists, progress=None):
     """Генерация PDF отчета по исполнителям"""
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    elements = []
-    
-    # Стили
     styles = getSampleStyleSheet()
     title_style = ParagraphStyle(
         'CustomTitle',
@@ -23,28 +108,25 @@ def generate_artists_pdf(artists):
         alignment=1  # center
     )
     
-    # Заголовок
-    title = Paragraph("Отчет по исполнителям", title_style)
-    elements.append(title)
-    
-    # Дата генерации
+    # Заголовок и дата генерации
     date_str = f"Сгенерировано: {timezone.now().strftime('%d.%m.%Y %H:%M')}"
-    date_para = Paragraph(date_str, styles['Normal'])
-    elements.append(date_para)
-    elements.append(Spacer(1, 10))
-    
-    # Таблица с данными
-    data = [['Исполнитель', 'Кол-во релизов', 'Дата создания']]
+    heading = [
+        Paragraph("Отчет по исполнителям", title_style),
+        Paragraph(date_str, styles['Normal']),
+        Spacer(1, 10),
+    ]
     
-    for artist in artists:
-        data.append([
-            artist.name,
-            str(artist.releases.count()),
-            artist.created_at.strftime('%d.%m.%Y')
-        ])
+    # Число релизов - в том же запросе, а не запросом на каждого исполнителя
+    artists = (
+        artists.annotate(report_release_count=Count('releases'))
+        .only('name', 'created_at').iterator(chunk_size=CHUNK_SIZE)
+    )
+    rows = (
+        [artist.name, str(artist.report_release_count), artist.created_at.strftime('%d.%m.%Y')]
+        for artist in artists
+    )
     
-    table = Table(data, colWidths=[200*mm, 60*mm, 60*mm])
-    table.setStyle(TableStyle([
+    style = TableStyle([
         ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
         ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
         ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
@@ -55,42 +137,33 @@ def generate_artists_pdf(artists):
         ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
         ('FONTSIZE', (0, 1), (-1, -1), 10),
         ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    elements.append(table)
+    ])
     
-    # Генерация PDF
-    doc.build(elements)
-    buffer.seek(0)
-    return buffer
+    header = ['Исполнитель', 'Кол-во релизов', 'Дата создания']
+    return build_report(heading, header, rows, [200*mm, 60*mm, 60*mm], style, progress)
 
-def generate_tracks_pdf(tracks):
+def generate_tracks_pdf(tracks, progress=None):
     """Генерация PDF отчета по трекам"""
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    elements = []
-    
     styles = getSampleStyleSheet()
+    heading = [Paragraph("Отчет по трекам", styles['Heading1']), Spacer(1, 20)]
     
-    # Заголовок
-    title = Paragraph("Отчет по трекам", styles['Heading1'])
-    elements.append(title)
-    elements.append(Spacer(1, 20))
-    
-    # Данные
-    data = [['Трек', 'Исполнитель', 'Длительность', 'Статус']]
-    
-    for track in tracks:
-        duration = f"{track.duration_seconds // 60}:{track.duration_seconds % 60:02d}"
-        data.append([
+    # Исполнитель - через join, а не запросом на каждый трек
+    tracks = (
+        tracks.select_related('release__artist')
+        .only('title', 'duration_seconds', 'status', 'release__artist__name')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    rows = (
+        [
             track.title,
             track.release.artist.name,
-            duration,
-            track.get_status_display()
-        ])
+            f"{track.duration_seconds // 60}:{track.duration_seconds % 60:02d}",
+            track.get_status_display(),
+        ]
+        for track in tracks
+    )
     
-    table = Table(data, colWidths=[180*mm, 100*mm, 50*mm, 60*mm])
-    table.setStyle(TableStyle([
+    style = TableStyle([
         ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
         ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
         ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
@@ -98,12 +171,10 @@ def generate_tracks_pdf(tracks):
         ('FONTSIZE', (0, 0), (-1, 0), 10),
         ('BACKGROUND', (0, 1), (-1, -1), colors.lightblue),
         ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
+    ])
     
-    elements.append(table)
-    doc.build(elements)
-    buffer.seek(0)
-    return buffer
+    header = ['Трек', 'Исполнитель', 'Длительность', 'Статус']
+    return build_report(heading, header, rows, [180*mm, 100*mm, 50*mm, 60*mm], style, progress)
 
 def generate_release_pdf(release):
     """Генерация PDF для конкретного релиза"""
@@ -0,0 +1,253 @@
+"""Экспорт и импорт плейлистов: M3U, XSPF, JSON
+
+Экспорт - генераторы строк для StreamingHttpResponse: треки читаются
+через .iterator(chunk_size=...) с select_related('release__artist') и
+отдаются кусками, так что ни плейлист, ни ответ целиком в памяти не
+лежат.
+
+Импорт читает файл потоково (строки M3U, iterparse для XSPF с очисткой
+разобранных элементов, пошаговый JSON-декодер из scrobble_import),
+сопоставляет записи трекам пачками через scrobble_import.TrackResolver
+(ограниченный кэш, один запрос на пачку) и добавляет пачку в плейлист
+одним INSERT (playlist_order.append). Уже имеющиеся в плейлисте треки
+пропускаются.
+"""
+import json
+import re
+import xml.etree.ElementTree as ElementTree
+from xml.sax.saxutils import escape
+
+from . import playlist_order, scrobble_import
+
+EXPORT_CHUNK_SIZE = 2000
+IMPORT_CHUNK_SIZE = 5000
+
+# Формат -> (Content-Type, расширение файла)
+FORMATS = {
+    'm3u': ('audio/x-mpegurl; charset=utf-8', 'm3u8'),
+    'xspf': ('application/xspf+xml; charset=utf-8', 'xspf'),
+    'json': ('application/json; charset=utf-8', 'json'),
+}
+
+XSPF_NS = 'http://xspf.org/ns/0/'
+
+# Сколько байт ищем ключ "tracks" в JSON-объекте
+JSON_HEADER_LIMIT = 1 << 20
+
+
+# Экспорт
+
+def _tracks(playlist):
+    return (
+        playlist_order.tracks(playlist).select_related('release__artist')
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+
+
+def _grouped(parts):
+    """Склеивает мелкие строки в куски по EXPORT_CHUNK_SIZE"""
+    buffer = []
+    for part in parts:
+        buffer.append(part)
+        if len(buffer) >= EXPORT_CHUNK_SIZE:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _m3u(playlist, location):
+    yield '#EXTM3U\n'
+    yield f'#PLAYLIST:{playlist.title}\n'
+    for track in _tracks(playlist):
+        artist = track.release.artist.name
+        yield f'#EXTINF:{track.duration_seconds},{artist} - {track.title}\n'
+        yield f'#EXTALB:{track.release.title}\n'
+        yield f'{location(track)}\n'
+
+
+def _xspf(playlist, location):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield f'<playlist version="1" xmlns="{XSPF_NS}">\n'
+    yield f'  <title>{escape(playlist.title)}</title>\n'
+    yield '  <trackList>\n'
+    for track in _tracks(playlist):
+        yield (
+            '    <track>'
+            f'<location>{escape(location(track))}</location>'
+            f'<title>{escape(track.title)}</title>'
+            f'<creator>{escape(track.release.artist.name)}</creator>'
+            f'<album>{escape(track.release.title)}</album>'
+            f'<duration>{track.duration_seconds * 1000}</duration>'
+            '</track>\n'
+        )
+    yield '  </trackList>\n'
+    yield '</playlist>\n'
+
+
+def _json(playlist, location):
+    yield '{"title": %s, "tracks": [' % json.dumps(playlist.title, ensure_ascii=False)
+    separator = '\n'
+    for track in _tracks(playlist):
+        item = {
+            'artist': track.release.artist.name,
+            'title': track.title,
+            'album': track.release.title,
+            'duration': track.duration_seconds,
+            'location': location(track),
+        }
+        yield separator + json.dumps(item, ensure_ascii=False)
+        separator = ',\n'
+    yield '\n]}\n'
+
+
+EXPORTERS = {'m3u': _m3u, 'xspf': _xspf, 'json': _json}
+
+
+def export(playlist, file_format, location):
+    """Генератор кусков текста плейлиста; location(track) - ссылка на трек"""
+    return _grouped(EXPORTERS[file_format](playlist, location))
+
+
+# Чтение файлов
+
+EXTINF_RE = re.compile(r'#EXTINF:[^,]*,(?P<name>.*)')
+
+
+def _split_name(name):
+    """'Исполнитель - Трек' -> (исполнитель, трек) или (None, name)"""
+    artist, dash, title = name.partition(' - ')
+    return (artist.strip(), title.strip()) if dash else (None, name.strip())
+
+
+def _read_m3u(stream):
+    """(исполнитель, трек, релиз) из M3U: по #EXTINF, иначе по имени файла"""
+    name, album = None, None
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        match = EXTINF_RE.match(line)
+        if match:
+            name = match.group('name')
+        elif line.startswith('#EXTALB:'):
+            album = line[len('#EXTALB:'):].strip()
+        elif not line.startswith('#'):
+            if name is None:
+                # Без #EXTINF - имя файла без пути и расширения
+                name = re.sub(r'\.\w{1,5}$', '', re.split(r'[/\\]', line)[-1])
+            artist, title = _split_name(name)
+            yield artist, title, album
+            name, album = None, None
+
+
+def _read_xspf(stream):
+    """(исполнитель, трек, альбом) из XSPF; разобранные элементы сразу освобождаются"""
+    open_elements = []
+    for event, element in ElementTree.iterparse(stream, events=('start', 'end')):
+        if event == 'start':
+            open_elements.append(element)
+            continue
+        open_elements.pop()
+        if element.tag.rpartition('}')[2] != 'track':
+            continue
+        fields = {child.tag.rpartition('}')[2]: (child.text or '').strip() for child in element}
+        yield fields.get('creator'), fields.get('title'), fields.get('album')
+        # Ссылки на разобранные <track> держит родитель (<trackList>), в который
+        # парсер добавляет следующие - убираем их оттуда
+        if open_elements:
+            del open_elements[-1][:]
+
+
+def _read_json(stream):
+    """(исполнитель, трек, альбом) из JSON: массив, NDJSON или объект с ключом "tracks" (наш экспорт)"""
+    head = stream.read(1)
+    while head and head.isspace():
+        head = stream.read(1)
+    if head == '{':
+        # Дочитываем заголовок объекта до начала массива "tracks"
+        buffer = head
+        match = None
+        while match is None:
+            chunk = stream.read(scrobble_import.READ_SIZE)
+            if not chunk or len(buffer) > JSON_HEADER_LIMIT:
+                raise ValueError('В JSON-объекте нет массива "tracks"')
+            buffer += chunk
+            match = re.search(r'"tracks"\s*:\s*\[', buffer)
+        stream = scrobble_import._Prepend(buffer[match.end() - 1:], stream)
+        rows = scrobble_import._iter_json_array(stream)
+    else:
+        rows = scrobble_import.read_rows(scrobble_import._Prepend(head, stream), 'json')
+    for row in rows:
+        if isinstance(row, dict):
+            yield (
+                scrobble_import.row_field(row, 'artist'),
+                scrobble_import.row_field(row, 'track'),
+                scrobble_import.row_field(row, 'release'),
+            )
+
+
+def guess_format(name):
+    name = name.lower()
+    if name.endswith(('.m3u', '.m3u8')):
+        return 'm3u'
+    if name.endswith('.xspf'):
+        return 'xspf'
+    return 'json'
+
+
+def read_entries(stream, file_format):
+    """Генератор (исполнитель, трек, альбом); XSPF - бинарный поток, остальные - текстовый"""
+    if file_format == 'm3u':
+        return _read_m3u(stream)
+    if file_format == 'xspf':
+        return _read_xspf(stream)
+    return _read_json(stream)
+
+
+# Импорт
+
+def _chunks(entries, size):
+    chunk = []
+    for entry in entries:
+        chunk.append(entry)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_entries(playlist, entries, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """Добавляет найденные в каталоге треки в конец плейлиста. Возвращает словарь итогов"""
+    resolver = scrobble_import.TrackResolver()
+    totals = {'read': 0, 'added': 0, 'unmatched': 0, 'skipped': 0, 'unmatched_examples': []}
+
+    for chunk in _chunks(entries, chunk_size):
+        keys, names = [], {}
+        for artist, title, album in chunk:
+            totals['read'] += 1
+            if not artist or not title:
+                totals['unmatched'] += 1
+                continue
+            key = scrobble_import.track_key(artist, title, album)
+            keys.append(key)
+            names.setdefault(key, (artist, title))
+
+        track_ids = resolver.resolve(set(keys), names)
+        ordered = []
+        for key in keys:
+            if track_ids[key] is None:
+                totals['unmatched'] += 1
+                example = ' - '.join(names[key])
+                if len(totals['unmatched_examples']) < 10 and example not in totals['unmatched_examples']:
+                    totals['unmatched_examples'].append(example)
+            else:
+                ordered.append(track_ids[key])
+
+        added = playlist_order.append(playlist, ordered)
+        totals['added'] += added
+        totals['skipped'] += len(ordered) - added  # повторы и треки, уже бывшие в плейлисте
+        if progress:
+            progress(totals)
+    return totals
@@ -0,0 +1,269 @@
+"""Порядок треков в плейлисте: разреженные ключи PlaylistEntry.position
+
+Треки плейлиста упорядочены по целому ключу position, между соседними
+ключами оставляется зазор GAP. Вставка или перемещение трека берет
+середину между ключами соседей и меняет одну строку, сколько бы треков
+ни было в плейлисте. Когда зазор исчерпан (около log2(GAP) вставок в одно
+место), ключи плейлиста перенумеровываются заново - rebalance().
+Команда rebalance_playlists делает это заранее для плейлистов, где зазоры
+стали меньше MIN_GAP.
+
+Массовая перестановка (reorder) оставляет на месте наибольшую
+возрастающую подпоследовательность ключей и переписывает только
+остальные строки.
+"""
+import json
+from bisect import bisect_left
+
+from django.db import connection, transaction
+from django.db.models import Exists, F, Max, Min, OuterRef, Window
+from django.db.models.functions import Lag
+from django.utils import timezone
+
+from . import keyset, playlist_stats, search_index
+from .models import PlaylistEntry, Track
+
+GAP = 1 << 20
+# Плейлисты с зазором меньше этого перенумеровываются периодической задачей
+MIN_GAP = 1 << 10
+
+BATCH_SIZE = 1000
+
+
+def tracks(playlist):
+    """Треки плейлиста по порядку"""
+    return (
+        Track.objects.filter(playlist_entries__playlist=playlist)
+        .order_by('playlist_entries__position')
+    )
+
+
+def _between(low, high):
+    """Ключ строго между low и high (None - край списка) или None, если места нет"""
+    if low is None and high is None:
+        return GAP
+    if low is None:
+        return high - GAP
+    if high is None:
+        return low + GAP
+    if high - low < 2:
+        return None
+    return (low + high) // 2
+
+
+# Добавление и перемещение
+
+def append(playlist, track_ids):
+    """Добавляет треки в конец одним INSERT ... SELECT. Возвращает число добавленных
+
+    Несуществующие треки и уже имеющиеся в плейлисте пропускаются в SQL
+    (JOIN с треками и NOT EXISTS по уникальному индексу). Порядок задает
+    json_each: ключ строки - номер трека во входном списке.
+    """
+    track_ids = list(dict.fromkeys(int(track_id) for track_id in track_ids))
+    if not track_ids:
+        return 0
+    table = PlaylistEntry._meta.db_table
+    sql = (
+        f'INSERT INTO {table} (playlist_id, track_id, position, added_at) '
+        f'SELECT %s, j.value, %s + %s * (j.key + 1), %s '
+        f'FROM json_each(%s) j JOIN {Track._meta.db_table} t ON t.id = j.value '
+        f'WHERE NOT EXISTS (SELECT 1 FROM {table} e WHERE e.playlist_id = %s AND e.track_id = j.value) '
+        f'ORDER BY j.key '
+        f'RETURNING track_id'
+    )
+    with transaction.atomic():
+        last = PlaylistEntry.objects.filter(playlist=playlist).aggregate(last=Max('position'))['last'] or 0
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [playlist.pk, last, GAP, now, json.dumps(track_ids), playlist.pk])
+            added = [row[0] for row in cursor.fetchall()]
+        # Сырой INSERT не шлет сигналов - итоги плейлиста обновляем сами
+        playlist_stats.added(playlist.pk, added)
+    return len(added)
+
+
+def _neighbor_keys(playlist, track_id, after):
+    """Ключи соседей места "после трека after" (after=None - в начало), без самого track_id"""
+    entries = PlaylistEntry.objects.filter(playlist=playlist).exclude(track_id=track_id)
+    low = None
+    if after is not None:
+        low = entries.filter(track_id=after).values_list('position', flat=True).first()
+        if low is None:
+            raise PlaylistEntry.DoesNotExist(f'Трека {after} нет в плейлисте')
+    following = entries.filter(position__gt=low) if low is not None else entries
+    high = following.aggregate(high=Min('position'))['high']
+    return low, high
+
+
+def move(playlist, track_id, after=None):
+    """Ставит трек после трека after (None - в начало); трека нет в плейлисте - добавляет
+
+    Возвращает новый ключ трека.
+    """
+    if after == track_id:
+        raise ValueError('Трек нельзя поставить после самого себя')
+    with transaction.atomic():
+        position = _between(*_neighbor_keys(playlist, track_id, after))
+        if position is None:
+            rebalance(playlist)
+            position = _between(*_neighbor_keys(playlist, track_id, after))
+        entry, created = PlaylistEntry.objects.get_or_create(
+            playlist=playlist, track_id=track_id, defaults={'position': position}
+        )
+        if not created:
+            PlaylistEntry.objects.filter(pk=entry.pk).update(position=position)
+    return position
+
+
+def remove(playlist, track_ids):
+    """Убирает треки из плейлиста (ключи остальных не меняются)"""
+    return PlaylistEntry.objects.filter(playlist=playlist, track_id__in=track_ids).delete()[0]
+
+
+# Подбор треков для добавления
+
+PICKER_PAGE_SIZE = 25
+MAX_OFFSET = 2 ** 63 - 1 - PICKER_PAGE_SIZE - 1
+
+
+def not_in_playlist(playlist):
+    """Треки, которых нет в плейлисте (NOT EXISTS по уникальному индексу (playlist, track))"""
+    members = PlaylistEntry.objects.filter(playlist=playlist, track=OuterRef('pk'))
+    return Track.objects.filter(~Exists(members))
+
+
+def candidates(playlist, query='', cursor=None, page_size=PICKER_PAGE_SIZE):
+    """Страница треков для добавления: {'items', 'next'}
+
+    С запросом - полнотекстовый поиск по названию и исполнителю (FTS5,
+    по релевантности, курсор - смещение); без запроса - весь каталог в
+    порядке релиз/позиция с keyset-курсором.
+    """
+    if not search_index.build_match(query):
+        page = keyset.paginate(
+            not_in_playlist(playlist).select_related('release__artist'), cursor,
+            ordering=['release', 'position'], page_size=page_size,
+        )
+        return {'items': page['items'], 'next': page['next']}
+
+    # Смещение в пределах int64 (SQLite): больше - просто пустая страница
+    offset = min(int(cursor), MAX_OFFSET) if cursor and cursor.isdecimal() else 0
+    members = (
+        f'NOT EXISTS (SELECT 1 FROM {PlaylistEntry._meta.db_table} e '
+        f'WHERE e.playlist_id = %s AND e.track_id = {{table}}.rowid)'
+    )
+    ids = search_index.ranked_ids(
+        'track', query, columns=('title', 'artist_name'), limit=page_size + 1, offset=offset,
+        where=members, params=[playlist.pk],
+    )
+    return {
+        'items': list(search_index.in_rank_order(Track.objects.select_related('release__artist'), ids[:page_size])),
+        'next': str(offset + page_size) if len(ids) > page_size else None,
+    }
+
+
+# Массовая перестановка
+
+def _longest_increasing(values):
+    """Номера элементов наибольшей строго возрастающей подпоследовательности"""
+    tails, tail_index = [], []
+    previous = [-1] * len(values)
+    for i, value in enumerate(values):
+        k = bisect_left(tails, value)
+        if k == len(tails):
+            tails.append(value)
+            tail_index.append(i)
+        else:
+            tails[k] = value
+            tail_index[k] = i
+        previous[i] = tail_index[k - 1] if k else -1
+    result = []
+    i = tail_index[-1] if tail_index else -1
+    while i >= 0:
+        result.append(i)
+        i = previous[i]
+    return result[::-1]
+
+
+def _save_positions(entries):
+    PlaylistEntry.objects.bulk_update(entries, ['position'], batch_size=BATCH_SIZE)
+
+
+def reorder(playlist, track_ids):
+    """Задает порядок: сначала track_ids, за ними остальные треки в прежнем порядке
+
+    Возвращает число переписанных строк.
+    """
+    with transaction.atomic():
+        current = list(PlaylistEntry.objects.filter(playlist=playlist).order_by('position').only('id', 'track_id', 'position'))
+        by_track = {entry.track_id: entry for entry in current}
+        ordered = []
+        for track_id in track_ids:
+            entry = by_track.pop(track_id, None)
+            if entry is not None:
+                ordered.append(entry)
+        ordered += [entry for entry in current if entry.track_id in by_track]
+
+        keep = set(_longest_increasing([entry.position for entry in ordered]))
+        positions = []
+        i = 0
+        while i < len(ordered):
+            if i in keep:
+                i += 1
+                continue
+            # Серия переставленных строк между неподвижными соседями
+            end = i
+            while end < len(ordered) and end not in keep:
+                end += 1
+            count = end - i
+            low = ordered[i - 1].position if i else None
+            high = ordered[end].position if end < len(ordered) else None
+            if low is None:
+                low = (high if high is not None else 0) - GAP * (count + 1)
+            if high is None:
+                high = low + GAP * (count + 1)
+            step = (high - low) // (count + 1)
+            if step < 1:
+                return rebalance(playlist, ordered)
+            positions += [(entry, low + step * number) for number, entry in enumerate(ordered[i:end], start=1)]
+            i = end
+
+        for entry, position in positions:
+            entry.position = position
+        _save_positions([entry for entry, _ in positions])
+    return len(positions)
+
+
+# Перенумерация
+
+def rebalance(playlist, ordered=None):
+    """Ключи плейлиста заново с шагом GAP (ordered - строки в нужном порядке). Возвращает число строк"""
+    with transaction.atomic():
+        if ordered is None:
+            ordered = list(PlaylistEntry.objects.filter(playlist=playlist).order_by('position').only('id', 'position'))
+        changed = []
+        for number, entry in enumerate(ordered, start=1):
+            if entry.position != GAP * number:
+                entry.position = GAP * number
+                changed.append(entry)
+        _save_positions(changed)
+    return len(changed)
+
+
+def crowded(min_gap=MIN_GAP):
+    """id плейлистов, где соседние ключи ближе min_gap"""
+    gaps = PlaylistEntry.objects.annotate(
+        previous=Window(Lag('position'), partition_by=[F('playlist_id')], order_by=F('position').asc())
+    ).filter(position__lt=F('previous') + min_gap)
+    return sorted(set(gaps.values_list('playlist_id', flat=True)))
+
+
+def rebalance_crowded(min_gap=MIN_GAP, progress=None):
+    """Перенумеровывает все тесные плейлисты. Возвращает их число"""
+    playlist_ids = crowded(min_gap)
+    for playlist_id in playlist_ids:
+        rows = rebalance(playlist_id)
+        if progress:
+            progress(playlist_id, rows)
+    return len(playlist_ids)
@@ -0,0 +1,90 @@
+"""Итоги плейлистов: Playlist.track_count и total_duration_seconds
+
+Поля меняются F()-выражениями при каждом изменении состава плейлиста и
+длительности трека, так что админка и страницы читают готовые числа
+вместо COUNT и суммы по трекам на каждый плейлист:
+- добавление: m2m_changed (post_add) для playlist.tracks.add() и
+  track.playlists.add() (ключи порядка им назначает
+  PlaylistEntryQuerySet.bulk_create - в конец плейлиста), post_save
+  PlaylistEntry для create(), явный вызов added() из playlist_order.append
+  (вставка сырым SQL);
+- удаление: post_delete PlaylistEntry (remove(), clear(), каскад);
+- длительность трека: post_save Track.
+Массовые queryset.update() сигналов не шлют - расхождения находит и
+чинит команда verify_playlist_stats.
+"""
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Playlist, PlaylistEntry, Track
+
+
+def _apply(playlists, count, duration):
+    """Прибавляет к итогам плейлистов из queryset (отрицательные - вычесть)"""
+    if count or duration:
+        playlists.update(
+            track_count=F('track_count') + count,
+            total_duration_seconds=F('total_duration_seconds') + duration,
+        )
+
+
+def added(playlist_id, track_ids):
+    """Учитывает треки, добавленные в плейлист"""
+    duration = Track.objects.filter(pk__in=track_ids).aggregate(total=Sum('duration_seconds'))['total']
+    _apply(Playlist.objects.filter(pk=playlist_id), len(track_ids), duration or 0)
+
+
+def added_to_playlists(track_id, playlist_ids):
+    """Учитывает трек, добавленный в несколько плейлистов (track.playlists.add)"""
+    duration = Track.objects.filter(pk=track_id).values_list('duration_seconds', flat=True).first() or 0
+    _apply(Playlist.objects.filter(pk__in=playlist_ids), 1, duration)
+
+
+def removed(entry):
+    """Учитывает удаленную строку PlaylistEntry (трек еще в базе - удаляется после строк)"""
+    duration = Subquery(Track.objects.filter(pk=entry.track_id).values('duration_seconds')[:1])
+    Playlist.objects.filter(pk=entry.playlist_id).update(
+        track_count=F('track_count') - 1,
+        total_duration_seconds=F('total_duration_seconds') - Coalesce(duration, Value(0)),
+    )
+
+
+def duration_changed(track_id, delta):
+    """Переносит изменение длительности трека на все его плейлисты"""
+    _apply(Playlist.objects.filter(entries__track_id=track_id), 0, delta)
+
+
+# Сверка
+
+def _exact():
+    """Playlist queryset с точными итогами exact_count и exact_duration"""
+    entries = PlaylistEntry.objects.filter(playlist=OuterRef('pk')).order_by().values('playlist')
+    return Playlist.objects.annotate(
+        exact_count=Coalesce(Subquery(entries.annotate(n=Count('pk')).values('n')), Value(0)),
+        exact_duration=Coalesce(
+            Subquery(entries.annotate(total=Sum('track__duration_seconds')).values('total')), Value(0)
+        ),
+    )
+
+
+def mismatches():
+    """[(playlist_id, (track_count, total_duration_seconds), (точные значения))] для расходящихся плейлистов"""
+    rows = _exact().exclude(
+        track_count=F('exact_count'), total_duration_seconds=F('exact_duration')
+    ).order_by('pk').values_list(
+        'pk', 'track_count', 'total_duration_seconds', 'exact_count', 'exact_duration'
+    )
+    return [(pk, (count, duration), (exact_count, exact_duration))
+            for pk, count, duration, exact_count, exact_duration in rows]
+
+
+def fix(playlist_ids=None):
+    """Записывает точные итоги (всех плейлистов или playlist_ids). Возвращает число строк"""
+    playlists = Playlist.objects.all() if playlist_ids is None else Playlist.objects.filter(pk__in=playlist_ids)
+    entries = PlaylistEntry.objects.filter(playlist=OuterRef('pk')).order_by().values('playlist')
+    return playlists.update(
+        track_count=Coalesce(Subquery(entries.annotate(n=Count('pk')).values('n')), Value(0)),
+        total_duration_seconds=Coalesce(
+            Subquery(entries.annotate(total=Sum('track__duration_seconds')).values('total')), Value(0)
+        ),
+    )
@@ -0,0 +1,291 @@
+"""Рекомендации item-to-item: "с этим треком также слушают"
+
+Офлайн-задача (команда build_recommendations) строит разреженную матрицу
+пользователь x трек в форме CSR на NumPy. Вес пары - log(1 + число
+прослушиваний) плюс FAVORITE_WEIGHT, если трек в избранном. Прослушивания
+берутся из таблицы и из архива (catalog/scrobble_archive.py). У каждого
+пользователя учитываются не больше MAX_USER_TRACKS самых весомых треков,
+чтобы "всеядные" слушатели не раздували вычисления.
+
+Близость треков - косинус между их столбцами. Она считается блоками
+треков: для блока строится плотная матрица блок x все треки, поэтому
+память ограничена BLOCK_CELLS ячейками независимо от размера каталога.
+Для каждого трека в TrackNeighbor сохраняются TOP_K соседей, и страница
+трека читает их одним запросом по индексу.
+
+Инкрементальное обновление пересчитывает списки только для треков, у
+которых с прошлого запуска появились прослушивания или избранное
+(отметки в RecommenderState). Списки остальных треков могут слегка
+устаревать до следующего полного пересчета (--full).
+"""
+import math
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from . import scrobble_archive
+from .models import Favorite, RecommenderState, Scrobble, Track, TrackNeighbor
+
+STATE_NAME = 'track_neighbors'
+
+TOP_K = 20
+FAVORITE_WEIGHT = 3.0
+MAX_USER_TRACKS = 500
+
+# Ячеек плотной матрицы блока (блок треков x все треки), float64
+BLOCK_CELLS = 8_000_000
+# Сколько произведений разворачивается за один проход внутри блока
+EXPANSION_LIMIT = 5_000_000
+
+
+# Матрица
+
+def listen_counts():
+    """Массивы (user_id, track_id, число прослушиваний): таблица и архив"""
+    keys, counts = [], []
+
+    hot = (
+        Scrobble.objects.order_by().values('user_id', 'track_id')
+        .annotate(n=Count('id')).values_list('user_id', 'track_id', 'n')
+    )
+    rows = np.array(list(hot), dtype=np.int64).reshape(-1, 3)
+    keys.append((rows[:, 0] << 32) | rows[:, 1])
+    counts.append(rows[:, 2])
+
+    for year, month in scrobble_archive.archived_months():
+        columns = scrobble_archive.month_columns(year, month)
+        month_keys = (np.asarray(columns['user_id'], np.int64) << 32) | np.asarray(columns['track_id'], np.int64)
+        unique, month_counts = np.unique(month_keys, return_counts=True)
+        keys.append(unique)
+        counts.append(month_counts)
+
+    unique, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+    return unique >> 32, unique & 0xFFFFFFFF, np.bincount(inverse, weights=np.concatenate(counts))
+
+
+def _interactions():
+    """Массивы (user_id, track_id, вес) по всем прослушиваниям и избранному"""
+    users, tracks, counts = listen_counts()
+    favorites = np.array(list(Favorite.objects.values_list('user_id', 'track_id')), dtype=np.int64).reshape(-1, 2)
+
+    keys = np.concatenate([(users << 32) | tracks, (favorites[:, 0] << 32) | favorites[:, 1]])
+    unique, inverse = np.unique(keys, return_inverse=True)
+    weights = np.log1p(np.bincount(inverse, weights=np.concatenate([counts, np.zeros(len(favorites))])))
+    weights[inverse[len(users):]] += FAVORITE_WEIGHT
+    return unique >> 32, unique & 0xFFFFFFFF, weights
+
+
+def ranked(values, ids, k):
+    """[(id, значение)] для k наибольших положительных values по убыванию"""
+    candidates = np.flatnonzero(values > 0)
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(values[candidates], -k)[-k:]]
+    # При равной близости выше меньший id - порядок стабилен между пересчетами
+    candidates = candidates[np.lexsort((ids[candidates], -values[candidates]))]
+    return [(int(ids[j]), float(values[j])) for j in candidates]
+
+
+def _csr(rows, cols, data, row_count):
+    """CSR (indptr, indices, data) из троек; rows - плотные номера строк"""
+    order = np.lexsort((cols, rows))
+    indptr = np.zeros(row_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=row_count), out=indptr[1:])
+    return indptr, cols[order], data[order]
+
+
+def _expand(matrix, rows):
+    """Элементы строк rows матрицы CSR: (номер строки в rows, столбец, значение)"""
+    indptr, indices, data = matrix
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    total = int(lengths.sum())
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+    return np.repeat(np.arange(len(rows)), lengths), indices[offsets], data[offsets]
+
+
+class CosineIndex:
+    """Косинусная близость объектов по разреженным векторам пользователей
+
+    items, users, weights - тройки (id объекта, id пользователя, вес).
+    Строки нормируются, так что скалярное произведение - косинус.
+    """
+
+    def __init__(self, items, users, weights):
+        self.ids, item_index = np.unique(items, return_inverse=True)
+        _, user_index = np.unique(users, return_inverse=True)
+        user_count = int(user_index.max()) + 1 if len(user_index) else 0
+
+        norms = np.sqrt(np.bincount(item_index, weights=weights ** 2))
+        weights = weights / norms[item_index]
+
+        self.by_track = _csr(item_index, user_index, weights, len(self.ids))
+        self.by_user = _csr(user_index, item_index, weights, user_count)
+
+    def index_of(self, ids):
+        """Плотные номера для id объектов (только тех, что есть в матрице)"""
+        ids = np.fromiter(ids, dtype=np.int64)
+        positions = np.searchsorted(self.ids, ids)
+        found = positions < len(self.ids)
+        found[found] &= self.ids[positions[found]] == ids[found]
+        return np.unique(positions[found])
+
+    def block_size(self):
+        """Сколько строк помещается в блок из BLOCK_CELLS ячеек"""
+        return max(1, BLOCK_CELLS // max(len(self.ids), 1))
+
+    def similarities(self, rows):
+        """Плотная матрица косинусов rows x все объекты"""
+        result = np.zeros((len(rows), len(self.ids)))
+        local, users, weights = _expand(self.by_track, rows)
+
+        # Разворачиваем "объект блока -> пользователь -> его объекты" порциями
+        # не больше EXPANSION_LIMIT произведений (но хотя бы по одному пользователю)
+        indptr = self.by_user[0]
+        cumulative = np.cumsum(indptr[users + 1] - indptr[users])
+        start = 0
+        while start < len(users):
+            base = cumulative[start - 1] if start else 0
+            end = max(start + 1, int(np.searchsorted(cumulative, base + EXPANSION_LIMIT, side='right')))
+            part_local, part_items, part_weights = _expand(self.by_user, users[start:end])
+            cells = local[start:end][part_local] * len(self.ids) + part_items
+            result += np.bincount(
+                cells, weights=weights[start:end][part_local] * part_weights, minlength=result.size
+            ).reshape(result.shape)
+            start = end
+
+        result[np.arange(len(rows)), rows] = 0  # сам с собой не сосед
+        return result
+
+    def neighbors(self, rows, k=TOP_K):
+        """{id: [(id соседа, близость), ...]} для плотных номеров rows (один блок)"""
+        scores = self.similarities(rows)
+        return {
+            int(self.ids[row]): ranked(scores[local], self.ids, k)
+            for local, row in enumerate(rows)
+        }
+
+
+class Model(CosineIndex):
+    """Треки x пользователи по прослушиваниям и избранному"""
+
+    def __init__(self):
+        users, tracks, weights = _interactions()
+
+        # Не больше MAX_USER_TRACKS самых весомых треков на пользователя
+        order = np.lexsort((-weights, users))
+        users, tracks, weights = users[order], tracks[order], weights[order]
+        first = np.searchsorted(users, users, side='left')
+        keep = np.arange(len(users)) - first < MAX_USER_TRACKS
+        super().__init__(tracks[keep], users[keep], weights[keep])
+
+
+# Сохранение
+
+def _state():
+    state, _ = RecommenderState.objects.get_or_create(name=STATE_NAME)
+    return state
+
+
+def _save(neighbors):
+    with transaction.atomic():
+        TrackNeighbor.objects.filter(track_id__in=list(neighbors)).delete()
+        TrackNeighbor.objects.bulk_create(
+            (
+                TrackNeighbor(track_id=track_id, neighbor_id=neighbor_id, score=score, rank=rank)
+                for track_id, items in neighbors.items()
+                for rank, (neighbor_id, score) in enumerate(items, start=1)
+            ),
+            batch_size=1000,
+        )
+
+
+def _save_in_blocks(model, rows, progress=None):
+    block = model.block_size()
+    for start in range(0, len(rows), block):
+        _save(model.neighbors(rows[start:start + block]))
+        if progress:
+            progress(min(start + block, len(rows)), len(rows))
+
+
+def build(progress=None):
+    """Полный пересчет соседей для всех треков. Возвращает число треков"""
+    state = _state()
+    last_scrobble = Scrobble.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    last_favorite = Favorite.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+    model = Model()
+    TrackNeighbor.objects.exclude(track_id__in=model.ids.tolist()).delete()
+    _save_in_blocks(model, np.arange(len(model.ids)), progress)
+
+    state.last_scrobble_id = last_scrobble
+    state.last_favorite_id = last_favorite
+    state.built_at = state.refreshed_at = timezone.now()
+    state.save()
+    return len(model.ids)
+
+
+def refresh(progress=None):
+    """Пересчет соседей для треков с новой активностью. Возвращает число треков"""
+    state = _state()
+    if state.built_at is None:
+        return build(progress)
+
+    new_scrobbles = Scrobble.objects.filter(id__gt=state.last_scrobble_id)
+    new_favorites = Favorite.objects.filter(id__gt=state.last_favorite_id)
+    last_scrobble = new_scrobbles.order_by('-id').values_list('id', flat=True).first() or state.last_scrobble_id
+    last_favorite = new_favorites.order_by('-id').values_list('id', flat=True).first() or state.last_favorite_id
+    changed = set(new_scrobbles.values_list('track_id', flat=True).distinct())
+    changed |= set(new_favorites.values_list('track_id', flat=True).distinct())
+
+    if changed:
+        model = Model()
+        _save_in_blocks(model, model.index_of(changed), progress)
+
+    state.last_scrobble_id = last_scrobble
+    state.last_favorite_id = last_favorite
+    state.refreshed_at = timezone.now()
+    state.save()
+    return len(changed)
+
+
+# Чтение
+
+def similar_tracks(track, limit=10):
+    """Соседи трека по рангу (один запрос по индексу)"""
+    return [
+        neighbor.neighbor
+        for neighbor in TrackNeighbor.objects.filter(track=track, rank__lte=limit)
+        .select_related('neighbor__release__artist').order_by('rank')
+    ]
+
+
+def for_user(user, limit=10, seeds=50):
+    """Рекомендации пользователю: соседи его самых слушаемых треков, без уже знакомых"""
+    top = list(
+        Scrobble.objects.filter(user=user).order_by().values('track_id')
+        .annotate(n=Count('id')).order_by('-n').values_list('track_id', 'n')[:seeds]
+    )
+    weights = {track_id: math.log1p(n) for track_id, n in top}
+    for track_id in Favorite.objects.filter(user=user).values_list('track_id', flat=True):
+        weights[track_id] = weights.get(track_id, 0) + FAVORITE_WEIGHT
+
+    scores = {}
+    rows = TrackNeighbor.objects.filter(track_id__in=list(weights)).values_list('track_id', 'neighbor_id', 'score')
+    for track_id, neighbor_id, score in rows:
+        scores[neighbor_id] = scores.get(neighbor_id, 0) + weights[track_id] * score
+
+    known = set(Scrobble.objects.filter(user=user, track_id__in=list(scores)).values_list('track_id', flat=True))
+    known |= set(weights)
+    ranked = sorted(
+        ((track_id, score) for track_id, score in scores.items() if track_id not in known),
+        key=lambda pair: (-pair[1], pair[0]),
+    )[:limit]
+    tracks = Track.objects.select_related('release__artist').in_bulk([track_id for track_id, _ in ranked])
+    result = []
+    for track_id, score in ranked:
+        if track_id in tracks:
+            tracks[track_id].recommendation_score = score
+            result.append(tracks[track_id])
+    return result
@@ -0,0 +1,326 @@
+"""Холодный архив прослушиваний (Scrobble)
+
+Закрытые месяцы (старше CATALOG_SCROBBLE_HOT_MONTHS) переносятся из
+таблицы catalog_scrobble в колоночные файлы NumPy - по каталогу на месяц:
+
+    <архив>/2026-03/id.npy        int64   id прослушивания
+                    user_id.npy   int32   }
+                    track_id.npy  int32   } отсортированы по (user_id, ts)
+                    ts.npy        int64   } ts - секунды эпохи, UTC
+                    track_order.npy  int32  перестановка строк по (track_id, ts)
+                    track_keys.npy   int32  track_id в порядке track_order
+
+Файлы открываются через np.load(mmap_mode='r'), история пользователя или
+трека ищется двоичным поиском и читает только нужные страницы файла.
+
+Архивация идемпотентна: месяц пишется во временный каталог и
+подменяется целиком, строки удаляются из базы только после записи. Если
+в архивный месяц позже попали прослушивания (опоздавшие или прерванный
+запуск), повторный запуск сливает их с файлами без дублей по id.
+
+Перед архивацией свертки (catalog/scrobble_rollups.py) догоняют таблицу,
+и переносятся только строки не новее их отметки: удаленные строки в
+свертках уже учтены. Пересборка сверток читает архив через fold_archived.
+"""
+import os
+import shutil
+from datetime import datetime, timezone as dt_timezone
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import scrobble_rollups
+from .models import Scrobble
+
+# Сколько последних месяцев остается в таблице по умолчанию
+DEFAULT_HOT_MONTHS = 3
+
+# Строк Scrobble за одно чтение/удаление
+BATCH_SIZE = 50000
+
+COLUMNS = ('id', 'user_id', 'track_id', 'ts')
+
+
+def archive_dir():
+    return getattr(settings, 'CATALOG_SCROBBLE_ARCHIVE_DIR', None) or os.path.join(
+        settings.MEDIA_ROOT, 'scrobble_archive'
+    )
+
+
+def _month_start(year, month):
+    return datetime(year, month, 1, tzinfo=dt_timezone.utc)
+
+
+def _next_month(year, month):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def _month_name(year, month):
+    return f'{year:04d}-{month:02d}'
+
+
+def _epoch(moment):
+    return int(moment.timestamp())
+
+
+def cutoff(hot_months=None):
+    """Начало самого старого месяца, который остается в таблице"""
+    if hot_months is None:
+        hot_months = getattr(settings, 'CATALOG_SCROBBLE_HOT_MONTHS', DEFAULT_HOT_MONTHS)
+    now = timezone.now().astimezone(dt_timezone.utc)
+    index = now.year * 12 + now.month - 1 - hot_months
+    return _month_start(index // 12, index % 12 + 1)
+
+
+# Запись архива
+
+def archived_months():
+    """[(год, месяц), ...] уже заархивированных месяцев"""
+    root = archive_dir()
+    if not os.path.isdir(root):
+        return []
+    months = []
+    for name in sorted(os.listdir(root)):
+        try:
+            year, month = map(int, name.split('-'))
+        except ValueError:
+            continue  # временные каталоги и посторонние файлы
+        months.append((year, month))
+    return months
+
+
+def _read_month(year, month, max_id):
+    """Колонки прослушиваний месяца с id <= max_id из таблицы (словарь массивов)"""
+    start = _month_start(year, month)
+    end = _month_start(*_next_month(year, month))
+    rows = (
+        Scrobble.objects.filter(scrobbled_at__gte=start, scrobbled_at__lt=end, id__lte=max_id)
+        .order_by()
+        .values_list('id', 'user_id', 'track_id', 'scrobbled_at')
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    ids, users, tracks, stamps = [], [], [], []
+    for scrobble_id, user_id, track_id, scrobbled_at in rows:
+        ids.append(scrobble_id)
+        users.append(user_id)
+        tracks.append(track_id)
+        stamps.append(_epoch(scrobbled_at))
+    return {
+        'id': np.array(ids, dtype=np.int64),
+        'user_id': np.array(users, dtype=np.int32),
+        'track_id': np.array(tracks, dtype=np.int32),
+        'ts': np.array(stamps, dtype=np.int64),
+    }
+
+
+def _write_month(path, columns):
+    """Сортирует колонки и атомарно заменяет каталог месяца"""
+    order = np.lexsort((columns['ts'], columns['user_id']))
+    columns = {name: values[order] for name, values in columns.items()}
+    track_order = np.lexsort((columns['ts'], columns['track_id'])).astype(np.int32)
+
+    tmp_path = f'{path}.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name, values in columns.items():
+        np.save(os.path.join(tmp_path, f'{name}.npy'), values)
+    np.save(os.path.join(tmp_path, 'track_order.npy'), track_order)
+    np.save(os.path.join(tmp_path, 'track_keys.npy'), columns['track_id'][track_order])
+
+    old_path = f'{path}.old'
+    if os.path.isdir(path):
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def archive_month(year, month, max_id=None):
+    """Переносит прослушивания месяца в архив. Возвращает число перенесенных строк
+
+    Переносятся только строки, уже учтенные в свертках (id не больше
+    отметки scrobble_rollups); более новые ждут следующего запуска.
+    """
+    if max_id is None:
+        max_id = scrobble_rollups.folded_up_to()
+    hot = _read_month(year, month, max_id)
+    if not len(hot['id']):
+        return 0
+
+    path = os.path.join(archive_dir(), _month_name(year, month))
+    columns = hot
+    if os.path.isdir(path):
+        archived = _open(path, *_stamp(path))
+        merged = {name: np.concatenate([archived[name], hot[name]]) for name in COLUMNS}
+        _, unique = np.unique(merged['id'], return_index=True)
+        columns = {name: values[unique] for name, values in merged.items()}
+    _write_month(path, columns)
+
+    # Удаляем только то, что прочитали (id растут, новее max_id не трогаем)
+    start = _month_start(year, month)
+    end = _month_start(*_next_month(year, month))
+    max_id = int(hot['id'].max())
+    with transaction.atomic():
+        Scrobble.objects.filter(
+            scrobbled_at__gte=start, scrobbled_at__lt=end, id__lte=max_id
+        ).delete()
+    return len(hot['id'])
+
+
+def archive(hot_months=None, progress=None):
+    """Архивирует все закрытые месяцы старше cutoff(). Возвращает число строк"""
+    scrobble_rollups.fold_new()
+    # Строки, добавленные после fold_new, остаются в таблице до следующего запуска
+    max_id = scrobble_rollups.folded_up_to()
+
+    before = cutoff(hot_months)
+    oldest = Scrobble.objects.filter(scrobbled_at__lt=before).order_by('scrobbled_at').first()
+    if oldest is None:
+        return 0
+
+    moment = oldest.scrobbled_at.astimezone(dt_timezone.utc)
+    year, month = moment.year, moment.month
+    total = 0
+    while _month_start(year, month) < before:
+        moved = archive_month(year, month, max_id)
+        total += moved
+        if progress and moved:
+            progress(_month_name(year, month), moved)
+        year, month = _next_month(year, month)
+    return total
+
+
+def fold_archived():
+    """Сворачивает архивные месяцы в свертки (для scrobble_rollups.rebuild)"""
+    for year, month in archived_months():
+        columns = month_columns(year, month)
+        # Строки, оставшиеся и в таблице после прерванной архивации, свернет fold_new
+        in_table = Scrobble.objects.filter(
+            scrobbled_at__gte=_month_start(year, month), scrobbled_at__lt=_month_start(*_next_month(year, month)),
+        ).values_list('id', flat=True)
+        keep = ~np.isin(columns['id'], np.fromiter(in_table, dtype=np.int64))
+        with transaction.atomic():
+            scrobble_rollups.fold_columns(columns['track_id'][keep], columns['user_id'][keep], columns['ts'][keep])
+
+
+# Чтение архива
+
+def _stamp(path):
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_mtime_ns
+
+
+@lru_cache(maxsize=64)
+def _open(path, inode, mtime_ns):
+    """Колонки месяца как memmap (inode и mtime в ключе сбрасывают кэш при перезаписи)"""
+    names = COLUMNS + ('track_order', 'track_keys')
+    return {
+        name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+        for name in names
+    }
+
+
+def month_columns(year, month):
+    """Колонки заархивированного месяца (memmap) или None"""
+    path = os.path.join(archive_dir(), _month_name(year, month))
+    if not os.path.isdir(path):
+        return None
+    return _open(path, *_stamp(path))
+
+
+def _months(start, end, newest_first=False):
+    """Открытые месяцы архива, пересекающиеся с [start, end)"""
+    months = archived_months()
+    for year, month in reversed(months) if newest_first else months:
+        if end is not None and _month_start(year, month) >= end:
+            continue
+        if start is not None and _month_start(*_next_month(year, month)) <= start:
+            continue
+        yield month_columns(year, month)
+
+
+def _slice(keys, value):
+    return np.searchsorted(keys, value, 'left'), np.searchsorted(keys, value, 'right')
+
+
+def _time_bounds(stamps, start, end):
+    """Границы [start, end) в отсортированном массиве секунд"""
+    lo = np.searchsorted(stamps, _epoch(start), 'left') if start is not None else 0
+    hi = np.searchsorted(stamps, _epoch(end), 'left') if end is not None else len(stamps)
+    return lo, hi
+
+
+def _archived_rows(user_id=None, track_id=None, start=None, end=None, newest_first=False):
+    """(track_id или user_id, ts) из архива для пользователя или трека, по месяцам"""
+    for columns in _months(start, end, newest_first):
+        if user_id is not None:
+            lo, hi = _slice(columns['user_id'], user_id)
+            stamps = columns['ts'][lo:hi]
+            t_lo, t_hi = _time_bounds(stamps, start, end)
+            yield columns['track_id'][lo + t_lo:lo + t_hi], stamps[t_lo:t_hi]
+        else:
+            lo, hi = _slice(columns['track_keys'], track_id)
+            rows = columns['track_order'][lo:hi]
+            stamps = columns['ts'][rows]
+            t_lo, t_hi = _time_bounds(stamps, start, end)
+            yield columns['user_id'][rows[t_lo:t_hi]], stamps[t_lo:t_hi]
+
+
+def _hot(start, end, **lookup):
+    scrobbles = Scrobble.objects.filter(**lookup)
+    if start is not None:
+        scrobbles = scrobbles.filter(scrobbled_at__gte=start)
+    if end is not None:
+        scrobbles = scrobbles.filter(scrobbled_at__lt=end)
+    return scrobbles
+
+
+def count(user_id=None, track_id=None, start=None, end=None):
+    """Число прослушиваний пользователя или трека за [start, end): таблица + архив"""
+    if (user_id is None) == (track_id is None):
+        raise ValueError('Нужен ровно один из user_id и track_id')
+    lookup = {'user_id': user_id} if user_id is not None else {'track_id': track_id}
+    archived = sum(len(stamps) for _, stamps in _archived_rows(user_id, track_id, start, end))
+    return archived + _hot(start, end, **lookup).count()
+
+
+def _history(hot, other_field, archived, limit):
+    """Склейка свежих строк таблицы и архива, новые сначала"""
+    hot = hot.order_by('-scrobbled_at').values_list(other_field, 'scrobbled_at')
+    rows = list(hot[:limit] if limit is not None else hot)
+
+    # Месяцы архива не пересекаются по времени: с limit дальше самых
+    # новых месяцев, набравших limit строк, читать не нужно
+    chunks = []
+    taken = 0
+    for others, stamps in archived:
+        chunks.append((others, stamps))
+        taken += len(stamps)
+        if limit is not None and taken >= limit:
+            break
+    if chunks:
+        others = np.concatenate([others for others, _ in chunks])
+        stamps = np.concatenate([stamps for _, stamps in chunks])
+        order = np.argsort(stamps, kind='stable')[::-1]
+        if limit is not None:
+            order = order[:limit]
+        rows.extend(
+            (int(others[i]), datetime.fromtimestamp(int(stamps[i]), tz=dt_timezone.utc))
+            for i in order
+        )
+    rows.sort(key=lambda row: row[1], reverse=True)
+    return rows[:limit] if limit is not None else rows
+
+
+def user_history(user_id, start=None, end=None, limit=None):
+    """История пользователя: [(track_id, scrobbled_at), ...], новые сначала"""
+    archived = _archived_rows(user_id=user_id, start=start, end=end, newest_first=True)
+    return _history(_hot(start, end, user_id=user_id), 'track_id', archived, limit)
+
+
+def track_history(track_id, start=None, end=None, limit=None):
+    """История трека: [(user_id, scrobbled_at), ...], новые сначала"""
+    archived = _archived_rows(track_id=track_id, start=start, end=end, newest_first=True)
+    return _history(_hot(start, end, track_id=track_id), 'user_id', archived, limit)
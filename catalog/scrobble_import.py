@@ -0,0 +1,302 @@
+"""Импорт истории прослушиваний из выгрузок (CSV, TSV, JSON, NDJSON)
+
+Файл читается потоково (генераторы строк), треки ищутся по названию и
+исполнителю (и релизу, если он есть в выгрузке) через кэш в памяти:
+незнакомые ключи пачки разрешаются одним запросом на пачку, а не на
+строку. Кэш ограничен по размеру, поэтому память не зависит от длины
+файла.
+
+Пачки пишутся через scrobble_ingest.write_batch - одна транзакция на
+пачку с инкрементом play_count и сигналом scrobbles_ingested, как у
+обычного приема. Номер строки после каждой пачки печатается, и с него
+можно продолжить прерванный импорт (offset).
+
+Поддерживаемые поля (первое найденное):
+    исполнитель - artist, artist_name, artistName, master_metadata_album_artist_name
+    трек        - track, title, track_name, trackName, master_metadata_track_name
+    релиз       - album, release, album_name, albumName, master_metadata_album_album_name
+    время       - scrobbled_at, timestamp, uts, ts, date, endTime
+"""
+import csv
+import json
+from collections import OrderedDict
+from datetime import datetime, timezone as dt_timezone
+
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from . import scrobble_ingest
+from .models import Scrobble, Track
+
+FIELDS = {
+    'artist': ('artist', 'artist_name', 'artistName', 'master_metadata_album_artist_name'),
+    'track': ('track', 'title', 'track_name', 'trackName', 'master_metadata_track_name'),
+    'release': ('album', 'release', 'album_name', 'albumName', 'master_metadata_album_album_name'),
+    'time': ('scrobbled_at', 'timestamp', 'uts', 'ts', 'date', 'endTime'),
+}
+
+# Форматы времени, которые не понимает parse_datetime (выгрузки Last.fm, Spotify)
+TIME_FORMATS = ('%d %b %Y %H:%M', '%d %b %Y, %H:%M', '%Y-%m-%d %H:%M')
+
+DEFAULT_CHUNK_SIZE = 5000
+
+# Сколько ключей (исполнитель, трек, релиз) держит кэш
+CACHE_SIZE = 100000
+
+# Сколько байт JSON читается за раз
+READ_SIZE = 1 << 16
+
+
+# Чтение файлов
+
+def _iter_csv(stream, delimiter=','):
+    yield from csv.DictReader(stream, delimiter=delimiter)
+
+
+def _iter_ndjson(stream):
+    for line in stream:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # Битая строка не прерывает импорт: parse_row отклонит ее как invalid,
+                # а нумерация строк для offset не собьется
+                yield None
+
+
+def _iter_json_array(stream):
+    """Элементы JSON-массива по одному, не загружая файл целиком"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    eof = False
+    while True:
+        # Пропускаем пробелы, '[' и запятые между элементами
+        while position < len(buffer) and (buffer[position].isspace() or buffer[position] in ',['):
+            if buffer[position] == '[':
+                started = True
+            position += 1
+        if position < len(buffer) and buffer[position] == ']' and started:
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                if buffer[position:].strip():
+                    raise
+                return
+            chunk = stream.read(READ_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        # Число в конце буфера может быть обрезано - дочитываем
+        if end == len(buffer) and not eof:
+            chunk = stream.read(READ_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        position = end
+        yield item
+
+
+def _iter_json(stream):
+    """JSON-массив или NDJSON - по первому непробельному символу"""
+    head = stream.read(1)
+    while head and head.isspace():
+        head = stream.read(1)
+    if head == '[':
+        yield from _iter_json_array(_Prepend(head, stream))
+    else:
+        yield from _iter_ndjson(_Prepend(head, stream))
+
+
+class _Prepend:
+    """Поток с возвращенным в начало прочитанным фрагментом"""
+
+    def __init__(self, head, stream):
+        self.head = head
+        self.stream = stream
+
+    def read(self, size=-1):
+        head, self.head = self.head, ''
+        return head + self.stream.read(size if size < 0 else max(size - len(head), 0))
+
+    def __iter__(self):
+        head, self.head = self.head, ''
+        lines = iter(self.stream)
+        first = next(lines, '')
+        if head or first:
+            yield head + first
+        yield from lines
+
+
+def read_rows(stream, file_format):
+    """Генератор словарей из потока: file_format - 'csv', 'tsv' или 'json' (массив или NDJSON)"""
+    if file_format == 'csv':
+        return _iter_csv(stream)
+    if file_format == 'tsv':
+        return _iter_csv(stream, delimiter='\t')
+    return _iter_json(stream)
+
+
+def guess_format(path):
+    path = path.lower()
+    if path.endswith('.tsv'):
+        return 'tsv'
+    return 'csv' if path.endswith(('.csv', '.txt')) else 'json'
+
+
+# Разбор строк
+
+def row_field(row, name):
+    """Значение поля name ('artist', 'track', 'release', 'time') под любым из его имен"""
+    for key in FIELDS[name]:
+        value = row.get(key)
+        if value not in (None, ''):
+            return value
+    return None
+
+
+def _key(value):
+    return ' '.join(str(value).split()).casefold() if value else ''
+
+
+def track_key(artist, title, release=None):
+    """Ключ трека для TrackResolver: нормализованные (исполнитель, трек, релиз)"""
+    return _key(artist), _key(title), _key(release)
+
+
+def _parse_time(value):
+    if value is None:
+        raise scrobble_ingest.InvalidScrobble('Нет времени прослушивания')
+    if isinstance(value, str) and value.isdigit():
+        value = int(value)
+    if isinstance(value, (int, float)) and value > 10 ** 11:
+        value = value / 1000  # миллисекунды
+    if isinstance(value, str):
+        for time_format in TIME_FORMATS:
+            try:
+                return datetime.strptime(value, time_format).replace(tzinfo=dt_timezone.utc)
+            except ValueError:
+                pass
+    return scrobble_ingest.parse_time(value)
+
+
+def parse_row(row):
+    """(ключ трека, время) из строки выгрузки; ключ - (исполнитель, трек, релиз)"""
+    if not isinstance(row, dict):
+        raise scrobble_ingest.InvalidScrobble('Строка должна быть объектом')
+    artist, title = row_field(row, 'artist'), row_field(row, 'track')
+    if not artist or not title:
+        raise scrobble_ingest.InvalidScrobble('Нужны исполнитель и название трека')
+    key = track_key(artist, title, row_field(row, 'release'))
+    return key, _parse_time(row_field(row, 'time')), (artist, title)
+
+
+# Поиск треков
+
+class TrackResolver:
+    """Кэш (исполнитель, трек, релиз) -> track_id с пакетным разрешением промахов"""
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self._cache = OrderedDict()
+
+    def _remember(self, key, track_id):
+        self._cache[key] = track_id
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.size:
+            self._cache.popitem(last=False)
+
+    def resolve(self, keys, names):
+        """Словарь ключ -> track_id (или None) для ключей пачки; names - исходные написания"""
+        result = {}
+        missing = set()
+        for key in keys:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                result[key] = self._cache[key]
+            else:
+                missing.add(key)
+        if not missing:
+            return result
+
+        # lower() в SQLite работает только с ASCII, поэтому ищем и по исходному написанию.
+        # Оба условия идут по индексам Track (lower(title) и title)
+        titles = {names[key][1] for key in missing}
+        candidates = (
+            Track.objects.annotate(title_lower=Lower('title'))
+            .filter(Q(title_lower__in={title.lower() for title in titles}) | Q(title__in=titles))
+            .values_list('id', 'title', 'release__title', 'release__artist__name')
+            .order_by('id')
+        )
+        by_name = {}
+        by_release = {}
+        for track_id, title, release_title, artist_name in candidates:
+            by_name.setdefault((_key(artist_name), _key(title)), track_id)
+            by_release.setdefault((_key(artist_name), _key(title), _key(release_title)), track_id)
+
+        for key in missing:
+            track_id = by_release.get(key) or by_name.get(key[:2])
+            self._remember(key, track_id)
+            result[key] = track_id
+        return result
+
+
+# Импорт
+
+def _chunks(rows, size, offset):
+    """Пачки (номер строки после пачки, [строки]) начиная с offset"""
+    chunk = []
+    number = 0
+    for number, row in enumerate(rows, start=1):
+        if number <= offset:
+            continue
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield number, chunk
+            chunk = []
+    if chunk:
+        yield number, chunk
+
+
+def import_rows(rows, user_id, chunk_size=DEFAULT_CHUNK_SIZE, offset=0, progress=None):
+    """Импортирует строки выгрузки для пользователя. Возвращает словарь итогов
+
+    progress(номер строки, итоги) вызывается после каждой записанной пачки.
+    """
+    resolver = TrackResolver()
+    totals = {'imported': 0, 'unmatched': 0, 'invalid': 0, 'unmatched_examples': []}
+
+    for position, chunk in _chunks(rows, chunk_size, offset):
+        parsed = []
+        names = {}
+        for row in chunk:
+            try:
+                key, scrobbled_at, name = parse_row(row)
+            except (ValueError, OverflowError):  # InvalidScrobble - подкласс ValueError
+                totals['invalid'] += 1
+                continue
+            parsed.append((key, scrobbled_at))
+            names.setdefault(key, name)
+
+        track_ids = resolver.resolve({key for key, _ in parsed}, names)
+        batch = []
+        for key, scrobbled_at in parsed:
+            track_id = track_ids[key]
+            if track_id is None:
+                totals['unmatched'] += 1
+                example = ' - '.join(names[key])
+                if len(totals['unmatched_examples']) < 10 and example not in totals['unmatched_examples']:
+                    totals['unmatched_examples'].append(example)
+                continue
+            batch.append(Scrobble(user_id=user_id, track_id=track_id, scrobbled_at=scrobbled_at))
+
+        if batch:
+            totals['imported'] += scrobble_ingest.write_batch(batch)
+        if progress:
+            progress(position, totals)
+    return totals
@@ -0,0 +1,231 @@
+"""Пакетный прием прослушиваний (Scrobble)
+
+Прослушивания складываются в буфер процесса и сбрасываются в базу одной
+транзакцией: bulk_create строк Scrobble плюс F('play_count') + k для
+треков (один UPDATE на каждое различное k). Сброс происходит, когда в
+буфере набралось CATALOG_SCROBBLE_FLUSH_SIZE строк или прошло
+CATALOG_SCROBBLE_FLUSH_INTERVAL_MS миллисекунд с первой строки в буфере.
+При интервале 0 сброс синхронный (удобно для тестов и команд).
+
+После сброса отправляется сигнал scrobbles_ingested со списком
+сохраненных объектов - на него подписываются производные структуры.
+Неизвестные трек/пользователь отбрасываются при сбросе (проверка одним
+запросом на пачку, а не на каждую строку).
+"""
+import atexit
+import hmac
+import json
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.dispatch import Signal
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Scrobble, Track
+
+logger = logging.getLogger(__name__)
+
+# Отправляется после каждого сброса: scrobbles - список сохраненных Scrobble
+scrobbles_ingested = Signal()
+
+# Максимум прослушиваний в одном запросе
+MAX_REQUEST_SIZE = 10000
+
+
+class InvalidScrobble(ValueError):
+    """Некорректная запись в запросе"""
+
+
+# Разбор входных данных
+
+def parse_payload(body):
+    """Список словарей из тела запроса: объект, массив JSON или NDJSON"""
+    try:
+        text = body.decode('utf-8') if isinstance(body, bytes) else body
+    except UnicodeDecodeError:
+        raise InvalidScrobble('Тело запроса должно быть в UTF-8')
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        data = []
+        for number, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                data.append(json.loads(line))
+            except json.JSONDecodeError:
+                raise InvalidScrobble(f'Строка {number}: некорректный JSON')
+    if isinstance(data, dict):
+        data = [data]
+    if not isinstance(data, list):
+        raise InvalidScrobble('Ожидается объект, массив или NDJSON')
+    return data
+
+
+def parse_time(value):
+    """Время из ISO-строки или секунд эпохи (без значения - текущее)"""
+    if value is None:
+        return timezone.now()
+    if isinstance(value, (int, float)):
+        try:
+            return datetime.fromtimestamp(value, tz=dt_timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            raise InvalidScrobble(f'Некорректное время: {value!r}')
+    try:
+        parsed = parse_datetime(str(value))
+    except ValueError:  # формат верный, но дата невозможная (2026-13-45)
+        parsed = None
+    if parsed is None:
+        raise InvalidScrobble(f'Некорректное время: {value!r}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+def build_scrobble(item, default_user_id=None, allow_user=False):
+    """Несохраненный Scrobble из словаря {track, user, scrobbled_at}
+
+    Поле user учитывается только при allow_user (сотрудник или сервисный
+    токен); иначе прослушивание записывается на default_user_id, а чужой
+    user в записи - ошибка.
+    """
+    if not isinstance(item, dict):
+        raise InvalidScrobble('Каждая запись должна быть объектом')
+    user_value = item.get('user', item.get('user_id'))
+    if user_value is None or not allow_user:
+        user_value, claimed = default_user_id, user_value
+        if claimed is not None and str(claimed) != str(default_user_id):
+            raise InvalidScrobble('Прослушивания можно записывать только от своего имени')
+    try:
+        track_id = int(item.get('track', item.get('track_id')))
+        user_id = int(user_value)
+    except (TypeError, ValueError):
+        raise InvalidScrobble('Нужны числовые track и user')
+    scrobbled_at = parse_time(item.get('scrobbled_at', item.get('timestamp')))
+    return Scrobble(user_id=user_id, track_id=track_id, scrobbled_at=scrobbled_at)
+
+
+def has_service_token(request):
+    """Запрос несет сервисный токен CATALOG_SCROBBLE_INGEST_TOKEN (Authorization: Token ...)"""
+    token = getattr(settings, 'CATALOG_SCROBBLE_INGEST_TOKEN', None)
+    if not token:
+        return False
+    scheme, _, value = request.headers.get('Authorization', '').partition(' ')
+    return scheme.lower() == 'token' and hmac.compare_digest(value.strip().encode(), token.encode())
+
+
+# Буфер
+
+class ScrobbleBuffer:
+    """Буфер прослушиваний с периодическим пакетным сбросом"""
+
+    def __init__(self, flush_size, flush_interval_ms):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval_ms / 1000
+        self._items = []
+        self._first_added_at = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def add(self, scrobbles):
+        """Добавляет прослушивания; сбрасывает сразу, если буфер заполнен"""
+        with self._lock:
+            if not self._items:
+                self._first_added_at = time.monotonic()
+            self._items.extend(scrobbles)
+            full = len(self._items) >= self.flush_size
+
+        if full or self.flush_interval <= 0:
+            self.flush()
+        else:
+            self._ensure_thread()
+            self._wakeup.set()
+
+    def __len__(self):
+        return len(self._items)
+
+    def flush(self):
+        """Записывает содержимое буфера в базу. Возвращает число сохраненных строк"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._items = self._items, []
+                self._first_added_at = None
+            if not batch:
+                return 0
+            return write_batch(batch)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name='scrobble-flusher', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            with self._lock:
+                started = self._first_added_at
+            if started is None:
+                continue
+            delay = started + self.flush_interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Не удалось сбросить буфер прослушиваний')
+            finally:
+                close_old_connections()
+
+
+def write_batch(batch):
+    """Одна транзакция: bulk_create прослушиваний и инкременты play_count"""
+    track_ids = {scrobble.track_id for scrobble in batch}
+    user_ids = {scrobble.user_id for scrobble in batch}
+    known_tracks = set(Track.objects.filter(pk__in=track_ids).values_list('pk', flat=True))
+    known_users = set(User.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+
+    valid = [
+        scrobble for scrobble in batch
+        if scrobble.track_id in known_tracks and scrobble.user_id in known_users
+    ]
+    if len(valid) < len(batch):
+        logger.warning('Отброшено %d прослушиваний с неизвестным треком или пользователем',
+                       len(batch) - len(valid))
+    if not valid:
+        return 0
+
+    # Треки с одинаковым приростом обновляются одним UPDATE
+    tracks_by_increment = defaultdict(list)
+    for track_id, k in Counter(scrobble.track_id for scrobble in valid).items():
+        tracks_by_increment[k].append(track_id)
+
+    with transaction.atomic():
+        Scrobble.objects.bulk_create(valid, batch_size=1000)
+        for k, ids in tracks_by_increment.items():
+            Track.objects.filter(pk__in=ids).update(play_count=F('play_count') + k)
+
+    scrobbles_ingested.send(sender=Scrobble, scrobbles=valid)
+    return len(valid)
+
+
+# Общий буфер процесса
+buffer = ScrobbleBuffer(
+    flush_size=getattr(settings, 'CATALOG_SCROBBLE_FLUSH_SIZE', 500),
+    flush_interval_ms=getattr(settings, 'CATALOG_SCROBBLE_FLUSH_INTERVAL_MS', 200),
+)
+
+# Не теряем хвост буфера при штатной остановке процесса
+atexit.register(buffer.flush)
@@ -0,0 +1,281 @@
+"""Свертки прослушиваний по времени
+
+Часовые и дневные счетчики по (корзина, трек) и (корзина, исполнитель),
+плюс дневные по (корзина, пользователь). Графики и чарты за произвольный
+период читают сотни строк свертки вместо сканирования Scrobble.
+
+Свертка догоняет таблицу Scrobble по возрастанию id: отметка
+RollupWatermark хранит последний учтенный id, команда rollup_scrobbles
+сворачивает все, что новее, порциями по CHUNK_SIZE id. Каждая порция -
+одна транзакция вместе со сдвигом отметки, поэтому прерванный запуск
+ничего не посчитает дважды. Опоздавшие прослушивания (со старым
+scrobbled_at, но новым id) попадают в свои старые корзины.
+
+Полная пересборка (rebuild) сворачивает и месяцы холодного архива
+(catalog/scrobble_archive.py) по их колонкам: в таблице этих строк уже нет.
+
+Корзины считаются в UTC. Период запросов округляется до часа: начало -
+вниз, конец - вверх.
+"""
+from collections import Counter
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDate, TruncHour
+
+from .models import (
+    ArtistListensDaily, ArtistListensHourly, RollupWatermark, Scrobble, Track,
+    TrackListensDaily, TrackListensHourly, UserListensDaily,
+)
+
+WATERMARK_NAME = 'scrobbles'
+
+# Сколько id Scrobble сворачивается за одну транзакцию
+CHUNK_SIZE = 50000
+
+# Сколько id в одном pk__in при сворачивании архива
+LOOKUP_CHUNK_SIZE = 5000
+
+# Свертки: (модель, поле объекта в модели, путь к объекту от Scrobble, функция корзины)
+ROLLUPS = (
+    (TrackListensHourly, 'track_id', 'track_id', TruncHour),
+    (TrackListensDaily, 'track_id', 'track_id', TruncDate),
+    (ArtistListensHourly, 'artist_id', 'track__release__artist_id', TruncHour),
+    (ArtistListensDaily, 'artist_id', 'track__release__artist_id', TruncDate),
+    (UserListensDaily, 'user_id', 'user_id', TruncDate),
+)
+
+# Вид объекта -> (часовая модель или None, дневная модель, поле объекта)
+KINDS = {
+    'track': (TrackListensHourly, TrackListensDaily, 'track_id'),
+    'artist': (ArtistListensHourly, ArtistListensDaily, 'artist_id'),
+    'user': (None, UserListensDaily, 'user_id'),
+}
+
+
+# Свертка
+
+def _watermark():
+    watermark, _ = RollupWatermark.objects.get_or_create(name=WATERMARK_NAME)
+    return watermark
+
+
+def _merge(model, field, counts):
+    """Прибавляет counts {(корзина, id объекта): n} к строкам свертки"""
+    if not counts:
+        return
+    buckets = {bucket for bucket, _ in counts}
+    object_ids = {object_id for _, object_id in counts}
+    existing = model.objects.filter(
+        bucket__in=buckets, **{f'{field}__in': object_ids}
+    ).values_list('bucket', field, 'count')
+    for bucket, object_id, n in existing:
+        if (bucket, object_id) in counts:
+            counts[(bucket, object_id)] += n
+
+    # Перезапись суммой в одном INSERT ... ON CONFLICT на пачку
+    model.objects.bulk_create(
+        (
+            model(bucket=bucket, count=n, **{field: object_id})
+            for (bucket, object_id), n in counts.items()
+        ),
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['bucket', field.removesuffix('_id')],
+        update_fields=['count'],
+    )
+
+
+def fold_range(first_id, last_id):
+    """Сворачивает прослушивания с first_id < id <= last_id (без сдвига отметки)"""
+    scrobbles = Scrobble.objects.filter(id__gt=first_id, id__lte=last_id).order_by()
+    for model, field, source, trunc in ROLLUPS:
+        rows = (
+            scrobbles.annotate(bucket=trunc('scrobbled_at', tzinfo=dt_timezone.utc))
+            .values('bucket', source)
+            .annotate(n=Count('id'))
+        )
+        _merge(model, field, Counter({(row['bucket'], row[source]): row['n'] for row in rows}))
+
+
+def fold_new(chunk_size=CHUNK_SIZE, progress=None):
+    """Сворачивает все прослушивания новее отметки. Возвращает число порций"""
+    last_id = Scrobble.objects.aggregate(last=Max('id'))['last'] or 0
+    chunks = 0
+    while True:
+        with transaction.atomic():
+            watermark = _watermark()
+            start = watermark.last_scrobble_id
+            if start >= last_id:
+                return chunks
+            end = min(start + chunk_size, last_id)
+            fold_range(start, end)
+            watermark.last_scrobble_id = end
+            watermark.save(update_fields=['last_scrobble_id', 'updated_at'])
+        chunks += 1
+        if progress:
+            progress(end, last_id)
+
+
+def folded_up_to():
+    """Последний учтенный в свертках id прослушивания"""
+    return _watermark().last_scrobble_id
+
+
+def fold_columns(track_ids, user_ids, stamps):
+    """Сворачивает прослушивания из колонок (массивы track_id, user_id, ts в секундах UTC)
+
+    Для архивных месяцев: строк в таблице уже нет. Прослушивания удаленных
+    треков и пользователей пропускаются, как их пропустила бы таблица.
+    """
+    artist_of = dict(_lookup(Track.objects.values_list('pk', 'release__artist_id'), track_ids))
+    known_users = [pk for pk, in _lookup(User.objects.values_list('pk'), user_ids)]
+
+    # track_id -> исполнитель двоичным поиском по известным трекам
+    known_tracks = np.array(sorted(artist_of), dtype=np.int64)
+    artists = np.array([artist_of[track_id] for track_id in known_tracks.tolist()], dtype=np.int64)
+    positions = np.minimum(np.searchsorted(known_tracks, track_ids), max(len(known_tracks) - 1, 0))
+    track_known = known_tracks[positions] == track_ids if len(known_tracks) else np.zeros(len(track_ids), dtype=bool)
+    user_known = np.isin(user_ids, np.array(known_users, dtype=np.int64))
+    sources = {
+        'track_id': (track_ids, track_known),
+        'track__release__artist_id': (artists[positions] if len(artists) else track_ids, track_known),
+        'user_id': (user_ids, user_known),
+    }
+    for model, field, source, trunc in ROLLUPS:
+        object_ids, known = sources[source]
+        step = 3600 if trunc is TruncHour else 86400
+        keys, counts = np.unique(
+            np.stack([stamps[known] // step, object_ids[known].astype(np.int64)], axis=1), axis=0, return_counts=True
+        )
+        _merge(model, field, Counter({
+            (_bucket(int(bucket) * step, trunc), int(object_id)): int(n)
+            for (bucket, object_id), n in zip(keys, counts)
+        }))
+
+
+def _lookup(rows, ids):
+    """Строки queryset'а для различных ids, порциями pk__in"""
+    unique = np.unique(ids)
+    for start in range(0, len(unique), LOOKUP_CHUNK_SIZE):
+        yield from rows.filter(pk__in=unique[start:start + LOOKUP_CHUNK_SIZE].tolist())
+
+
+def _bucket(seconds, trunc):
+    moment = datetime.fromtimestamp(seconds, tz=dt_timezone.utc)
+    return moment if trunc is TruncHour else moment.date()
+
+
+def rebuild(chunk_size=CHUNK_SIZE, progress=None):
+    """Полная пересборка всех сверток: архивные месяцы из колонок, затем таблица"""
+    from .scrobble_archive import fold_archived  # scrobble_archive импортирует этот модуль
+
+    with transaction.atomic():
+        for model, *_ in ROLLUPS:
+            model.objects.all().delete()
+        RollupWatermark.objects.filter(name=WATERMARK_NAME).delete()
+    fold_archived()
+    return fold_new(chunk_size, progress)
+
+
+def lag():
+    """Сколько прослушиваний еще не свернуто"""
+    return Scrobble.objects.filter(id__gt=_watermark().last_scrobble_id).count()
+
+
+# Запросы
+
+def _floor_hour(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _ceil_hour(moment):
+    floored = _floor_hour(moment)
+    return floored if floored == moment else floored + timedelta(hours=1)
+
+
+def _split(start, end):
+    """Период [start, end) -> (часовые куски по краям, [первый день, день после последнего))
+
+    Целые дни в середине читаются из дневной свертки, неполные края - из
+    часовой. Если целых дней нет, весь период читается по часам.
+    """
+    start = _floor_hour(start.astimezone(dt_timezone.utc))
+    end = _ceil_hour(end.astimezone(dt_timezone.utc))
+    first_day = start.date() if start.hour == 0 else start.date() + timedelta(days=1)
+    last_day = end.date()
+    if first_day >= last_day:
+        return [(start, end)], None
+    edges = [
+        (start, datetime.combine(first_day, time(), dt_timezone.utc)),
+        (datetime.combine(last_day, time(), dt_timezone.utc), end),
+    ]
+    return [(lo, hi) for lo, hi in edges if lo < hi], (first_day, last_day)
+
+
+def _day_range(start, end):
+    """Период для свертки без часовой детализации: целые дни, задевающие [start, end)"""
+    start = start.astimezone(dt_timezone.utc).date()
+    end = end.astimezone(dt_timezone.utc)
+    last_day = end.date() if end.timetz() == time(tzinfo=dt_timezone.utc) else end.date() + timedelta(days=1)
+    return start, last_day
+
+
+def _sources(kind, start, end):
+    """Queryset'ы строк свертки, вместе покрывающие период ровно один раз"""
+    hourly, daily, _ = KINDS[kind]
+    if hourly is None:
+        first_day, last_day = _day_range(start, end)
+        return [daily.objects.filter(bucket__gte=first_day, bucket__lt=last_day)]
+
+    edges, days = _split(start, end)
+    sources = [hourly.objects.filter(bucket__gte=lo, bucket__lt=hi) for lo, hi in edges]
+    if days:
+        sources.append(daily.objects.filter(bucket__gte=days[0], bucket__lt=days[1]))
+    return sources
+
+
+def listens(kind, object_id, start, end):
+    """Число прослушиваний объекта ('track', 'artist', 'user') за период"""
+    field = KINDS[kind][2]
+    return sum(
+        rows.filter(**{field: object_id}).aggregate(n=Sum('count'))['n'] or 0
+        for rows in _sources(kind, start, end)
+    )
+
+
+def top(kind, start, end, limit=10):
+    """Самые прослушиваемые объекты за период: [(id, count), ...]"""
+    field = KINDS[kind][2]
+    totals = Counter()
+    for rows in _sources(kind, start, end):
+        for row in rows.order_by().values(field).annotate(n=Sum('count')):
+            totals[row[field]] += row['n']
+    return totals.most_common(limit)
+
+
+def series(kind, object_id, start, end, granularity='day'):
+    """Ряд для графика: [(корзина, count), ...] по часам или по дням, без пропусков"""
+    hourly, daily, field = KINDS[kind]
+    if granularity == 'hour':
+        if hourly is None:
+            raise ValueError(f'Для {kind} нет часовой свертки')
+        lo = _floor_hour(start.astimezone(dt_timezone.utc))
+        hi = _ceil_hour(end.astimezone(dt_timezone.utc))
+        step = timedelta(hours=1)
+        rows = hourly.objects.filter(bucket__gte=lo, bucket__lt=hi)
+    else:
+        lo, hi = _day_range(start, end)
+        step = timedelta(days=1)
+        rows = daily.objects.filter(bucket__gte=lo, bucket__lt=hi)
+
+    counts = dict(rows.filter(**{field: object_id}).values_list('bucket', 'count'))
+    result = []
+    bucket = lo
+    while bucket < hi:
+        result.append((bucket, counts.get(bucket, 0)))
+        bucket += step
+    return result
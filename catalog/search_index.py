@@ -0,0 +1,185 @@
+"""Полнотекстовый поиск по каталогу (SQLite FTS5)
+
+Индекс состоит из трех виртуальных таблиц FTS5 (создаются миграцией 0010),
+rowid каждой строки совпадает с pk объекта. В документы треков и релизов
+денормализованы названия релиза и имя исполнителя, поэтому поиск не делает
+JOIN и LIKE '%q%' по основным таблицам. Синхронизация - через сигналы
+(catalog/signals.py), полная пересборка - команда rebuild_search_index.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Case, IntegerField, When
+
+from .models import Artist, Release, Track
+
+# Результатов на странице поиска по умолчанию
+DEFAULT_LIMIT = 50
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Таблица, колонки документа и SQL, из которого строятся документы
+INDEXES = {
+    'track': {
+        'table': 'catalog_track_fts',
+        'columns': ('title', 'release_title', 'artist_name'),
+        'weights': (10.0, 4.0, 4.0),
+        'key': 't.id',
+        'fields': 't.title, r.title, a.name',
+        'from': (
+            'catalog_track t '
+            'JOIN catalog_release r ON r.id = t.release_id '
+            'JOIN catalog_artist a ON a.id = r.artist_id'
+        ),
+    },
+    'release': {
+        'table': 'catalog_release_fts',
+        'columns': ('title', 'artist_name'),
+        'weights': (10.0, 4.0),
+        'key': 'r.id',
+        'fields': 'r.title, a.name',
+        'from': 'catalog_release r JOIN catalog_artist a ON a.id = r.artist_id',
+    },
+    'artist': {
+        'table': 'catalog_artist_fts',
+        'columns': ('name', 'biography'),
+        'weights': (10.0, 1.0),
+        'key': 'a.id',
+        'fields': "a.name, COALESCE(a.biography, '')",
+        'from': 'catalog_artist a',
+    },
+}
+
+
+def build_match(query, columns=None):
+    """Превращает пользовательский ввод в безопасное выражение MATCH.
+
+    Каждое слово берется в кавычки (спецсимволы FTS5 не интерпретируются)
+    и ищется как префикс, слова объединяются через AND.
+    Возвращает None, если в запросе нет ни одного слова.
+    """
+    tokens = TOKEN_RE.findall(query or '')
+    if not tokens:
+        return None
+    expression = ' '.join(f'"{token}"*' for token in tokens)
+    if columns:
+        expression = '{%s} : (%s)' % (' '.join(columns), expression)
+    return expression
+
+
+def ranked_ids(kind, query, columns=None, limit=DEFAULT_LIMIT, offset=0, where=None, params=()):
+    """pk объектов, найденных по запросу, в порядке релевантности (bm25)
+
+    where - дополнительное SQL-условие, pk строки в нем - {table}.rowid.
+    """
+    match = build_match(query, columns)
+    if match is None:
+        return []
+
+    index = INDEXES[kind]
+    weights = ', '.join(str(weight) for weight in index['weights'])
+    condition = f" AND ({where.format(table=index['table'])})" if where else ''
+    sql = (
+        f"SELECT rowid FROM {index['table']} "
+        f"WHERE {index['table']} MATCH %s{condition} "
+        f"ORDER BY bm25({index['table']}, {weights}) "
+        f"LIMIT %s OFFSET %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match, *params, limit, offset])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def in_rank_order(queryset, ids):
+    """Ограничивает queryset списком pk и сохраняет их порядок"""
+    if not ids:
+        return queryset.none()
+    ordering = Case(
+        *[When(pk=pk, then=position) for position, pk in enumerate(ids)],
+        output_field=IntegerField(),
+    )
+    return queryset.filter(pk__in=ids).order_by(ordering)
+
+
+def search_tracks(query, columns=('title', 'release_title'), limit=DEFAULT_LIMIT):
+    """Треки по запросу, отсортированные по релевантности"""
+    ids = ranked_ids('track', query, columns, limit)
+    return in_rank_order(Track.objects.select_related('release__artist'), ids)
+
+
+def search_artists(query, columns=('name', 'biography'), limit=DEFAULT_LIMIT):
+    """Исполнители по запросу, отсортированные по релевантности"""
+    ids = ranked_ids('artist', query, columns, limit)
+    return in_rank_order(Artist.objects.all(), ids)
+
+
+def search_releases(query, columns=('title', 'artist_name'), limit=DEFAULT_LIMIT):
+    """Релизы по запросу, отсортированные по релевантности"""
+    ids = ranked_ids('release', query, columns, limit)
+    return in_rank_order(Release.objects.select_related('artist'), ids)
+
+
+# Синхронизация индекса
+
+def _refresh(kind, where, params):
+    """Перестраивает документы, исходные строки которых подходят под where"""
+    index = INDEXES[kind]
+    table = index['table']
+    columns = ', '.join(index['columns'])
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {table} WHERE rowid IN "
+            f"(SELECT {index['key']} FROM {index['from']} WHERE {where})",
+            params,
+        )
+        cursor.execute(
+            f"INSERT INTO {table}(rowid, {columns}) "
+            f"SELECT {index['key']}, {index['fields']} FROM {index['from']} WHERE {where}",
+            params,
+        )
+
+
+def index_track(track_id):
+    """Обновляет документ трека"""
+    _refresh('track', 't.id = %s', [track_id])
+
+
+def index_release(release_id, with_tracks=True):
+    """Обновляет документ релиза и (по умолчанию) документы его треков"""
+    _refresh('release', 'r.id = %s', [release_id])
+    if with_tracks:
+        _refresh('track', 't.release_id = %s', [release_id])
+
+
+def index_artist(artist_id, with_related=True):
+    """Обновляет документ исполнителя и документы его релизов и треков"""
+    _refresh('artist', 'a.id = %s', [artist_id])
+    if with_related:
+        _refresh('release', 'r.artist_id = %s', [artist_id])
+        _refresh('track', 'r.artist_id = %s', [artist_id])
+
+
+def unindex(kind, object_id):
+    """Удаляет документ из индекса"""
+    table = INDEXES[kind]['table']
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE rowid = %s', [object_id])
+
+
+def rebuild():
+    """Полная пересборка индекса. Возвращает число документов по типам"""
+    counts = {}
+    with connection.cursor() as cursor:
+        for kind, index in INDEXES.items():
+            table = index['table']
+            columns = ', '.join(index['columns'])
+            cursor.execute(f'DELETE FROM {table}')
+            cursor.execute(
+                f"INSERT INTO {table}(rowid, {columns}) "
+                f"SELECT {index['key']}, {index['fields']} FROM {index['from']}"
+            )
+            cursor.execute(f"INSERT INTO {table}({table}) VALUES ('optimize')")
+            cursor.execute(f'SELECT COUNT(*) FROM {table}')
+            counts[kind] = cursor.fetchone()[0]
+    return counts
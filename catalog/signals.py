@@ -0,0 +1,413 @@
+"""Обработчики сигналов моделей каталога
+
+Подключаются в CatalogConfig.ready(). Здесь поддерживаются в актуальном
+состоянии производные структуры (поисковый индекс и т.п.).
+"""
+from collections import Counter
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import (
+    autocomplete, facets, fuzzy_search, heavy_hitters, listener_sketches, playlist_stats,
+    scrobble_ingest, search_index, similar_artists, smart_playlists, stats, widget_cache,
+)
+from .models import Artist, Genre, Label, PlaylistEntry, Release, SmartPlaylist, SmartPlaylistMember, Track
+
+
+def _remember_old_values(instance, fields, attribute='_old_values'):
+    """Сохраняет на экземпляре значения полей до изменения (для сравнения в post_save)"""
+    old_values = None
+    if instance.pk:
+        old_values = type(instance).objects.filter(pk=instance.pk).values(*fields).first()
+    setattr(instance, attribute, old_values)
+
+
+def _changed(instance, fields):
+    """Изменилось ли хотя бы одно из полей с момента pre_save"""
+    old = getattr(instance, '_old_values', None)
+    if old is None:
+        return True
+    return any(old[field] != getattr(instance, field) for field in fields)
+
+
+# Поисковые индексы (полнотекстовый, триграммный и автодополнение)
+
+ARTIST_SEARCH_FIELDS = ['name', 'biography']
+RELEASE_SEARCH_FIELDS = ['title', 'artist_id']
+
+
+@receiver(pre_save, sender=Artist)
+def artist_pre_save(sender, instance, **kwargs):
+    _remember_old_values(instance, ARTIST_SEARCH_FIELDS)
+
+
+@receiver(post_save, sender=Artist)
+def artist_saved(sender, instance, created, **kwargs):
+    if _changed(instance, ARTIST_SEARCH_FIELDS):
+        # Имя исполнителя денормализовано в документы релизов и треков
+        search_index.index_artist(instance.pk, with_related=not created)
+        fuzzy_search.index_object('artist', instance.pk, instance.name)
+    if autocomplete.index.loaded:
+        autocomplete.index.update(
+            'artist', instance.pk, instance.name, weight=instance.popularity_score
+        )
+
+
+@receiver(post_delete, sender=Artist)
+def artist_deleted(sender, instance, **kwargs):
+    search_index.unindex('artist', instance.pk)
+    fuzzy_search.unindex_object('artist', instance.pk)
+    autocomplete.index.remove('artist', instance.pk)
+
+
+@receiver(pre_save, sender=Release)
+def release_pre_save(sender, instance, **kwargs):
+    _remember_old_values(instance, RELEASE_SEARCH_FIELDS)
+
+
+@receiver(post_save, sender=Release)
+def release_saved(sender, instance, created, **kwargs):
+    if _changed(instance, RELEASE_SEARCH_FIELDS):
+        search_index.index_release(instance.pk, with_tracks=not created)
+        fuzzy_search.index_object('release', instance.pk, instance.title)
+        if autocomplete.index.loaded:
+            autocomplete.index.update('release', instance.pk, instance.title, instance.artist.name)
+
+
+@receiver(post_delete, sender=Release)
+def release_deleted(sender, instance, **kwargs):
+    search_index.unindex('release', instance.pk)
+    fuzzy_search.unindex_object('release', instance.pk)
+    autocomplete.index.remove('release', instance.pk)
+
+
+@receiver(post_save, sender=Track)
+def track_saved(sender, instance, **kwargs):
+    search_index.index_track(instance.pk)
+    fuzzy_search.index_object('track', instance.pk, instance.title)
+    if autocomplete.index.loaded:
+        autocomplete.index.update(
+            'track', instance.pk, instance.title,
+            instance.release.artist.name, weight=instance.play_count,
+        )
+
+
+@receiver(post_delete, sender=Track)
+def track_deleted(sender, instance, **kwargs):
+    search_index.unindex('track', instance.pk)
+    fuzzy_search.unindex_object('track', instance.pk)
+    autocomplete.index.remove('track', instance.pk)
+
+
+# Свертка фасетов: снимок вклада треков до изменения и применение разницы после
+
+@receiver(pre_save, sender=Track)
+def track_facets_pre_save(sender, instance, **kwargs):
+    instance._facets_before = (
+        facets.snapshot(Track.objects.filter(pk=instance.pk)) if instance.pk else {}
+    )
+
+
+@receiver(post_save, sender=Track)
+def track_facets_saved(sender, instance, **kwargs):
+    before = getattr(instance, '_facets_before', {})
+    facets.apply_delta(before, facets.snapshot(Track.objects.filter(pk=instance.pk)))
+
+
+@receiver(pre_delete, sender=Track)
+def track_facets_pre_delete(sender, instance, **kwargs):
+    instance._facets_before = facets.snapshot(Track.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Track)
+def track_facets_deleted(sender, instance, **kwargs):
+    facets.apply_delta(getattr(instance, '_facets_before', {}), {})
+
+
+@receiver(pre_save, sender=Release)
+def release_facets_pre_save(sender, instance, **kwargs):
+    instance._facets_before = (
+        facets.snapshot(Track.objects.filter(release_id=instance.pk)) if instance.pk else {}
+    )
+
+
+@receiver(post_save, sender=Release)
+def release_facets_saved(sender, instance, created, **kwargs):
+    if not created:
+        after = facets.snapshot(Track.objects.filter(release_id=instance.pk))
+        facets.apply_delta(getattr(instance, '_facets_before', {}), after)
+
+
+@receiver(pre_delete, sender=Label)
+def label_facets_pre_delete(sender, instance, **kwargs):
+    facets.move_label_to_none(instance)
+
+
+def _genre_change_tracks(instance, reverse, pk_set):
+    """Треки, затронутые изменением Track.genres"""
+    if not reverse:
+        return Track.objects.filter(pk=instance.pk)
+    if pk_set is None:  # genre.tracks.clear()
+        return Track.objects.filter(pk__in=list(instance.tracks.values_list('pk', flat=True)))
+    return Track.objects.filter(pk__in=pk_set)
+
+
+@receiver(m2m_changed, sender=Track.genres.through)
+def track_genres_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('pre_add', 'pre_remove', 'pre_clear'):
+        tracks = _genre_change_tracks(instance, reverse, pk_set)
+        instance._facets_genre_change = (tracks, facets.snapshot(tracks))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        tracks, before = instance._facets_genre_change
+        facets.apply_delta(before, facets.snapshot(tracks))
+
+
+# Мост исполнитель-жанр: пересчет строк исполнителей, чьи треки изменились
+
+@receiver(post_save, sender=Track)
+def track_artist_genres_saved(sender, instance, created, **kwargs):
+    old = getattr(instance, '_old_values', None)  # запомнены в track_stats_pre_save
+    if created or old is None or old['release_id'] == instance.release_id:
+        return  # у нового трека еще нет жанров, без смены релиза мост не меняется
+    artist_ids = set(
+        Release.objects.filter(pk__in=[old['release_id'], instance.release_id]).values_list('artist_id', flat=True)
+    )
+    if len(artist_ids) > 1:  # трек перенесен в релиз другого исполнителя
+        similar_artists.refresh_genres(artist_ids)
+
+
+@receiver(pre_delete, sender=Track)
+def track_artist_genres_pre_delete(sender, instance, **kwargs):
+    instance._genre_artists_before = similar_artists.artists_of(Track.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Track)
+def track_artist_genres_deleted(sender, instance, **kwargs):
+    similar_artists.refresh_genres(getattr(instance, '_genre_artists_before', set()))
+
+
+@receiver(post_save, sender=Release)
+def release_artist_genres_saved(sender, instance, created, **kwargs):
+    old = getattr(instance, '_old_values', None)  # запомнены в release_pre_save
+    if not created and old is not None and old['artist_id'] != instance.artist_id:
+        similar_artists.refresh_genres({old['artist_id'], instance.artist_id})
+
+
+@receiver(m2m_changed, sender=Track.genres.through)
+def track_genres_artists_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('pre_add', 'pre_remove', 'pre_clear'):
+        tracks = _genre_change_tracks(instance, reverse, pk_set)
+        instance._genre_change_artists = similar_artists.artists_of(tracks)
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        similar_artists.refresh_genres(instance._genre_change_artists)
+
+
+# Кэш виджетов главной страницы
+
+def invalidate_widgets(sender, **kwargs):
+    if kwargs.get('action', 'post_').startswith('post_'):
+        widget_cache.invalidate_for(sender)
+
+
+for model in (Artist, Release, Track, Genre):
+    post_save.connect(invalidate_widgets, sender=model, dispatch_uid=f'widgets_saved_{model.__name__}')
+    post_delete.connect(invalidate_widgets, sender=model, dispatch_uid=f'widgets_deleted_{model.__name__}')
+m2m_changed.connect(invalidate_widgets, sender=Track.genres.through, dispatch_uid='widgets_track_genres')
+
+
+# Статистика каталога
+
+# release_id - для моста исполнитель-жанр (track_artist_genres_saved)
+TRACK_STATS_FIELDS = ['duration_seconds', 'status', 'release_id']
+
+
+@receiver(post_save, sender=Artist)
+def artist_stats_saved(sender, instance, created, **kwargs):
+    if created:
+        stats.apply(artist_count=1)
+
+
+@receiver(post_delete, sender=Artist)
+def artist_stats_deleted(sender, instance, **kwargs):
+    stats.apply(artist_count=-1)
+
+
+@receiver(post_save, sender=Release)
+def release_stats_saved(sender, instance, created, **kwargs):
+    if created:
+        stats.apply(release_count=1)
+
+
+@receiver(post_delete, sender=Release)
+def release_stats_deleted(sender, instance, **kwargs):
+    stats.apply(release_count=-1)
+
+
+@receiver(pre_save, sender=Track)
+def track_stats_pre_save(sender, instance, **kwargs):
+    _remember_old_values(instance, TRACK_STATS_FIELDS)
+
+
+@receiver(post_save, sender=Track)
+def track_stats_saved(sender, instance, created, **kwargs):
+    deltas = Counter(stats.track_deltas(instance.duration_seconds, instance.status))
+    old = getattr(instance, '_old_values', None)
+    if old is not None:
+        deltas.update(stats.track_deltas(old['duration_seconds'], old['status'], sign=-1))
+    stats.apply(**deltas)
+
+
+@receiver(post_delete, sender=Track)
+def track_stats_deleted(sender, instance, **kwargs):
+    stats.apply(**stats.track_deltas(instance.duration_seconds, instance.status, sign=-1))
+
+
+# Итоги плейлистов (число треков и длительность)
+
+@receiver(m2m_changed, sender=PlaylistEntry)
+def playlist_tracks_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # Удаление учитывается в playlist_entry_deleted: remove()/clear() удаляют строки PlaylistEntry
+    if action == 'post_add' and pk_set:
+        if reverse:
+            playlist_stats.added_to_playlists(instance.pk, pk_set)
+        else:
+            playlist_stats.added(instance.pk, pk_set)
+
+
+@receiver(post_save, sender=PlaylistEntry)
+def playlist_entry_saved(sender, instance, created, **kwargs):
+    if created:
+        playlist_stats.added(instance.playlist_id, [instance.track_id])
+
+
+@receiver(post_delete, sender=PlaylistEntry)
+def playlist_entry_deleted(sender, instance, **kwargs):
+    playlist_stats.removed(instance)
+
+
+@receiver(post_save, sender=Track)
+def track_playlist_stats_saved(sender, instance, created, **kwargs):
+    old = getattr(instance, '_old_values', None)  # запомнены в track_stats_pre_save
+    if not created and old is not None and old['duration_seconds'] != instance.duration_seconds:
+        playlist_stats.duration_changed(instance.pk, instance.duration_seconds - old['duration_seconds'])
+
+
+# Смарт-плейлисты: перепроверка затронутых треков в зависящих от изменений плейлистах
+
+@receiver(pre_save, sender=SmartPlaylist)
+def smart_playlist_pre_save(sender, instance, **kwargs):
+    smart_playlists.validate(instance)  # некорректные правила не сохраняем
+    instance.rule_fields = smart_playlists.rule_fields_key(instance.rules)
+    _remember_old_values(instance, ['rules', 'order_by'], '_smart_rules_before')
+
+
+@receiver(post_save, sender=SmartPlaylist)
+def smart_playlist_saved(sender, instance, **kwargs):
+    old = instance._smart_rules_before
+    if old is None or old['rules'] != instance.rules or old['order_by'] != instance.order_by:
+        smart_playlists.rebuild(instance)
+
+
+@receiver(pre_save, sender=Track)
+def track_smart_pre_save(sender, instance, **kwargs):
+    _remember_old_values(instance, list(smart_playlists.TRACK_DEPENDENCIES), '_smart_before')
+
+
+@receiver(post_save, sender=Track)
+def track_smart_saved(sender, instance, **kwargs):
+    fields = smart_playlists.changed_fields(instance._smart_before, instance, smart_playlists.TRACK_DEPENDENCIES)
+    smart_playlists.retest([instance.pk], fields)
+
+
+@receiver(pre_delete, sender=Track)
+def track_smart_pre_delete(sender, instance, **kwargs):
+    # Членство удаляется каскадом, счетчик плейлистов уменьшаем сами
+    instance._smart_playlist_ids = list(
+        SmartPlaylistMember.objects.filter(track=instance).values_list('smart_playlist_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Track)
+def track_smart_deleted(sender, instance, **kwargs):
+    smart_playlists.forget_track(instance._smart_playlist_ids)
+
+
+@receiver(pre_save, sender=Release)
+def release_smart_pre_save(sender, instance, **kwargs):
+    _remember_old_values(instance, list(smart_playlists.RELEASE_DEPENDENCIES), '_smart_before')
+
+
+@receiver(post_save, sender=Release)
+def release_smart_saved(sender, instance, created, **kwargs):
+    if not created:  # у нового релиза еще нет треков
+        fields = smart_playlists.changed_fields(
+            instance._smart_before, instance, smart_playlists.RELEASE_DEPENDENCIES
+        )
+        smart_playlists.retest(Track.objects.filter(release=instance), fields)
+
+
+# Название исполнителя, лейбла или жанра -> треки, у которых оно в правилах
+SMART_NAMED = {
+    Artist: ('artist', lambda instance: Track.objects.filter(release__artist=instance)),
+    Label: ('label', lambda instance: Track.objects.filter(release__label=instance)),
+    Genre: ('genre', lambda instance: Track.objects.filter(genres=instance)),
+}
+
+
+def smart_named_pre_save(sender, instance, **kwargs):
+    _remember_old_values(instance, ['name'], '_smart_before')
+
+
+def smart_named_saved(sender, instance, created, **kwargs):
+    if not created and instance._smart_before['name'] != instance.name:
+        field, tracks = SMART_NAMED[sender]
+        smart_playlists.retest(tracks(instance), {field})
+
+
+def smart_named_pre_delete(sender, instance, **kwargs):
+    # Строки связей удаляются без m2m-сигналов (жанр) или обнуляются (лейбл релизов)
+    field, tracks = SMART_NAMED[sender]
+    instance._smart_tracks = list(tracks(instance).values_list('pk', flat=True))
+
+
+def smart_named_deleted(sender, instance, **kwargs):
+    field, _ = SMART_NAMED[sender]
+    smart_playlists.retest(instance._smart_tracks, {field})
+
+
+for model in SMART_NAMED:
+    name = model.__name__
+    pre_save.connect(smart_named_pre_save, sender=model, dispatch_uid=f'smart_pre_save_{name}')
+    post_save.connect(smart_named_saved, sender=model, dispatch_uid=f'smart_saved_{name}')
+for model in (Label, Genre):  # треки исполнителя удаляются каскадом вместе с членством
+    name = model.__name__
+    pre_delete.connect(smart_named_pre_delete, sender=model, dispatch_uid=f'smart_pre_delete_{name}')
+    post_delete.connect(smart_named_deleted, sender=model, dispatch_uid=f'smart_deleted_{name}')
+
+
+@receiver(m2m_changed, sender=Track.genres.through)
+def track_genres_smart_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('pre_add', 'pre_remove', 'pre_clear'):
+        tracks = _genre_change_tracks(instance, reverse, pk_set)
+        instance._smart_genre_tracks = list(tracks.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        smart_playlists.retest(instance._smart_genre_tracks, {'genre'})
+
+
+@receiver(scrobble_ingest.scrobbles_ingested)
+def smart_playlists_ingested(sender, scrobbles, **kwargs):
+    # play_count увеличивается F()-выражением без сигналов Track
+    smart_playlists.retest({scrobble.track_id for scrobble in scrobbles}, {'play_count'})
+
+
+# Уникальные слушатели (HyperLogLog): пополняются при приеме прослушиваний
+
+@receiver(scrobble_ingest.scrobbles_ingested)
+def listener_sketches_ingested(sender, scrobbles, **kwargs):
+    listener_sketches.record(scrobbles)
+
+
+@receiver(scrobble_ingest.scrobbles_ingested)
+def heavy_hitters_ingested(sender, scrobbles, **kwargs):
+    heavy_hitters.tracker.record(scrobbles)
@@ -0,0 +1,150 @@
+"""Похожие исполнители по жанрам и совместным прослушиваниям
+
+Мост ArtistGenre хранит для каждой пары (исполнитель, жанр) число треков
+исполнителя в жанре. Он поддерживается сигналами (пересчет строк
+затронутых исполнителей) и отвечает на "исполнители жанра" одним
+индексным запросом вместо join'а через релизы, треки и жанры с DISTINCT.
+
+Вектор признаков исполнителя складывается из двух частей:
+- распределение его треков по жанрам (из моста), нормированное;
+- совместные прослушивания: log(1 + число прослушиваний) каждым
+  пользователем, по таблице и архиву (recommendations.listen_counts).
+Близость - взвешенная сумма косинусов по обеим частям (GENRE_WEIGHT и
+LISTEN_WEIGHT). Команда build_similar_artists считает ее блоками через
+NumPy и сохраняет TOP_K соседей каждого исполнителя в SimilarArtist,
+заменяя соседей блока исполнителей в отдельной короткой транзакции.
+"""
+import numpy as np
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Artist, ArtistGenre, SimilarArtist, Track
+from .recommendations import BLOCK_CELLS, CosineIndex, listen_counts, ranked
+
+TOP_K = 20
+GENRE_WEIGHT = 0.4
+LISTEN_WEIGHT = 0.6
+
+
+# Мост исполнитель-жанр
+
+def artists_of(tracks):
+    """id исполнителей треков из queryset"""
+    return set(tracks.order_by().values_list('release__artist_id', flat=True).distinct())
+
+
+def _genre_counts(artist_ids=None):
+    """[(artist_id, genre_id, число треков)]"""
+    rows = Track.genres.through.objects.order_by()
+    if artist_ids is not None:
+        rows = rows.filter(track__release__artist_id__in=artist_ids)
+    return rows.values_list('track__release__artist_id', 'genre_id').annotate(n=Count('track_id'))
+
+
+def refresh_genres(artist_ids):
+    """Пересчитывает строки моста для исполнителей"""
+    artist_ids = [artist_id for artist_id in artist_ids if artist_id is not None]
+    if not artist_ids:
+        return
+    with transaction.atomic():
+        ArtistGenre.objects.filter(artist_id__in=artist_ids).delete()
+        ArtistGenre.objects.bulk_create(
+            ArtistGenre(artist_id=artist_id, genre_id=genre_id, track_count=n)
+            for artist_id, genre_id, n in _genre_counts(artist_ids)
+        )
+
+
+def rebuild_genres():
+    """Полная пересборка моста. Возвращает число строк"""
+    with transaction.atomic():
+        ArtistGenre.objects.all().delete()
+        created = ArtistGenre.objects.bulk_create(
+            (
+                ArtistGenre(artist_id=artist_id, genre_id=genre_id, track_count=n)
+                for artist_id, genre_id, n in _genre_counts()
+            ),
+            batch_size=1000,
+        )
+    return len(created)
+
+
+def artists_in_genre(genre):
+    """Исполнители жанра по мосту (без DISTINCT)"""
+    return Artist.objects.filter(genre_links__genre=genre)
+
+
+# Векторы и соседи
+
+def _genre_vectors(artist_ids):
+    """Нормированные распределения по жанрам: плотная матрица artist_ids x жанры"""
+    rows = np.array(
+        list(ArtistGenre.objects.values_list('artist_id', 'genre_id', 'track_count')), dtype=np.int64
+    ).reshape(-1, 3)
+    # Исполнители, добавленные после снимка artist_ids, в этот расчет не входят
+    rows = rows[np.isin(rows[:, 0], artist_ids)]
+    genre_ids, genre_index = np.unique(rows[:, 1], return_inverse=True)
+    vectors = np.zeros((len(artist_ids), len(genre_ids)))
+    vectors[np.searchsorted(artist_ids, rows[:, 0]), genre_index] = rows[:, 2]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=vectors, where=norms > 0)
+
+
+def _listen_index(artist_ids):
+    """CosineIndex исполнители x пользователи по прослушиваниям (только исполнители из artist_ids)"""
+    users, tracks, counts = listen_counts()
+    track_artist = np.array(list(Track.objects.values_list('pk', 'release__artist_id')), dtype=np.int64).reshape(-1, 2)
+    lookup = np.full(max(int(track_artist[:, 0].max(initial=0)), int(tracks.max(initial=0))) + 1, -1, dtype=np.int64)
+    lookup[track_artist[:, 0]] = track_artist[:, 1]
+
+    artists = lookup[tracks]
+    known = np.isin(artists, artist_ids)  # -1 - трек удален, новые исполнители - не в снимке
+    keys, inverse = np.unique((artists[known] << 32) | users[known], return_inverse=True)
+    totals = np.bincount(inverse, weights=counts[known])
+    return CosineIndex(keys >> 32, keys & 0xFFFFFFFF, np.log1p(totals))
+
+
+def build(progress=None):
+    """Пересчитывает похожих исполнителей. Возвращает число исполнителей"""
+    artist_ids = np.array(sorted(Artist.objects.values_list('pk', flat=True)), dtype=np.int64)
+    genres = _genre_vectors(artist_ids)
+    listens = _listen_index(artist_ids)
+    # Столбцы матрицы прослушиваний -> номера в artist_ids
+    listen_columns = np.searchsorted(artist_ids, listens.ids)
+
+    block = max(1, BLOCK_CELLS // max(len(artist_ids), 1))
+    for start in range(0, len(artist_ids), block):
+        rows = np.arange(start, min(start + block, len(artist_ids)))
+        scores = GENRE_WEIGHT * (genres[rows] @ genres.T)
+
+        listen_rows = listens.index_of(artist_ids[rows])
+        if len(listen_rows):
+            local = np.searchsorted(artist_ids[rows], listens.ids[listen_rows])
+            scores[local[:, None], listen_columns[None, :]] += LISTEN_WEIGHT * listens.similarities(listen_rows)
+
+        scores[np.arange(len(rows)), rows] = 0  # сам себе не похож
+        links = [
+            SimilarArtist(artist_id=int(artist_ids[row]), similar_id=similar_id, score=score, rank=rank)
+            for local_row, row in enumerate(rows)
+            for rank, (similar_id, score) in enumerate(ranked(scores[local_row], artist_ids, TOP_K), start=1)
+        ]
+        # Транзакция на блок: блокировка записи SQLite держится только на время
+        # замены соседей блока, а не всего расчета (прием прослушиваний не ждет)
+        with transaction.atomic():
+            SimilarArtist.objects.filter(
+                artist_id__gte=int(artist_ids[rows[0]]), artist_id__lte=int(artist_ids[rows[-1]])
+            ).delete()
+            SimilarArtist.objects.bulk_create(links, batch_size=1000)
+        if progress:
+            progress(rows[-1] + 1, len(artist_ids))
+    return len(artist_ids)
+
+
+# Чтение
+
+def similar_to(artist, limit=10):
+    """Похожие исполнители по рангу (один запрос по индексу)"""
+    return [
+        link.similar
+        for link in SimilarArtist.objects.filter(artist=artist, rank__lte=limit)
+        .select_related('similar').order_by('rank')
+    ]
@@ -0,0 +1,348 @@
+"""Смарт-плейлисты: состав задается правилами и поддерживается инкрементально
+
+Правила - JSON: группа {"all" | "any" | "none": [...]} из условий
+[поле, оператор, значение] и вложенных групп, например "опубликованный
+джаз короче 5 минут с релизов после 2020 года":
+
+    {"all": [["genre", "=", "Jazz"], ["status", "=", "published"],
+             ["duration", "<", 300], ["year", ">", 2020]]}
+
+compile_rules() переводит их в Q для Track. Сортировка (order_by) и
+лимит хранятся отдельно: "топ 200 по прослушиваниям" - order_by
+'-play_count', limit 200.
+
+Все подходящие треки материализуются в SmartPlaylistMember вместе с
+ключом сортировки, а лимит применяется при чтении по индексу
+(smart_playlist, sort_value). Поэтому изменение одного трека требует
+перепроверить только его: сигналы Track/Release/Artist/Label/Genre и
+прием прослушиваний вызывают retest() для затронутых треков и только для
+плейлистов, в чьих правилах есть изменившиеся поля (SmartPlaylist.rule_fields);
+поле сортировки обновляется у всех членов одним UPDATE.
+Массовые queryset.update() сигналов не шлют - полную пересборку делает
+команда rebuild_smart_playlists.
+"""
+from contextlib import contextmanager
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .models import SmartPlaylist, SmartPlaylistMember, Track
+
+# Поле правил -> путь для Track
+FIELDS = {
+    'title': 'title',
+    'artist': 'release__artist__name',
+    'release': 'release__title',
+    'label': 'release__label__name',
+    'year': 'release__release_year',
+    'format': 'release__format',
+    'status': 'status',
+    'duration': 'duration_seconds',
+    'play_count': 'play_count',
+    'featured': 'featured',
+    'genre': 'genres__name',  # проверяется подзапросом, см. _condition
+}
+
+# Оператор -> (lookup, с отрицанием)
+OPERATORS = {
+    '=': ('exact', False),
+    '!=': ('exact', True),
+    '<': ('lt', False),
+    '<=': ('lte', False),
+    '>': ('gt', False),
+    '>=': ('gte', False),
+    'in': ('in', False),
+    'not in': ('in', True),
+    'contains': ('icontains', False),
+    'startswith': ('istartswith', False),
+}
+
+GROUPS = ('all', 'any', 'none')
+
+# Ключ сортировки (order_by без '-') -> путь для Track
+ORDER_FIELDS = {
+    'play_count': 'play_count',
+    'duration': 'duration_seconds',
+    'year': 'release__release_year',
+    'added': 'pk',
+}
+
+BATCH_SIZE = 900  # id в одном IN (лимит параметров SQLite - 999)
+
+# Поля моделей -> поля правил, которые от них зависят (для выборочной перепроверки)
+RELEASE_DEPENDENCIES = {
+    'title': {'release'},
+    'release_year': {'year'},
+    'format': {'format'},
+    'label_id': {'label'},
+    'artist_id': {'artist'},
+}
+TRACK_DEPENDENCIES = {
+    'title': {'title'},
+    'status': {'status'},
+    'duration_seconds': {'duration'},
+    'play_count': {'play_count'},
+    'featured': {'featured'},
+    'release_id': set().union(*RELEASE_DEPENDENCIES.values()),
+}
+NAME_DEPENDENCIES = {'name'}
+
+
+class InvalidRule(ValueError):
+    """Некорректное правило смарт-плейлиста"""
+
+
+# Компиляция правил
+
+def _condition(rule):
+    if not isinstance(rule, (list, tuple)) or len(rule) != 3:
+        raise InvalidRule(f'Условие должно быть [поле, оператор, значение]: {rule!r}')
+    field, operator, value = rule
+    if field not in FIELDS:
+        raise InvalidRule(f'Неизвестное поле {field!r}, доступны: {", ".join(FIELDS)}')
+    if operator not in OPERATORS:
+        raise InvalidRule(f'Неизвестный оператор {operator!r}, доступны: {", ".join(OPERATORS)}')
+    lookup, negated = OPERATORS[operator]
+    if lookup == 'in' and not isinstance(value, list):
+        raise InvalidRule(f'Для {operator!r} значение - список: {rule!r}')
+    if lookup != 'in' and not isinstance(value, (str, int, float, bool)):
+        raise InvalidRule(f'Значение должно быть строкой или числом: {rule!r}')
+    value = _coerce(field, lookup, value, rule)
+
+    if field == 'genre':
+        # Подзапрос вместо join по genres: несколько условий на жанр в одной
+        # группе не должны требовать, чтобы им удовлетворял один и тот же жанр
+        genre_tracks = Track.genres.through.objects.filter(**{f'genre__name__{lookup}': value})
+        condition = Q(pk__in=genre_tracks.values('track_id'))
+    else:
+        condition = Q(**{f'{FIELDS[field]}__{lookup}': value})
+    return ~condition if negated else condition
+
+
+def _model_field(path):
+    """Поле модели, на которое указывает путь от Track (release__artist__name -> Artist.name)"""
+    model = Track
+    for name in path.split('__'):
+        field = model._meta.get_field(name)
+        model = field.related_model
+    return field
+
+
+def _coerce(field, lookup, value, rule):
+    """Значение условия, приведенное к типу поля (иначе ошибка всплыла бы при сохранении трека)"""
+    if lookup in ('icontains', 'istartswith'):
+        return str(value)
+    model_field = _model_field(FIELDS[field])
+
+    def convert(item):
+        converted = model_field.to_python(item)
+        # Числа оставляем как есть: to_python округлил бы 1.5 до 1 и изменил условие
+        return converted if isinstance(item, str) else item
+
+    try:
+        if lookup == 'in':
+            return [convert(item) for item in value]
+        return convert(value)
+    except ValidationError:
+        raise InvalidRule(f'Значение не подходит для поля {field!r}: {rule!r}')
+
+
+def _fields(rule):
+    """Поля правил, использованные в группе или условии"""
+    if isinstance(rule, dict):
+        return set().union(*(_fields(item) for items in rule.values() for item in items))
+    return {rule[0]}
+
+
+def compile_rules(rules):
+    """Q для Track по правилам (группа или одно условие). Ошибки - InvalidRule"""
+    if not isinstance(rules, dict):
+        return _condition(rules)
+    if len(rules) != 1 or next(iter(rules)) not in GROUPS:
+        raise InvalidRule(f'Группа - объект с одним ключом из {", ".join(GROUPS)}: {rules!r}')
+    (group, items), = rules.items()
+    if not isinstance(items, list):
+        raise InvalidRule(f'Содержимое группы {group!r} - список условий')
+
+    conditions = [compile_rules(item) for item in items]
+    if group == 'all':
+        return Q(*conditions)
+    if not conditions:
+        # Пустое "any" не выбирает ничего, пустое "none" - ничего не исключает
+        return Q(pk__in=[]) if group == 'any' else Q()
+    result = conditions[0]
+    for condition in conditions[1:]:
+        result |= condition
+    return result if group == 'any' else ~result
+
+
+def _order_field(playlist):
+    field = playlist.order_by.lstrip('-')
+    if field not in ORDER_FIELDS:
+        raise InvalidRule(f'Неизвестная сортировка {playlist.order_by!r}, доступны: {", ".join(ORDER_FIELDS)}')
+    return field
+
+
+def validate(playlist):
+    """Проверяет правила и сортировку плейлиста; ошибка - InvalidRule"""
+    compile_rules(playlist.rules)
+    _order_field(playlist)
+
+
+def depends_on(playlist):
+    """Поля правил, от которых зависит состав или порядок плейлиста"""
+    return _fields(playlist.rules) | {_order_field(playlist)}
+
+
+def rule_fields_key(rules):
+    """Значение SmartPlaylist.rule_fields: поля правил вида '|genre|status|'"""
+    return '|' + '|'.join(sorted(_fields(rules))) + '|'
+
+
+def _depending_on(fields):
+    """Плейлисты, в правилах которых есть одно из полей fields (без rule_fields - все)"""
+    condition = Q(rule_fields='')  # создан в обход сигналов (bulk_create)
+    for field in fields:
+        condition |= Q(rule_fields__contains=f'|{field}|')
+    return SmartPlaylist.objects.filter(condition)
+
+
+def matching(playlist):
+    """Треки, подходящие под правила, с ключом сортировки sort_key (без лимита)"""
+    return (
+        Track.objects.filter(compile_rules(playlist.rules))
+        .annotate(sort_key=F(ORDER_FIELDS[_order_field(playlist)]))
+        .order_by()
+    )
+
+
+# Материализация
+
+def rebuild(playlist):
+    """Полная пересборка состава плейлиста. Возвращает число подходящих треков"""
+    rows = matching(playlist).values_list('pk', 'sort_key').iterator(chunk_size=BATCH_SIZE)
+    with transaction.atomic():
+        SmartPlaylistMember.objects.filter(smart_playlist=playlist).delete()
+        created = SmartPlaylistMember.objects.bulk_create(
+            (
+                SmartPlaylistMember(smart_playlist_id=playlist.pk, track_id=track_id, sort_value=sort_value)
+                for track_id, sort_value in rows
+            ),
+            batch_size=BATCH_SIZE // 3,
+        )
+        SmartPlaylist.objects.filter(pk=playlist.pk).update(
+            member_count=len(created), refreshed_at=timezone.now(),
+            rule_fields=rule_fields_key(playlist.rules),
+        )
+    return len(created)
+
+
+def _sync(playlist, track_ids):
+    """Перепроверяет треки track_ids для одного плейлиста"""
+    matched = dict(matching(playlist).filter(pk__in=track_ids).values_list('pk', 'sort_key'))
+    members = {
+        member.track_id: member
+        for member in SmartPlaylistMember.objects.filter(smart_playlist=playlist, track_id__in=track_ids)
+    }
+
+    gone = [member.pk for track_id, member in members.items() if track_id not in matched]
+    new = [
+        SmartPlaylistMember(smart_playlist_id=playlist.pk, track_id=track_id, sort_value=sort_value)
+        for track_id, sort_value in matched.items() if track_id not in members
+    ]
+    moved = []
+    for track_id, member in members.items():
+        if track_id in matched and member.sort_value != matched[track_id]:
+            member.sort_value = matched[track_id]
+            moved.append(member)
+
+    if gone:
+        SmartPlaylistMember.objects.filter(pk__in=gone).delete()
+    if new:
+        SmartPlaylistMember.objects.bulk_create(new, batch_size=BATCH_SIZE // 3)
+    if moved:
+        SmartPlaylistMember.objects.bulk_update(moved, ['sort_value'], batch_size=BATCH_SIZE // 3)
+    if gone or new:
+        SmartPlaylist.objects.filter(pk=playlist.pk).update(member_count=F('member_count') + len(new) - len(gone))
+
+
+def _resort(track_ids, field):
+    """Обновляет ключ сортировки треков во всех плейлистах с сортировкой по field одним UPDATE"""
+    value = Track.objects.filter(pk=OuterRef('track_id')).order_by().values(ORDER_FIELDS[field])[:1]
+    SmartPlaylistMember.objects.filter(
+        track_id__in=track_ids, smart_playlist__order_by__in=[field, f'-{field}']
+    ).update(sort_value=Subquery(value))
+
+
+def retest(track_ids, fields=None):
+    """Перепроверяет треки после изменения полей правил fields (None - новый трек, во всех плейлистах)
+
+    track_ids - id или queryset треков. Состав перепроверяется только в
+    плейлистах, у которых поля есть в правилах (отбор по rule_fields в
+    базе); если поле только задает сортировку, ключи сортировки
+    обновляются одним UPDATE на все плейлисты.
+    """
+    if fields is not None and not fields:
+        return
+    if fields is None:
+        playlists, order_fields = list(SmartPlaylist.objects.all()), []
+    else:
+        playlists = list(_depending_on(fields))
+        order_fields = [field for field in ORDER_FIELDS if field in fields and field != 'added']
+    if not playlists and not order_fields:
+        return
+    if not isinstance(track_ids, (list, tuple, set)):
+        track_ids = track_ids.values_list('pk', flat=True)
+    track_ids = list(track_ids)
+    with transaction.atomic():
+        for start in range(0, len(track_ids), BATCH_SIZE):
+            batch = track_ids[start:start + BATCH_SIZE]
+            for field in order_fields:
+                _resort(batch, field)
+            for playlist in playlists:
+                _sync(playlist, batch)
+
+
+@contextmanager
+def tracking(tracks, fields):
+    """Перепроверяет треки после массового изменения полей правил fields (queryset.update не шлет сигналов)
+
+        with smart_playlists.tracking(queryset, {'status'}):
+            queryset.update(status='published')
+
+    Треки фиксируются по pk до изменения, как в facets.tracking.
+    """
+    track_ids = list(tracks.values_list('pk', flat=True))
+    yield
+    retest(track_ids, fields)
+
+
+def forget_track(playlist_ids):
+    """Уменьшает member_count плейлистов, из которых удаленный трек ушел каскадом"""
+    if playlist_ids:
+        SmartPlaylist.objects.filter(pk__in=playlist_ids).update(member_count=F('member_count') - 1)
+
+
+def changed_fields(old, instance, dependencies):
+    """Поля правил, затронутые изменением instance (old - значения до сохранения, None - новый объект)"""
+    if old is None:
+        return None
+    changed = set()
+    for field, rule_fields in dependencies.items():
+        if old[field] != getattr(instance, field):
+            changed |= rule_fields
+    return changed
+
+
+# Чтение
+
+def tracks(playlist):
+    """Треки плейлиста в порядке сортировки с учетом лимита (по индексу членов)"""
+    direction = '-' if playlist.order_by.startswith('-') else ''
+    result = (
+        Track.objects.filter(smart_playlist_members__smart_playlist=playlist)
+        .order_by(f'{direction}smart_playlist_members__sort_value', f'{direction}smart_playlist_members__track_id')
+    )
+    return result[:playlist.limit] if playlist.limit else result
@@ -0,0 +1,96 @@
+"""Инкрементальная статистика каталога (модель CatalogStats)
+
+Счетчики исполнителей/релизов/треков, сумма и сумма квадратов длительностей
+и количество треков по статусам хранятся в одной строке и меняются
+F()-выражениями из сигналов (catalog/signals.py), поэтому страницы читают
+одну строку вместо COUNT/SUM по таблицам. Массовые queryset.update()
+сигналов не шлют - для них есть tracking(), а дрейф чинит команда
+recompute_stats.
+"""
+from contextlib import contextmanager
+
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .models import Artist, CatalogStats, Release, Track
+
+STATS_PK = 1
+
+# Статус трека -> поле счетчика
+STATUS_FIELDS = {
+    'draft': 'draft_count',
+    'published': 'published_count',
+    'archived': 'archived_count',
+}
+
+
+def get():
+    """Строка статистики (создается пересчетом, если ее еще нет)"""
+    stats = CatalogStats.objects.filter(pk=STATS_PK).first()
+    if stats is None:
+        stats = recompute()
+    return stats
+
+
+def apply(**deltas):
+    """Прибавляет к счетчикам значения: apply(track_count=1, duration_sum=180)"""
+    deltas = {field: n for field, n in deltas.items() if n}
+    if deltas:
+        CatalogStats.objects.filter(pk=STATS_PK).update(
+            **{field: F(field) + n for field, n in deltas.items()}
+        )
+
+
+def track_deltas(duration, status, sign=1):
+    """Вклад одного трека в счетчики (sign=-1 - вычесть)"""
+    deltas = {
+        'track_count': sign,
+        'duration_sum': sign * duration,
+        'duration_sum_squares': sign * duration * duration,
+    }
+    if status in STATUS_FIELDS:
+        deltas[STATUS_FIELDS[status]] = sign
+    return deltas
+
+
+def _track_totals(tracks):
+    return tracks.order_by().aggregate(
+        track_count=Count('id'),
+        duration_sum=Sum('duration_seconds'),
+        duration_sum_squares=Sum(F('duration_seconds') * F('duration_seconds')),
+        **{
+            field: Count('id', filter=Q(status=status))
+            for status, field in STATUS_FIELDS.items()
+        },
+    )
+
+
+@contextmanager
+def tracking(tracks):
+    """Учитывает массовое изменение треков (queryset.update не шлет сигналов)"""
+    tracks = Track.objects.filter(pk__in=list(tracks.values_list('pk', flat=True)))
+    before = _track_totals(tracks)
+    yield
+    after = _track_totals(tracks)
+    apply(**{field: (after[field] or 0) - (before[field] or 0) for field in after})
+
+
+def recompute():
+    """Полный пересчет статистики (починка дрейфа)"""
+    totals = _track_totals(Track.objects.all())
+    stats, _ = CatalogStats.objects.update_or_create(
+        pk=STATS_PK,
+        defaults={
+            'artist_count': Artist.objects.count(),
+            'release_count': Release.objects.count(),
+            'recomputed_at': timezone.now(),
+            **{field: value or 0 for field, value in totals.items()},
+        },
+    )
+    return stats
+
+
+def duration_extremes():
+    """Самая большая и самая маленькая длительность (по индексу, без скана таблицы)"""
+    durations = Track.objects.order_by('duration_seconds').values_list('duration_seconds', flat=True)
+    return durations.last(), durations.first()
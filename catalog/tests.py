@@ -1,3 +1,746 @@
-from django.test import TestCase
+import io
+import json
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    approximate_counts, autocomplete, export_jobs, keyset, pdf_utils, playlist_io, playlist_order, playlist_stats,
+    scrobble_archive, scrobble_import, scrobble_ingest, scrobble_rollups, similar_artists, smart_playlists, trending,
+)
+from .models import (
+    Artist, ArtistGenre, Document, ExportJob, Genre, Label, Playlist, PlaylistEntry, Release, Scrobble, SimilarArtist,
+    SmartPlaylist, Track, TrackNeighbor,
+)
+
+ROWS = 100
+
+# Запросов на страницу списка админки при ROWS строках: сессия, пользователь,
+# счетчики, страница, фильтры. Не должно зависеть от числа строк (N+1).
+QUERY_BUDGETS = {
+    Artist: 5,
+    Label: 6,
+    Genre: 5,
+    Release: 9,
+    Track: 8,
+    Playlist: 8,
+    PlaylistEntry: 5,
+    SmartPlaylist: 5,
+    Scrobble: 8,
+    Document: 6,
+}
+
+
+class AdminChangelistQueryBudgetTests(TestCase):
+    """Число запросов списков админки на полной странице"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        users = User.objects.bulk_create(User(username=f'user{i}') for i in range(ROWS))
+        labels = Label.objects.bulk_create(Label(name=f'Label {i}', founded_year=1990) for i in range(ROWS))
+        genres = Genre.objects.bulk_create(Genre(name=f'Genre {i}') for i in range(ROWS))
+        artists = Artist.objects.bulk_create(Artist(name=f'Artist {i}') for i in range(ROWS))
+        releases = Release.objects.bulk_create(
+            Release(title=f'Release {i}', artist=artist, label=label, release_year=2020)
+            for i, (artist, label) in enumerate(zip(artists, labels))
+        )
+        tracks = Track.objects.bulk_create(
+            Track(title=f'Track {i}', release=release, duration_seconds=200, position='A1')
+            for i, release in enumerate(releases)
+        )
+        Track.genres.through.objects.bulk_create(
+            Track.genres.through(track=track, genre=genre) for track, genre in zip(tracks, genres)
+        )
+        playlists = Playlist.objects.bulk_create(Playlist(title=f'Playlist {i}', user=user) for i, user in enumerate(users))
+        PlaylistEntry.objects.bulk_create(
+            PlaylistEntry(playlist=playlist, track=track, position=1) for playlist, track in zip(playlists, tracks)
+        )
+        SmartPlaylist.objects.bulk_create(
+            SmartPlaylist(title=f'Smart {i}', user=user, rules=['status', '=', 'published'])
+            for i, user in enumerate(users)
+        )
+        Scrobble.objects.bulk_create(
+            Scrobble(user=user, track=track, scrobbled_at=timezone.now()) for user, track in zip(users, tracks)
+        )
+        Document.objects.bulk_create(
+            Document(title=f'Document {i}', artist=artist, file=f'documents/{i}.pdf') for i, artist in enumerate(artists)
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_changelists_within_budget(self):
+        for model, budget in QUERY_BUDGETS.items():
+            url = reverse(f'admin:{model._meta.app_label}_{model._meta.model_name}_changelist')
+            with self.subTest(model=model.__name__), self.assertNumQueries(budget):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.context['cl'].result_list), ROWS)
+
+    def test_large_changelists_count_approximately(self):
+        cache.delete(approximate_counts._histogram_key(Scrobble, 'scrobbled_at'))
+        url = reverse('admin:catalog_scrobble_changelist')
+        with mock.patch.object(approximate_counts, 'COUNT_LIMIT', 50):
+            response = self.client.get(url)
+        cl = response.context['cl']
+        self.assertTrue(cl.paginator.count_is_lower_bound)
+        self.assertEqual(cl.result_count, 50)
+        self.assertContains(response, 'больше 50')
+
+        # Месяцы года - из гистограммы, закэшированной первым запросом (без GROUP BY по таблице)
+        now = timezone.localtime()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'scrobbled_at__year': now.year})
+        self.assertFalse([query for query in queries if 'GROUP BY' in query['sql']])
+        choices = response.context['cl'].date_drilldown['choices']
+        self.assertEqual(len(choices), 1)
+        self.assertIn(f'scrobbled_at__month={now.month}', choices[0]['link'])
+        self.assertEqual(response.context['cl'].result_count, ROWS)
+
+    def test_pages_past_lower_bound_count_are_reachable(self):
+        url = reverse('admin:catalog_scrobble_changelist')
+        with mock.patch.object(approximate_counts, 'COUNT_LIMIT', 50), \
+                mock.patch('catalog.admin.ScrobbleAdmin.list_per_page', 20):
+            pages = {number: self.client.get(url, {'p': number}) for number in (3, 5, 6)}
+        self.assertEqual(len(pages[3].context['cl'].result_list), 20)  # не обрезана по count
+        self.assertEqual(len(pages[5].context['cl'].result_list), 20)
+        self.assertIn('p=6', pages[5].context['cl'].next_page_url)
+        self.assertRedirects(pages[6], url + '?e=1', fetch_redirect_response=False)
+
+
+class PdfReportTests(TestCase):
+    """PDF-отчеты читают строки одним запросом, сколько бы таблиц ни получилось"""
+
+    @classmethod
+    def setUpTestData(cls):
+        artists = Artist.objects.bulk_create(Artist(name=f'Artist {i}') for i in range(5))
+        releases = Release.objects.bulk_create(
+            Release(title=f'Release {i}', artist=artist, release_year=2020) for i, artist in enumerate(artists)
+        )
+        Track.objects.bulk_create(
+            Track(title=f'Track {i}', release=releases[i % len(releases)], duration_seconds=200, position='A1')
+            for i in range(70)
+        )
+
+    def test_pdf_reports_read_rows_in_one_query(self):
+        with mock.patch.object(pdf_utils, 'ROWS_PER_TABLE', 30), self.assertNumQueries(1):
+            report = pdf_utils.generate_tracks_pdf(Track.objects.all())
+        self.assertEqual(report.read(5), b'%PDF-')
+        with self.assertNumQueries(1):
+            pdf_utils.generate_artists_pdf(Artist.objects.all())
+
+
+class ExportJobQueueTests(TestCase):
+    """Лимиты одновременных выгрузок и повторы после ошибки"""
+
+    def test_claim_respects_concurrency_limits(self):
+        user = User.objects.create_user('exporter')
+        first = export_jobs.enqueue('artists', [1], user)
+        export_jobs.enqueue('artists', [2], user)
+        third = export_jobs.enqueue('artists', [3])
+        with mock.patch.object(export_jobs, 'CONCURRENCY', 2), mock.patch.object(export_jobs, 'USER_CONCURRENCY', 1):
+            self.assertEqual(export_jobs.claim('a').pk, first.pk)
+            self.assertEqual(export_jobs.claim('b').pk, third.pk)  # вторая задача пользователя ждет
+            self.assertIsNone(export_jobs.claim('c'))  # общий лимит
+
+    def test_failed_job_is_retried_then_failed(self):
+        job = export_jobs.enqueue('release', [0])  # релиза нет - выгрузка падает
+        with mock.patch.object(export_jobs, 'MAX_ATTEMPTS', 2):
+            export_jobs.run(export_jobs.claim('a'))
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), ('queued', 1))
+            self.assertIsNone(export_jobs.claim('a'))  # еще не прошла задержка
+            ExportJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            export_jobs.run(export_jobs.claim('a'))
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), ('failed', 2))
+            self.assertIn('DoesNotExist', job.error)
+
+    def test_user_limit_is_checked_in_the_update(self):
+        user = User.objects.create_user('exporter')
+        first = export_jobs.enqueue('artists', [1], user)
+        export_jobs.enqueue('artists', [2], user)
+        running = export_jobs._running
+        # Второй воркер выбрал кандидатов до того, как первый захватил задачу пользователя
+        stale_busy_users = [ExportJob.objects.none(), running(), running()]
+        with mock.patch.object(export_jobs, 'USER_CONCURRENCY', 1):
+            self.assertEqual(export_jobs.claim('a').pk, first.pk)
+            with mock.patch.object(export_jobs, '_running', side_effect=lambda: stale_busy_users.pop(0)):
+                self.assertIsNone(export_jobs.claim('b'))
+
+    def test_recovered_job_result_is_not_overwritten(self):
+        Artist.objects.create(name='Artist')
+        export_jobs.enqueue('artists', Artist.objects.values_list('pk', flat=True))
+        slow = export_jobs.claim('a')
+        ExportJob.objects.filter(pk=slow.pk).update(heartbeat_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(export_jobs.recover_stale(), 1)
+        ExportJob.objects.filter(pk=slow.pk).update(run_after=timezone.now())
+        export_jobs.claim('b')
+
+        job = export_jobs.run(slow)
+        self.assertEqual((job.status, job.locked_by, job.file.name), ('running', 'b', ''))
+        self.assertEqual(export_jobs.recover_stale(), 0)
+
+
+class ScrobbleIngestTests(TestCase):
+    """Авторизация и проверка входных данных приема прослушиваний"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('listener')
+        cls.other = User.objects.create_user('other')
+        cls.staff = User.objects.create_user('staff', is_staff=True)
+
+    def setUp(self):
+        self.url = reverse('scrobble-ingest')
+        patcher = mock.patch.object(scrobble_ingest.buffer, 'add')
+        self.add = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, data, **extra):
+        body = data if isinstance(data, bytes) else json.dumps(data)
+        return self.client.post(self.url, body, content_type='application/json', **extra)
+
+    def test_anonymous_request_is_rejected(self):
+        self.assertEqual(self.post({'track': 1, 'user': self.user.pk}).status_code, 401)
+        self.add.assert_not_called()
+
+    def test_user_cannot_scrobble_as_someone_else(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.post({'track': 1, 'user': self.other.pk}).status_code, 400)
+        self.assertEqual(self.post({'track': 1}).status_code, 202)
+        scrobble, = self.add.call_args.args[0]
+        self.assertEqual(scrobble.user_id, self.user.pk)
+
+    def test_staff_and_service_token_may_set_user(self):
+        self.client.force_login(self.staff)
+        self.assertEqual(self.post({'track': 1, 'user': self.other.pk}).status_code, 202)
+        self.client.logout()
+        with self.settings(CATALOG_SCROBBLE_INGEST_TOKEN='secret'):
+            self.assertEqual(self.post({'track': 1, 'user': self.other.pk}, HTTP_AUTHORIZATION='Token wrong').status_code, 401)
+            self.assertEqual(self.post({'track': 1, 'user': self.other.pk}, HTTP_AUTHORIZATION='Token secret').status_code, 202)
+        self.assertEqual(self.add.call_args.args[0][0].user_id, self.other.pk)
+
+    def test_bad_input_is_400(self):
+        self.client.force_login(self.user)
+        for data in ({'track': 1, 'timestamp': 1e20}, {'track': 1, 'timestamp': '2026-13-45T00:00:00'}, b'\xff\xfe'):
+            with self.subTest(data=data):
+                self.assertEqual(self.post(data).status_code, 400)
+        self.add.assert_not_called()
+
+
+class SmartPlaylistTests(TestCase):
+    """Правила смарт-плейлистов и инкрементальное ведение состава"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner')
+        cls.artist = Artist.objects.create(name='Artist')
+        cls.release = Release.objects.create(title='Release', artist=cls.artist, release_year=2021)
+        cls.jazz = Genre.objects.create(name='Jazz')
+
+    def make_track(self, title, duration=200, **fields):
+        return Track.objects.create(title=title, release=self.release, duration_seconds=duration, position='A1', **fields)
+
+    def test_invalid_values_are_rejected(self):
+        for rules in (['duration', '<', 'abc'], ['year', 'in', [2020, 'x']], ['featured', '=', 'maybe']):
+            with self.subTest(rules=rules), self.assertRaises(smart_playlists.InvalidRule):
+                smart_playlists.compile_rules(rules)
+        playlist = SmartPlaylist(title='Bad', user=self.user, rules=['duration', '<', 'abc'])
+        with self.assertRaises(ValidationError):
+            playlist.full_clean()
+        with self.assertRaises(smart_playlists.InvalidRule):
+            playlist.save()
+        self.assertFalse(SmartPlaylist.objects.exists())
+        self.make_track('Still saves')
+
+    def test_deleting_tracks_updates_member_count(self):
+        tracks = [self.make_track(f'Track {i}') for i in range(3)]
+        playlist = SmartPlaylist.objects.create(title='All', user=self.user, rules=['year', '=', 2021])
+        tracks[0].delete()
+        playlist.refresh_from_db()
+        self.assertEqual(playlist.member_count, 2)
+        self.release.delete()  # треки удаляются каскадом
+        playlist.refresh_from_db()
+        self.assertEqual(playlist.member_count, 0)
+
+    def test_bulk_admin_actions_retest_members(self):
+        draft = self.make_track('Draft', status='draft')
+        playlist = SmartPlaylist.objects.create(title='Published', user=self.user, rules=['status', '=', 'published'])
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        self.client.post(reverse('admin:catalog_track_changelist'),
+                         {'action': 'publish_tracks', '_selected_action': [draft.pk]})
+        self.assertEqual(list(smart_playlists.tracks(playlist)), [draft])
+        playlist.refresh_from_db()
+        self.assertEqual(playlist.member_count, 1)
+
+    def test_rules_select_expected_tracks(self):
+        short_jazz = self.make_track('Short jazz', duration=120)
+        short_jazz.genres.add(self.jazz)
+        long_jazz = self.make_track('Long jazz', duration=400)
+        long_jazz.genres.add(self.jazz)
+        other = self.make_track('Other', duration=100)
+        cases = [
+            ({'all': [['genre', '=', 'Jazz'], ['duration', '<', 300]]}, {short_jazz}),
+            ({'any': [['genre', '=', 'Jazz'], ['duration', '<', 150]]}, {short_jazz, long_jazz, other}),
+            ({'none': [['genre', '=', 'Jazz']]}, {other}),
+            ({'all': [['title', 'startswith', 'long'], ['year', 'in', [2020, 2021]]]}, {long_jazz}),
+            ({'any': []}, set()),
+        ]
+        for rules, expected in cases:
+            with self.subTest(rules=rules):
+                self.assertEqual(set(Track.objects.filter(smart_playlists.compile_rules(rules))), expected)
+
+    def test_incremental_members_match_rebuild(self):
+        tracks = [self.make_track(f'Track {i}', duration=100 + i * 30) for i in range(8)]
+        playlists = [
+            SmartPlaylist.objects.create(title='Short', user=self.user, rules=['duration', '<', 250]),
+            SmartPlaylist.objects.create(title='Jazz', user=self.user, order_by='duration',
+                                         rules={'all': [['genre', '=', 'Jazz'], ['status', '!=', 'archived']]}),
+            SmartPlaylist.objects.create(title='Played', user=self.user, rules=['play_count', '>=', 2], limit=3),
+        ]
+        tracks[0].genres.add(self.jazz)
+        tracks[1].duration_seconds = 500
+        tracks[1].save()
+        tracks[2].genres.add(self.jazz)
+        tracks[2].status = 'archived'
+        tracks[2].save()
+        self.jazz.tracks.add(tracks[3])
+        Track.objects.filter(pk__in=[tracks[4].pk, tracks[5].pk]).update(play_count=F('play_count') + 3)
+        smart_playlists.retest([tracks[4].pk, tracks[5].pk], {'play_count'})
+        tracks[6].delete()
+
+        for playlist in playlists:
+            playlist.refresh_from_db()
+            incremental = list(smart_playlists.tracks(playlist))
+            members = playlist.member_count
+            smart_playlists.rebuild(playlist)
+            playlist.refresh_from_db()
+            with self.subTest(playlist=playlist.title):
+                self.assertEqual(incremental, list(smart_playlists.tracks(playlist)))
+                self.assertEqual(members, playlist.member_count)
+
+    def test_retest_queries_do_not_grow_with_order_only_playlists(self):
+        track = self.make_track('Track')
+        for i in range(20):
+            SmartPlaylist.objects.create(title=f'Top {i}', user=self.user, rules=['year', '=', 2021])
+        # play_count только в сортировке: выбор плейлистов и один UPDATE ключей на все (плюс savepoint)
+        with self.assertNumQueries(4):
+            smart_playlists.retest([track.pk], {'play_count'})
+
+
+class KeysetPaginationTests(TestCase):
+    """Обход всех страниц keyset-пагинации"""
+
+    @classmethod
+    def setUpTestData(cls):
+        artist = Artist.objects.create(name='Artist')
+        # Порядок релизов по Meta.ordering (год, название) не совпадает с порядком id
+        releases = [
+            Release.objects.create(title=title, artist=artist, release_year=year)
+            for title, year in [('B', 2001), ('A', 2010), ('C', 2005), ('D', 2010)]
+        ]
+        Track.objects.bulk_create(
+            Track(title=f'Track {i}', release=releases[i % len(releases)], duration_seconds=200, position=f'A{i % 3}')
+            for i in range(41)
+        )
+
+    def walk(self, queryset, **kwargs):
+        pages, cursor = [], None
+        while True:
+            page = keyset.paginate(queryset, cursor, page_size=7, **kwargs)
+            pages.append(page)
+            cursor = page['next']
+            if cursor is None:
+                return pages
+
+    def test_every_row_is_visited_once_in_both_directions(self):
+        for ordering in (None, ['-duration_seconds', 'title'], ['-release', 'position']):
+            with self.subTest(ordering=ordering):
+                pages = self.walk(Track.objects.all(), ordering=ordering)
+                forward = [track.pk for page in pages for track in page['items']]
+                self.assertEqual(len(forward), 41)
+                self.assertEqual(len(set(forward)), 41)
+
+                backward = []
+                page = pages[-1]
+                while page['previous']:
+                    page = keyset.paginate(Track.objects.all(), page['previous'], page_size=7, ordering=ordering)
+                    backward = [track.pk for track in page['items']] + backward
+                self.assertEqual(backward + [track.pk for track in pages[-1]['items']], forward)
+
+
+class TrackDetailTests(TestCase):
+    def test_page_shows_listeners_and_similar_tracks(self):
+        release = Release.objects.create(title='Release', artist=Artist.objects.create(name='Artist'), release_year=2020)
+        track, other = Track.objects.bulk_create(
+            Track(title=title, release=release, duration_seconds=200, position='A1') for title in ('First', 'Second')
+        )
+        TrackNeighbor.objects.create(track=track, neighbor=other, score=0.9, rank=1)
+        response = self.client.get(reverse('track-detail', args=[track.pk]))
+        self.assertContains(response, 'Уникальных слушателей')
+        self.assertContains(response, 'С этим треком также слушают')
+        self.assertContains(response, 'Artist - Second')
+
+
+class PlaylistStatsTests(TestCase):
+    """Итоги плейлиста при всех способах изменить состав"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner')
+        release = Release.objects.create(title='Release', artist=Artist.objects.create(name='Artist'), release_year=2020)
+        cls.tracks = [
+            Track.objects.create(title=f'Track {i}', release=release, duration_seconds=100 * (i + 1), position='A1')
+            for i in range(4)
+        ]
+
+    def assertTotals(self, playlist, count, duration):
+        playlist.refresh_from_db()
+        self.assertEqual((playlist.track_count, playlist.total_duration_seconds), (count, duration))
+
+    def test_counters_follow_membership_changes(self):
+        first, second, third, fourth = self.tracks
+        playlist = Playlist.objects.create(title='Mix', user=self.user)
+        other = Playlist.objects.create(title='Other', user=self.user)
+
+        playlist.tracks.add(first, second)
+        self.assertTotals(playlist, 2, 300)
+        PlaylistEntry.objects.create(playlist=playlist, track=third)
+        self.assertTotals(playlist, 3, 600)
+        fourth.playlists.add(playlist, other)
+        self.assertTotals(playlist, 4, 1000)
+        self.assertTotals(other, 1, 400)
+        # Добавленные без позиции встают в конец по порядку добавления
+        self.assertEqual(list(playlist_order.tracks(playlist)), self.tracks)
+
+        first.duration_seconds = 150
+        first.save()
+        self.assertTotals(playlist, 4, 1050)
+        playlist.tracks.remove(second)
+        self.assertTotals(playlist, 3, 850)
+        playlist.tracks.clear()
+        self.assertTotals(playlist, 0, 0)
+        self.assertEqual(playlist_stats.mismatches(), [])
+
+
+class AutocompleteTests(TestCase):
+    """Готовые топы коротких префиксов совпадают с полным ранжированием"""
+
+    @classmethod
+    def setUpTestData(cls):
+        release = Release.objects.create(title='Release', artist=Artist.objects.create(name='Artist'), release_year=2020)
+        cls.tracks = Track.objects.bulk_create(
+            Track(title=f'{word} {i}', release=release, duration_seconds=200, position='A1', play_count=i % 7)
+            for i, word in enumerate(['Alpha', 'Almost', 'Beta', 'Also'] * 8)
+        )
+
+    def expected(self, index, prefix, limit):
+        """Полный перебор диапазона, как без готовых топов"""
+        candidates = {pk for _key, kind, pk in index._range(prefix) if kind == 'track'}
+        top = sorted(candidates, key=lambda pk: autocomplete._rank(index._entries[('track', pk)], pk), reverse=True)
+        return top[:limit]
+
+    def assertTops(self, index):
+        for prefix in ('a', 'al', 'alp', 'b', 'be', 'z'):
+            for limit in (1, 5, autocomplete.MAX_LIMIT):
+                result = [item['id'] for item in index.complete(prefix, limit)['track']]
+                self.assertEqual(result, self.expected(index, prefix, limit), (prefix, limit))
+
+    def test_short_prefix_tops_follow_updates(self):
+        index = autocomplete.PrefixIndex()
+        index.load()
+        self.assertTops(index)
+
+        first, second = self.tracks[0], self.tracks[1]
+        index.update('track', first.pk, 'Beta new', weight=100)
+        index.update('track', second.pk, second.title, weight=-1)
+        index.remove('track', self.tracks[3].pk)
+        index.update('track', 10 ** 6, 'Alpine', weight=50)
+        self.assertTops(index)
+        self.assertEqual(index.complete('b')['track'][0]['id'], first.pk)
+
+    def test_changes_during_reload_are_replayed(self):
+        index = autocomplete.PrefixIndex()
+        index.load()
+        index.complete('be')
+        # Фоновая загрузка началась: изменение попадает и в старый индекс, и в журнал
+        index._reloading = []
+        index.update('track', self.tracks[2].pk, self.tracks[2].title, weight=100)
+        index.load()
+        self.assertIsNone(index._reloading)
+        self.assertEqual(index.complete('be')['track'][0]['id'], self.tracks[2].pk)
+
+
+class ScrobbleImportTests(TestCase):
+    def test_malformed_ndjson_line_is_counted_as_invalid(self):
+        user = User.objects.create_user('listener')
+        release = Release.objects.create(title='Album', artist=Artist.objects.create(name='Artist'), release_year=2020)
+        track = Track.objects.create(title='Song', release=release, duration_seconds=200, position='A1')
+        lines = [
+            '{"artist": "Artist", "track": "song", "ts": "2024-01-01T10:00:00Z"}',
+            '{"artist": "Artist", "track": ',
+            '{"artist": "ARTIST", "track": "Song", "album": "Album", "ts": "2024-01-01T11:00:00Z"}',
+        ]
+        stream = io.StringIO('\n'.join(lines))
+        totals = scrobble_import.import_rows(scrobble_import.read_rows(stream, 'json'), user.pk)
+        self.assertEqual((totals['imported'], totals['invalid'], totals['unmatched']), (2, 1, 0))
+        self.assertEqual(Scrobble.objects.filter(track=track).count(), 2)
+
+    def test_tsv_rows_are_split_on_tabs(self):
+        user = User.objects.create_user('listener')
+        release = Release.objects.create(title='Album', artist=Artist.objects.create(name='Artist'), release_year=2020)
+        Track.objects.create(title='Song, live', release=release, duration_seconds=200, position='A1')
+        stream = io.StringIO('artist\ttrack\tts\nArtist\tSong, live\t2024-01-01T10:00:00Z\n')
+        self.assertEqual(scrobble_import.guess_format('history.TSV'), 'tsv')
+        totals = scrobble_import.import_rows(scrobble_import.read_rows(stream, 'tsv'), user.pk)
+        self.assertEqual((totals['imported'], totals['invalid']), (1, 0))
+
+
+class SimilarArtistsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        rock, jazz = Genre.objects.create(name='Rock'), Genre.objects.create(name='Jazz')
+        cls.artists = [Artist.objects.create(name=f'Artist {i}') for i in range(3)]
+        cls.releases = [
+            Release.objects.create(title=f'Release {i}', artist=artist, release_year=2020)
+            for i, artist in enumerate(cls.artists)
+        ]
+        cls.track = None
+        for i, release in enumerate(cls.releases):
+            for genre in (rock, jazz)[:i + 1]:
+                track = Track.objects.create(title=f'{genre.name} {i}', release=release, duration_seconds=200)
+                track.genres.add(genre)
+                cls.track = cls.track or track
+
+    def bridge(self):
+        return set(ArtistGenre.objects.values_list('artist_id', 'genre_id', 'track_count'))
+
+    def test_bridge_follows_track_moves_only(self):
+        before = self.bridge()
+        with CaptureQueriesContext(connection) as queries:
+            self.track.save()
+        self.assertFalse([query for query in queries if 'artistgenre' in query['sql'].lower()])
+        self.assertEqual(self.bridge(), before)
+
+        self.track.release = self.releases[1]
+        self.track.save()
+        moved = self.bridge()
+        self.assertNotEqual(moved, before)
+        similar_artists.rebuild_genres()
+        self.assertEqual(self.bridge(), moved)
+
+    def test_build_replaces_neighbours(self):
+        self.assertEqual(similar_artists.build(), 3)
+        links = list(SimilarArtist.objects.values_list('artist_id', 'similar_id', 'rank').order_by('artist_id', 'rank'))
+        self.assertEqual(similar_artists.build(), 3)
+        self.assertEqual(
+            list(SimilarArtist.objects.values_list('artist_id', 'similar_id', 'rank').order_by('artist_id', 'rank')),
+            links,
+        )
+        self.assertEqual(similar_artists.similar_to(self.artists[1], limit=1), [self.artists[2]])
+
+    def test_build_skips_artists_created_after_the_snapshot(self):
+        snapshot = [artist.pk for artist in self.artists]
+        late = Artist.objects.create(name='Late')
+        track = Track.objects.create(
+            title='Late', release=Release.objects.create(title='Late', artist=late, release_year=2020), duration_seconds=200,
+        )
+        track.genres.add(Genre.objects.get(name='Rock'))
+        Scrobble.objects.create(user=User.objects.create_user('listener'), track=track, scrobbled_at=timezone.now())
+
+        with mock.patch.object(similar_artists, 'Artist') as artists:
+            artists.objects.values_list.return_value = snapshot
+            self.assertEqual(similar_artists.build(), 3)
+        self.assertFalse(SimilarArtist.objects.filter(artist=late).exists())
+        self.assertFalse(SimilarArtist.objects.filter(similar=late).exists())
+
+
+class PlaylistEditTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        release = Release.objects.create(title='Release', artist=Artist.objects.create(name='Artist'), release_year=2020)
+        cls.track = Track.objects.create(title='Song', release=release, duration_seconds=200, position='A1')
+        cls.playlist = Playlist.objects.create(title='Mix', user=User.objects.create_user('owner'))
+
+    def test_edit_page_renders_picker(self):
+        response = self.client.get(reverse('playlist-edit', args=[self.playlist.pk]))
+        self.assertContains(response, reverse('playlist-track-picker', args=[self.playlist.pk]))
+
+    def test_picker_clamps_search_cursor(self):
+        url = reverse('playlist-track-picker', args=[self.playlist.pk])
+        response = self.client.get(url, {'q': 'song'})
+        self.assertEqual([track['id'] for track in response.json()['results']], [self.track.pk])
+        response = self.client.get(url, {'q': 'song', 'cursor': '9' * 23})
+        self.assertEqual(response.json(), {'results': [], 'next': None})
+
+
+class ScrobbleArchiveTests(TestCase):
+    """Архивация удаляет из таблицы только строки, уже учтенные в свертках"""
+
+    def setUp(self):
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        settings = override_settings(CATALOG_SCROBBLE_ARCHIVE_DIR=archive_dir.name, CATALOG_SCROBBLE_HOT_MONTHS=3)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.user = User.objects.create_user('listener')
+        release = Release.objects.create(title='Release', artist=Artist.objects.create(name='Artist'), release_year=2020)
+        self.track = Track.objects.create(title='Song', release=release, duration_seconds=200, position='A1')
+        self.old = timezone.now() - timedelta(days=200)
+
+    def scrobble(self, count):
+        Scrobble.objects.bulk_create(
+            Scrobble(user=self.user, track=self.track, scrobbled_at=self.old + timedelta(minutes=i)) for i in range(count)
+        )
+
+    def totals(self):
+        """(в таблице, всего с архивом, в свертках)"""
+        start, end = self.old - timedelta(days=1), timezone.now()
+        return (
+            Scrobble.objects.count(),
+            scrobble_archive.count(user_id=self.user.pk),
+            scrobble_rollups.listens('user', self.user.pk, start, end),
+        )
+
+    def test_rows_newer_than_the_fold_stay_in_the_table(self):
+        self.scrobble(3)
+        scrobble_rollups.fold_new()
+        # Импорт задним числом между fold_new и чтением месяца
+        self.scrobble(2)
+        with mock.patch.object(scrobble_rollups, 'fold_new'):
+            self.assertEqual(scrobble_archive.archive(), 3)
+        self.assertEqual(self.totals(), (2, 5, 3))
+
+        self.assertEqual(scrobble_archive.archive(), 2)
+        self.assertEqual(self.totals(), (0, 5, 5))
+
+    def test_rebuild_keeps_archived_months(self):
+        self.scrobble(4)
+        scrobble_archive.archive()
+        self.scrobble(1)  # опоздавшая строка архивного месяца, еще в таблице
+        scrobble_rollups.rebuild()
+        self.assertEqual(self.totals(), (1, 5, 5))
+        self.assertEqual(scrobble_rollups.listens('track', self.track.pk, self.old - timedelta(days=1), timezone.now()), 5)
+
+
+class TrendingTests(TestCase):
+    def test_recompute_ranks_tracks_artists_and_genres(self):
+        user = User.objects.create_user('listener')
+        rock, jazz = Genre.objects.create(name='Rock'), Genre.objects.create(name='Jazz')
+        first, second = Artist.objects.create(name='First'), Artist.objects.create(name='Second')
+        releases = [Release.objects.create(title=artist.name, artist=artist, release_year=2020) for artist in (first, second)]
+        fresh = Track.objects.create(title='Fresh', release=releases[0], duration_seconds=200)
+        old = Track.objects.create(title='Old', release=releases[1], duration_seconds=200)
+        # Большой id и трек без прослушиваний не раздувают пересчет и не попадают в топ
+        far = Track.objects.create(pk=10 ** 9, title='Far', release=releases[1], duration_seconds=200)
+        Track.objects.create(title='Silent', release=releases[1], duration_seconds=200).genres.add(rock)
+        fresh.genres.add(rock)
+        old.genres.add(rock, jazz)
+        far.genres.add(jazz)
+
+        now = timezone.now()
+        half_life = timedelta(seconds=trending.half_life_seconds())
+        Scrobble.objects.bulk_create(
+            [Scrobble(user=user, track=fresh, scrobbled_at=now - timedelta(minutes=i)) for i in range(3)]
+            + [Scrobble(user=user, track=old, scrobbled_at=now - 2 * half_life) for _ in range(16)]
+            + [Scrobble(user=user, track=far, scrobbled_at=now - half_life)]
+        )
+        trending.recompute(now)
+
+        # Счета: fresh ~3, old 16 * 1/4 = 4, far 1/2
+        self.assertEqual([track.pk for track in trending.tracks()], [old.pk, fresh.pk, far.pk])
+        self.assertEqual([track.pk for track in trending.tracks(genre_id=jazz.pk)], [old.pk, far.pk])
+        self.assertEqual([track.pk for track in trending.tracks(genre_id=rock.pk)], [old.pk, fresh.pk])
+        self.assertEqual(trending.artists(), [second, first])
+        self.assertAlmostEqual(trending.artists()[0].trending_score, 4.5, places=6)
+        self.assertEqual(trending.genres(), [rock, jazz])
+
+
+class PrivateDataAccessTests(TestCase):
+    """Личные данные пользователей видны только им самим и сотрудникам"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner')
+        cls.stranger = User.objects.create_user('stranger')
+        cls.staff = User.objects.create_user('staff', is_staff=True)
+
+    def assertAccess(self, url, anonymous, stranger, owner, method='get', **kwargs):
+        """Коды ответа анонимному, чужому пользователю, владельцу и сотруднику"""
+        self.client.logout()
+        self.assertEqual(getattr(self.client, method)(url, **kwargs).status_code, anonymous)
+        for user, expected in ((self.stranger, stranger), (self.owner, owner), (self.staff, owner)):
+            self.client.force_login(user)
+            self.assertEqual(getattr(self.client, method)(url, **kwargs).status_code, expected, user.username)
+
+    def test_scrobble_history(self):
+        self.assertAccess(reverse('user-scrobbles', args=[self.owner.pk]), 302, 403, 200)
+
+    def test_recommendations(self):
+        self.assertAccess(reverse('user-recommendations', args=[self.owner.pk]), 401, 403, 200)
+
+    def test_private_smart_playlist(self):
+        playlist = SmartPlaylist.objects.create(title='Mine', user=self.owner, rules=['status', '=', 'published'])
+        url = reverse('smart-playlist', args=[playlist.pk])
+        self.assertAccess(url, 404, 404, 200)
+        playlist.is_public = True
+        playlist.save()
+        self.assertAccess(url, 200, 200, 200)
+
+    def test_playlist_changes(self):
+        playlist = Playlist.objects.create(title='Mix', user=self.owner)
+        payload = {'data': json.dumps({'tracks': []}), 'content_type': 'application/json'}
+        self.assertAccess(reverse('playlist-append', args=[playlist.pk]), 401, 403, 200, 'post', **payload)
+        self.assertAccess(reverse('playlist-reorder', args=[playlist.pk]), 401, 403, 200, 'post', **payload)
+        url = reverse('playlist-import', args=[playlist.pk])
+        for expected, user in ((401, None), (403, self.stranger), (200, self.owner)):
+            self.client.logout()
+            if user:
+                self.client.force_login(user)
+            upload = io.BytesIO(b'#EXTM3U\n')
+            upload.name = 'mix.m3u'
+            self.assertEqual(self.client.post(url, {'file': upload}).status_code, expected)
+
+
+class PlaylistIoTests(TestCase):
+    """Экспорт и обратный импорт плейлиста во всех форматах"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner')
+        first, second = Artist.objects.create(name='Björk'), Artist.objects.create(name='Rock & Roll')
+        releases = [Release.objects.create(title=f'<{artist.name}>', artist=artist, release_year=2020) for artist in (first, second)]
+        # Одноименные треки разных исполнителей и спецсимволы в названиях
+        cls.tracks = [
+            Track.objects.create(title=title, release=release, duration_seconds=180 + i, position='A1')
+            for i, (title, release) in enumerate([
+                ('Intro', releases[0]), ('Intro', releases[1]), ('Say "Hi", <friend> & go', releases[0]),
+                ('Outro - Live', releases[1]),
+            ])
+        ]
+        cls.playlist = Playlist.objects.create(title='Mix & Match', user=cls.user)
+        playlist_order.append(cls.playlist, [track.pk for track in reversed(cls.tracks)])
+
+    def test_round_trip(self):
+        for file_format in playlist_io.FORMATS:
+            with self.subTest(file_format=file_format):
+                text = ''.join(playlist_io.export(self.playlist, file_format, lambda track: f'/tracks/{track.pk}.mp3'))
+                stream = io.BytesIO(text.encode()) if file_format == 'xspf' else io.StringIO(text)
+                copy = Playlist.objects.create(title=file_format, user=self.user)
+                totals = playlist_io.import_entries(copy, playlist_io.read_entries(stream, file_format))
+                self.assertEqual((totals['read'], totals['added'], totals['unmatched']), (4, 4, 0))
+                self.assertEqual(list(playlist_order.tracks(copy)), list(reversed(self.tracks)))
 
-# Create your tests here.
@@ -0,0 +1,174 @@
+"""Тренды: треки, исполнители и жанры по затухающему счету прослушиваний
+
+Каждое прослушивание весит 2^(-возраст / период полураспада), так что
+старые хиты сами уходят из топа, а свежий всплеск поднимает трек быстро.
+Счет трека - сумма весов его прослушиваний, исполнителя - сумма по его
+трекам, жанра - сумма по трекам жанра.
+
+Пересчет векторный: прослушивания за окно (WINDOW_HALF_LIVES периодов
+полураспада, дальше веса пренебрежимо малы) читаются в массивы NumPy и
+суммируются через np.bincount по трекам с прослушиваниями в окне (их
+исполнители и жанры читаются только для этих треков). Результат - топ-K в таблице TrendingScore
+(общий топ треков, топ треков каждого жанра, топ исполнителей и жанров),
+которую страницы читают по индексу за O(K). Пересчет запускается командой
+compute_trending (например, раз в минуту из cron).
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Artist, Genre, Scrobble, Track, TrendingScore
+
+DEFAULT_HALF_LIFE_HOURS = 24
+DEFAULT_TOP_K = 50
+
+# Окно пересчета в периодах полураспада (вес на краю - 2^-10 < 0.1%)
+WINDOW_HALF_LIVES = 10
+
+# Сколько id треков в одном запросе исполнителей и жанров
+LOOKUP_CHUNK_SIZE = 5000
+
+
+def half_life_seconds():
+    return getattr(settings, 'CATALOG_TRENDING_HALF_LIFE_HOURS', DEFAULT_HALF_LIFE_HOURS) * 3600
+
+
+def top_k():
+    return getattr(settings, 'CATALOG_TRENDING_TOP_K', DEFAULT_TOP_K)
+
+
+# Пересчет
+
+def _recent_events(now, half_life):
+    """(track_id, возраст в секундах) прослушиваний за окно"""
+    since = now - timedelta(seconds=half_life * WINDOW_HALF_LIVES)
+    rows = (
+        Scrobble.objects.filter(scrobbled_at__gte=since, scrobbled_at__lte=now)
+        .order_by()
+        .values_list('track_id', 'scrobbled_at')
+        .iterator(chunk_size=10000)
+    )
+    now_ts = now.timestamp()
+    tracks, ages = [], []
+    for track_id, scrobbled_at in rows:
+        tracks.append(track_id)
+        ages.append(now_ts - scrobbled_at.timestamp())
+    return np.array(tracks, dtype=np.int64), np.array(ages, dtype=np.float64)
+
+
+def _pairs(rows, field, ids):
+    """Пары (id, связанный id) из values_list для ids - порциями field__in"""
+    pairs = []
+    for start in range(0, len(ids), LOOKUP_CHUNK_SIZE):
+        pairs += rows.filter(**{f'{field}__in': ids[start:start + LOOKUP_CHUNK_SIZE].tolist()})
+    return np.array(pairs, dtype=np.int64).reshape(-1, 2)
+
+
+def _top(scores, ids, k):
+    """Индексы k наибольших положительных счетов по убыванию"""
+    positive = np.flatnonzero(scores > 0)
+    if len(positive) > k:
+        positive = positive[np.argpartition(scores[positive], -k)[-k:]]
+    # При равном счете выше меньший id - порядок стабилен между пересчетами
+    order = np.lexsort((ids[positive], -scores[positive]))
+    return positive[order]
+
+
+def _entries(kind, scores, ids, k, now, genre_id=None):
+    return [
+        TrendingScore(
+            kind=kind, genre_id=genre_id, object_id=int(ids[i]),
+            rank=rank, score=float(scores[i]), computed_at=now,
+        )
+        for rank, i in enumerate(_top(scores, ids, k), start=1)
+    ]
+
+
+def recompute(now=None):
+    """Пересчитывает все топы. Возвращает число записей"""
+    now = now or timezone.now()
+    half_life = half_life_seconds()
+    k = top_k()
+
+    tracks, ages = _recent_events(now, half_life)
+    weights = np.exp2(-ages / half_life)
+
+    # Счет по трекам с прослушиваниями: track_ids отсортированы, индекс - номер в track_ids
+    track_ids, events = np.unique(tracks, return_inverse=True)
+    track_scores = np.bincount(events, weights=weights, minlength=len(track_ids))
+
+    entries = _entries('track', track_scores, track_ids, k, now)
+
+    # Исполнители: счет трека переносится на его исполнителя
+    track_pairs = _pairs(Track.objects.values_list('pk', 'release__artist_id'), 'pk', track_ids)
+    if len(track_pairs):
+        artist_ids, artists = np.unique(track_pairs[:, 1], return_inverse=True)
+        artist_scores = np.bincount(
+            artists, weights=track_scores[np.searchsorted(track_ids, track_pairs[:, 0])], minlength=len(artist_ids)
+        )
+        entries += _entries('artist', artist_scores, artist_ids, k, now)
+
+    # Жанры и топ треков внутри каждого жанра
+    genre_pairs = _pairs(Track.genres.through.objects.values_list('track_id', 'genre_id'), 'track_id', track_ids)
+    if len(genre_pairs):
+        pair_scores = track_scores[np.searchsorted(track_ids, genre_pairs[:, 0])]
+        genre_ids, genres = np.unique(genre_pairs[:, 1], return_inverse=True)
+        genre_scores = np.bincount(genres, weights=pair_scores, minlength=len(genre_ids))
+        entries += _entries('genre', genre_scores, genre_ids, k, now)
+
+        order = np.argsort(genres, kind='stable')
+        starts = np.searchsorted(genres[order], np.arange(len(genre_ids)))
+        for genre_id, genre_rows in zip(genre_ids, np.split(order, starts[1:])):
+            entries += _entries(
+                'track', pair_scores[genre_rows], genre_pairs[genre_rows, 0], k, now, int(genre_id)
+            )
+
+    with transaction.atomic():
+        TrendingScore.objects.all().delete()
+        TrendingScore.objects.bulk_create(entries, batch_size=1000)
+    return len(entries)
+
+
+# Чтение
+
+def _ranked(kind, genre_id, limit):
+    return list(
+        TrendingScore.objects.filter(kind=kind, genre_id=genre_id)
+        .order_by('rank')
+        .values_list('object_id', 'score')[:limit]
+    )
+
+
+def _with_scores(rows, objects):
+    result = []
+    for object_id, score in rows:
+        obj = objects.get(object_id)
+        if obj is not None:  # удален после пересчета
+            obj.trending_score = score
+            result.append(obj)
+    return result
+
+
+def tracks(limit=10, genre_id=None):
+    """Трендовые треки (общий топ или топ жанра) с атрибутом trending_score"""
+    rows = _ranked('track', genre_id, limit)
+    objects = Track.objects.select_related('release__artist').in_bulk([pk for pk, _ in rows])
+    return _with_scores(rows, objects)
+
+
+def artists(limit=10):
+    rows = _ranked('artist', None, limit)
+    return _with_scores(rows, Artist.objects.in_bulk([pk for pk, _ in rows]))
+
+
+def genres(limit=10):
+    rows = _ranked('genre', None, limit)
+    return _with_scores(rows, Genre.objects.in_bulk([pk for pk, _ in rows]))
+
+
+def computed_at():
+    return TrendingScore.objects.values_list('computed_at', flat=True).first()
+
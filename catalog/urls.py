@@ -97,6 +97,12 @@ path('tracks/<int:pk>/delete/', views.track_delete, name='track-delete'),
 path('playlists/create/', views.playlist_create, name='playlist-create'),
 path('playlists/<int:pk>/edit/', views.playlist_edit, name='playlist-edit'),
 path('playlists/<int:pk>/remove-track/<int:track_id>/', views.playlist_delete_track, name='playlist-remove-track'),
+path('playlists/<int:pk>/append/', views.playlist_append_view, name='playlist-append'),
+path('playlists/<int:pk>/track-picker/', views.playlist_track_picker, name='playlist-track-picker'),
+path('playlists/<int:pk>/reorder/', views.playlist_reorder_view, name='playlist-reorder'),
+path('playlists/<int:pk>/export/<str:file_format>/', views.playlist_export, name='playlist-export'),
+path('playlists/<int:pk>/import/', views.playlist_import, name='playlist-import'),
+path('smart-playlists/<int:pk>/', views.smart_playlist_view, name='smart-playlist'),
 
 
 path('artists-with-links/', views.artists_with_links, name='artists-with-links'),
@@ -123,7 +129,21 @@ path('tracks/bulk-delete/', views.bulk_delete_old_tracks, name='bulk-delete-trac
 # Главная страница
 path('', views.homepage, name='homepage'),
     
+    # Прием прослушиваний
+path('scrobbles/ingest/', views.scrobble_ingest_view, name='scrobble-ingest'),
+path('users/<int:user_id>/scrobbles/', views.user_scrobble_history, name='user-scrobbles'),
+path('users/<int:user_id>/recommendations/', views.user_recommendations_view, name='user-recommendations'),
+
+    # Тренды
+path('trending/', views.trending_view, name='trending'),
+path('live/top/', views.live_top_view, name='live-top'),
+
+    # Фасетный просмотр
+path('browse/', views.browse_tracks, name='browse'),
+path('browse/api/', views.browse_tracks_api, name='browse-api'),
+
     # Поиск
 path('search/', views.search, name='search'),
+path('search/autocomplete/', views.autocomplete_view, name='autocomplete'),
 
 ]
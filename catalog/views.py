@@ -1,5 +1,14 @@
+import io
+import json
+import xml.etree.ElementTree as ElementTree
+
 from django.shortcuts import render, get_object_or_404, redirect
-from .models import Artist, Favorite, Playlist, Release, Track, Genre, Label
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import require_POST
+from .models import (
+    Artist, Favorite, Playlist, PlaylistEntry, Release, Scrobble, SmartPlaylist, Track, Genre, Label,
+)
 from django.db.models import Q
 
 from django.contrib import messages
@@ -8,7 +17,15 @@ from django.urls import reverse
 
 from django.db.models import Count, Avg, Sum
 
+from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
+from django.core.exceptions import PermissionDenied
+
+from . import (
+    autocomplete, facets, fuzzy_search, heavy_hitters, keyset, listener_sketches,
+    playlist_io, playlist_order, recommendations, scrobble_ingest, search_index, similar_artists,
+    smart_playlists, stats, trending, widget_cache,
+)
 
 #from .models import TrackFeature
 
@@ -71,9 +88,10 @@ def digital_recent_releases(request):
     
 def index(request):
     """Главная страница с ссылками на примеры filter()"""
-    total_artists = Artist.objects.count()
-    total_releases = Release.objects.count()
-    total_tracks = Track.objects.count()
+    catalog_stats = stats.get()  # одна строка CatalogStats вместо трех COUNT(*)
+    total_artists = catalog_stats.artist_count
+    total_releases = catalog_stats.release_count
+    total_tracks = catalog_stats.track_count
     
     
     return render(request, 'catalog/index.html', {
@@ -120,18 +138,23 @@ def search_tracks(request):
     query = request.GET.get('q', '')
     tracks = None
     tracks_exist = False  #   exists() проверку
+    fuzzy = False
     
     if query:
-        tracks = Track.objects.filter(
-            Q(title__icontains=query) | 
-            Q(release__artist__name__icontains=query)
-        )
+        # Полнотекстовый индекс вместо LIKE '%q%' по трекам и исполнителям
+        tracks = search_index.search_tracks(query, columns=('title', 'artist_name'))
         tracks_exist = tracks.exists()  #  exists() - быстрая проверка наличия результато
+        
+        if not tracks_exist:
+            # Точных совпадений нет - ищем с опечатками по триграммам
+            tracks = fuzzy_search.search_tracks(query, include_artists=True)
+            tracks_exist = fuzzy = tracks.exists()
     
     return render(request, 'catalog/search_tracks.html', {
         'query': query,
         'tracks': tracks,
         'tracks_exist': tracks_exist,  # ✅ Передаем результат exists() в шаблон
+        'fuzzy': fuzzy,
     })
 
 def recent_digital_tracks(request):
@@ -156,7 +179,9 @@ def artists_by_genre(request):
     
     artists = None
     if selected_genre:
-        artists = Artist.objects.filter(releases__tracks__genres__name=selected_genre).distinct()
+        genre = genres.filter(name=selected_genre).first()
+        # Мост ArtistGenre вместо join через релизы и треки с DISTINCT
+        artists = similar_artists.artists_in_genre(genre) if genre else Artist.objects.none()
     
     return render(request, 'catalog/artists_by_genre.html', {
         'genres': genres,
@@ -170,9 +195,12 @@ def tracks_without_genres(request):
     """Треки без назначенных жанров"""
     tracks = Track.objects.exclude(genres__isnull=False)
     
+    page = keyset.paginate(tracks, request.GET.get('cursor'))
+    
     return render(request, 'catalog/tracks_list.html', {
         'title': 'Треки без жанров',
-        'tracks': tracks,
+        'tracks': page['items'],
+        'page': page,
         'description': 'Треки, у которых не назначены жанры'
     })
 
@@ -181,9 +209,12 @@ def releases_without_label(request):
     """Релизы без лейбла"""
     releases = Release.objects.exclude(label__isnull=False)
     
+    page = keyset.paginate(releases, request.GET.get('cursor'))
+    
     return render(request, 'catalog/releases_list.html', {
         'title': 'Релизы без лейбла',
-        'releases': releases,
+        'releases': page['items'],
+        'page': page,
         'description': 'Релизы, у которых не указан лейбл'
     })
 
@@ -196,9 +227,12 @@ def non_digital_tracks_by_genre(request, genre_name):
         release__format='Digital'
     )
     
+    page = keyset.paginate(tracks, request.GET.get('cursor'))
+    
     return render(request, 'catalog/tracks_list.html', {
         'title': f'НЕ цифровые треки в жанре "{genre_name}"',
-        'tracks': tracks,
+        'tracks': page['items'],
+        'page': page,
         'description': f'Треки в жанре {genre_name}, которые НЕ в цифровом формате'
     })
 
@@ -207,9 +241,12 @@ def artists_without_releases(request):
     """Исполнители без релизов"""
     artists = Artist.objects.exclude(releases__isnull=False)
     
+    page = keyset.paginate(artists, request.GET.get('cursor'))
+    
     return render(request, 'catalog/artists_list.html', {
         'title': 'Исполнители без релизов',
-        'artists': artists,
+        'artists': page['items'],
+        'page': page,
         'description': 'Исполнители, у которых нет ни одного релиза'
     })
 
@@ -218,9 +255,12 @@ def tracks_without_position(request):
     """Треки без указанной позиции в релизе"""
     tracks = Track.objects.exclude(position__isnull=False).exclude(position='')
     
+    page = keyset.paginate(tracks, request.GET.get('cursor'))
+    
     return render(request, 'catalog/tracks_list.html', {
         'title': 'Треки без позиции',
-        'tracks': tracks,
+        'tracks': page['items'],
+        'page': page,
         'description': 'Треки, у которых не указана позиция в релизе (A1, B2 и т.д.)'
     })
 
@@ -236,9 +276,12 @@ def old_non_digital_releases(request):
         release_year__gte=current_year - 2
     )
     
+    page = keyset.paginate(releases, request.GET.get('cursor'))
+    
     return render(request, 'catalog/releases_list.html', {
         'title': 'Старые не цифровые релизы',
-        'releases': releases,
+        'releases': page['items'],
+        'page': page,
         'description': f'Релизы НЕ в цифровом формате и старше {current_year - 2} года'
     })
     
@@ -248,9 +291,12 @@ def tracks_by_duration(request):
     """Треки отсортированные по длительности"""
     tracks = Track.objects.all().order_by('duration_seconds')
     
+    page = keyset.paginate(tracks, request.GET.get('cursor'))
+    
     return render(request, 'catalog/tracks_ordered.html', {
         'title': 'Треки по длительности',
-        'tracks': tracks,
+        'tracks': page['items'],
+        'page': page,
         'description': 'Треки отсортированные от самых коротких к самым длинным'
     })
 
@@ -259,9 +305,12 @@ def releases_by_year(request):
     """Релизы отсортированные по году (новые сверху)"""
     releases = Release.objects.all().order_by('-release_year')
     
+    page = keyset.paginate(releases, request.GET.get('cursor'))
+    
     return render(request, 'catalog/releases_ordered.html', {
         'title': 'Релизы по году выпуска',
-        'releases': releases,
+        'releases': page['items'],
+        'page': page,
         'description': 'Релизы отсортированные по году выпуска (новые сверху)'
     })
     
@@ -272,9 +321,12 @@ def long_tracks(request):
     """Длинные треки (более 4 минут) используя кастомный менеджер"""
     tracks = Track.custom.long_tracks()
     
+    page = keyset.paginate(tracks, request.GET.get('cursor'))
+    
     return render(request, 'catalog/tracks_list.html', {
         'title': 'Длинные треки (4+ минут)',
-        'tracks': tracks,
+        'tracks': page['items'],
+        'page': page,
         'description': 'Треки длительностью более 4 минут (используется кастомный менеджер)'
     })
 
@@ -283,9 +335,12 @@ def digital_only_releases(request):
     """Только цифровые релизы используя кастомный менеджер"""
     releases = Release.custom.digital_only()
     
+    page = keyset.paginate(releases, request.GET.get('cursor'))
+    
     return render(request, 'catalog/releases_list.html', {
         'title': 'Цифровые релизы',
-        'releases': releases,
+        'releases': page['items'],
+        'page': page,
         'description': 'Только цифровые релизы (используется кастомный менеджер)'
     })
 
@@ -300,9 +355,12 @@ def recent_digital_tracks(request):
         release__release_year__gte=current_year - 2
     )
     
+    page = keyset.paginate(tracks, request.GET.get('cursor'))
+    
     return render(request, 'catalog/tracks_list.html', {
         'title': 'Треки из недавних цифровых релизов',
-        'tracks': tracks,
+        'tracks': page['items'],
+        'page': page,
         'description': 'Треки из цифровых релизов за последние 2 года'
     })
     
@@ -320,7 +378,9 @@ def artist_detail(request, pk):
         'object': artist,
         'type': 'artist',
         'releases': artist_releases,  # Передаем в шаблон
-        'recent_releases': recent_releases
+        'recent_releases': recent_releases,
+        'unique_listeners': listener_sketches.unique_listeners('artist', artist.pk),
+        'similar_artists': similar_artists.similar_to(artist),
     })
 
 def release_detail(request, pk):
@@ -335,16 +395,6 @@ def release_detail(request, pk):
         'type': 'release'
     })
 
-def track_detail(request, pk):
-    """Детальная страница трека"""
-    track = get_object_or_404(Track, pk=pk)
-    
-    return render(request, 'catalog/detail_page.html', {
-        'title': f'Трек: {track.title}',
-        'object': track,
-        'type': 'track'
-    })
-
 # Страница для демонстрации get_absolute_url
 def demonstrate_urls(request):
     """Демонстрация get_absolute_url и reverse"""
@@ -385,33 +435,36 @@ def artists_with_stats(request):
 # Пример 2: Агрегация - общая статистика по трекам
 def tracks_statistics(request):
     """Общая статистика по трекам"""
-    from django.db.models import Count, Avg, Sum, Max, Min
-    
-    stats = Track.objects.aggregate(
-        total_tracks=Count('id'),
-        avg_duration=Avg('duration_seconds'),
-        total_duration=Sum('duration_seconds'),
-        longest_track=Max('duration_seconds'),
-        shortest_track=Min('duration_seconds')
-    )
+    # Счетчики и суммы - из строки CatalogStats, экстремумы - по индексу длительности
+    catalog_stats = stats.get()
+    longest_track, shortest_track = stats.duration_extremes()
+    
+    track_stats = {
+        'total_tracks': catalog_stats.track_count,
+        'avg_duration': catalog_stats.avg_duration,
+        'total_duration': catalog_stats.duration_sum,
+        'longest_track': longest_track,
+        'shortest_track': shortest_track,
+        'duration_stddev': catalog_stats.duration_stddev,
+    }
     status_counts = {
-        'draft': Track.objects.filter(status='draft').count(),      #  count()
-        'published': Track.objects.filter(status='published').count(),  #  count()
-        'archived': Track.objects.filter(status='archived').count(),    #  count()
+        'draft': catalog_stats.draft_count,
+        'published': catalog_stats.published_count,
+        'archived': catalog_stats.archived_count,
     }
     # Конвертируем секунды в минуты для удобства
-    if stats['avg_duration']:
-        stats['avg_duration_min'] = stats['avg_duration'] / 60
-    if stats['total_duration']:
-        stats['total_duration_min'] = stats['total_duration'] / 60
-    if stats['longest_track']:
-        stats['longest_track_min'] = stats['longest_track'] / 60
-    if stats['shortest_track']:
-        stats['shortest_track_min'] = stats['shortest_track'] / 60
+    if track_stats['avg_duration']:
+        track_stats['avg_duration_min'] = track_stats['avg_duration'] / 60
+    if track_stats['total_duration']:
+        track_stats['total_duration_min'] = track_stats['total_duration'] / 60
+    if track_stats['longest_track']:
+        track_stats['longest_track_min'] = track_stats['longest_track'] / 60
+    if track_stats['shortest_track']:
+        track_stats['shortest_track_min'] = track_stats['shortest_track'] / 60
     
     return render(request, 'catalog/aggregation_stats.html', {
         'title': 'Статистика по трекам',
-        'stats': stats,
+        'stats': track_stats,
         'status_counts': status_counts,
         'type': 'tracks_stats',
         'description': 'Общая статистика по всем трекам в каталоге'
@@ -661,9 +714,11 @@ def prefetch_performance_comparison(request):
 
 def track_list(request):
     """Список треков"""
-    tracks = Track.objects.select_related('release__artist').prefetch_related('genres')[:20]
+    tracks = Track.objects.select_related('release__artist').prefetch_related('genres')
+    page = keyset.paginate(tracks, request.GET.get('cursor'), page_size=20)
     return render(request, 'catalog/crud/track_list.html', {
-        'tracks': tracks,
+        'tracks': page['items'],
+        'page': page,
         'title': 'Все треки'
     })
 
@@ -749,9 +804,12 @@ def track_detail(request, pk):
         Track.objects.select_related('release__artist').prefetch_related('genres'), 
         pk=pk
     )
-    return render(request, 'catalog/crud/track_detail.html', {
-        'track': track,
-        'title': f'Трек: {track.title}'
+    return render(request, 'catalog/detail_page.html', {
+        'title': f'Трек: {track.title}',
+        'object': track,
+        'type': 'track',
+        'unique_listeners': listener_sketches.unique_listeners('track', track.pk),
+        'similar_tracks': recommendations.similar_tracks(track),
     })
 
 # CRUD для плейлистов с redirect()
@@ -788,7 +846,7 @@ def playlist_create(request):
 
 def playlist_edit(request, pk):
     """Редактирование плейлиста с добавлением треков"""
-    playlist = get_object_or_404(Playlist.objects.prefetch_related('tracks'), pk=pk)
+    playlist = get_object_or_404(Playlist, pk=pk)
     
     if request.method == 'POST':
         # Обработка изменения названия
@@ -799,29 +857,27 @@ def playlist_edit(request, pk):
             if title:
                 playlist.title = title
                 playlist.is_public = is_public
-                playlist.save()
+                # Итоги по трекам ведутся сигналами - не перезаписываем их
+                playlist.save(update_fields=['title', 'is_public', 'updated_at'])
                 messages.success(request, 'Плейлист обновлен!')
                 return redirect('playlist-edit', pk=playlist.pk)
         
-        # Обработка добавления трека
-        elif 'add_track' in request.POST:
-            track_id = request.POST.get('track')
-            if track_id:
-                try:
-                    track = Track.objects.get(id=track_id)
-                    playlist.tracks.add(track)
-                    messages.success(request, f'Трек "{track.title}" добавлен в плейлист!')
-                    # РЕДИРЕКТ на эту же страницу (чтобы продолжить редактирование)
-                    return redirect('playlist-edit', pk=playlist.pk)
-                except Track.DoesNotExist:
-                    messages.error(request, 'Трек не найден!')
-    
-    tracks = Track.objects.all()
-    available_tracks = tracks.exclude(id__in=playlist.tracks.values_list('id', flat=True))
-    
+        # Добавление треков, выбранных в подборщике (одним INSERT)
+        elif 'add_tracks' in request.POST or 'add_track' in request.POST:
+            track_ids = [value for value in request.POST.getlist('tracks') + request.POST.getlist('track') if value.isdigit()]
+            added = playlist_order.append(playlist, track_ids)
+            if added:
+                messages.success(request, f'Добавлено треков: {added}')
+            else:
+                messages.error(request, 'Треки не найдены или уже есть в плейлисте!')
+            # РЕДИРЕКТ на эту же страницу (чтобы продолжить редактирование)
+            return redirect('playlist-edit', pk=playlist.pk)
+    
+    # Вместо списка всех треков каталога - JSON-подборщик (playlist_track_picker)
     return render(request, 'catalog/crud/playlist_edit.html', {
         'playlist': playlist,
-        'available_tracks': available_tracks,
+        'playlist_tracks': playlist_order.tracks(playlist).select_related('release__artist'),
+        'picker_url': reverse('playlist-track-picker', args=[playlist.pk]),
         'title': f'Редактировать: {playlist.title}'
     })
 
@@ -831,7 +887,7 @@ def playlist_delete_track(request, pk, track_id):
     track = get_object_or_404(Track, pk=track_id)
     
     if request.method == 'POST':
-        playlist.tracks.remove(track)
+        playlist_order.remove(playlist, [track.pk])
         messages.success(request, f'Трек "{track.title}" удален из плейлиста!')
         # РЕДИРЕКТ обратно на редактирование плейлиста
         return redirect('playlist-edit', pk=playlist.pk)
@@ -861,8 +917,11 @@ def releases_on_spotify(request):
     """Релизы доступные в Spotify"""
     spotify_releases = Release.objects.exclude(spotify_url='')
     
+    page = keyset.paginate(spotify_releases, request.GET.get('cursor'))
+    
     return render(request, 'catalog/releases_list.html', {
-        'releases': spotify_releases,
+        'releases': page['items'],
+        'page': page,
         'title': 'Релизы в Spotify',
         'description': 'Релизы, доступные для прослушивания в Spotify'
     })
@@ -905,13 +964,21 @@ def search_artists_icontains(request):
     """Поиск исполнителей (регистронезависимый)"""
     query = request.GET.get('q', '')
     artists = None
+    fuzzy = False
     
     if query:
-        artists = Artist.objects.filter(name__icontains=query)  # ✅ __icontains
+        # Регистронезависимый поиск по имени через полнотекстовый индекс
+        artists = search_index.search_artists(query, columns=('name',))
+        
+        if not artists.exists():
+            # "Radiohaed", "Beyonce" - нечеткий поиск по триграммам
+            artists = fuzzy_search.search_artists(query)
+            fuzzy = True
     
     return render(request, 'catalog/search_results.html', {
         'query': query,
         'artists': artists,
+        'fuzzy': fuzzy,
         'search_type': 'artists_icontains',
         'title': f'Поиск исполнителей: "{query}" (регистронезависимый)'
     })
@@ -921,10 +988,7 @@ def search_releases_description(request):
     releases = None
     
     if query:
-        releases = Release.objects.filter(
-            Q(title__icontains=query) |
-            Q(artist__name__icontains=query)
-        )
+        releases = search_index.search_releases(query, columns=('title', 'artist_name'))
     
     return render(request, 'catalog/search_results.html', {
         'query': query,
@@ -997,16 +1061,18 @@ def bulk_update_tracks(request):
     """Массовое обновление треков используя update()"""
     if request.method == 'POST':
         # ✅ update() - массовое обновление статуса треков
-        updated_count = Track.objects.filter(
-            status='draft'
-        ).update(
-            status='published'
-        )
+        draft_tracks = Track.objects.filter(status='draft')
+        # update() не шлет сигналов - счетчики фасетов, статистику и смарт-плейлисты обновляем явно
+        with facets.tracking(draft_tracks), stats.tracking(draft_tracks), \
+                smart_playlists.tracking(draft_tracks, {'status'}):
+            updated_count = draft_tracks.update(
+                status='published'
+            )
         
         messages.success(request, f'✅ Опубликовано {updated_count} треков используя update()')
         return redirect('track-list')
     
-    draft_tracks_count = Track.objects.filter(status='draft').count()
+    draft_tracks_count = stats.get().draft_count
     
     return render(request, 'catalog/bulk_operations.html', {
         'action': 'update',
@@ -1053,40 +1119,22 @@ def bulk_delete_old_tracks(request):
 def homepage(request):
     """Главная страница музыкального каталога с виджетами"""
     
-    # 1. ВИДЖЕТ: Новые релизы (последние 5)
-    new_releases = Release.objects.select_related('artist').order_by('-id')[:5]
-    
-    # 2. ВИДЖЕТ: Избранные исполнители
-    featured_artists = Artist.objects.filter(featured=True)[:4]
-    
-    # 3. ВИДЖЕТ: Популярные треки (по play_count)
-    popular_tracks = Track.objects.select_related('release__artist').filter(
-        play_count__gt=0
-    ).order_by('-play_count')[:5]
-    
-    # 4. ВИДЖЕТ: Жанровая статистика (агрегатная функция COUNT)
-    from django.db.models import Count
-    genres_with_stats = Genre.objects.annotate(
-        track_count=Count('tracks')
-    ).order_by('-track_count')[:6]
-    
-    # 5. ВИДЖЕТ: Общая статистика (агрегатные функции)
-    stats = {
-        'total_artists': Artist.objects.count(),
-        'total_tracks': Track.objects.count(),
-        'total_releases': Release.objects.count(),
-        'most_popular_track': Track.objects.order_by('-play_count').first(),
-        'avg_track_duration': Track.objects.aggregate(
-            avg_duration=Avg('duration_seconds')
-        )['avg_duration']
-    }
+    # Виджеты берутся из кэша (catalog/widget_cache.py): пересчет только после
+    # изменения данных (сигналы) или по истечении границы устаревания
+    widgets = widget_cache.get_many([
+        'new_releases',       # 1. Новые релизы (последние 5)
+        'featured_artists',   # 2. Избранные исполнители
+        'popular_tracks',     # 3. Трендовые треки (затухающий счет прослушиваний)
+        'genres_with_stats',  # 4. Жанровая статистика (COUNT)
+        'stats',              # 5. Общая статистика (агрегатные функции)
+    ])
     
     context = {
-        'new_releases': new_releases,
-        'featured_artists': featured_artists,
-        'popular_tracks': popular_tracks,
-        'genres_with_stats': genres_with_stats,
-        'stats': stats,
+        'new_releases': widgets['new_releases'],
+        'featured_artists': widgets['featured_artists'],
+        'popular_tracks': widgets['popular_tracks'],
+        'genres_with_stats': widgets['genres_with_stats'],
+        'stats': widgets['stats'],
         'title': 'MusicCatalog - Ваш музыкальный гид'
     }
     
@@ -1098,23 +1146,20 @@ def search(request):
     results = {}
     
     if query:
-        # Поиск по трекам
-        results['tracks'] = Track.objects.filter(
-            Q(title__icontains=query) | 
-            Q(release__title__icontains=query)
-        ).select_related('release__artist')[:10]
+        # Поиск по трекам (название трека и релиза), ранжирование bm25
+        results['tracks'] = search_index.search_tracks(
+            query, columns=('title', 'release_title'), limit=10
+        )
         
-        # Поиск по исполнителям
-        results['artists'] = Artist.objects.filter(
-            Q(name__icontains=query) | 
-            Q(biography__icontains=query)
-        )[:10]
+        # Поиск по исполнителям (имя и биография)
+        results['artists'] = search_index.search_artists(
+            query, columns=('name', 'biography'), limit=10
+        )
         
-        # Поиск по релизам
-        results['releases'] = Release.objects.filter(
-            Q(title__icontains=query) |
-            Q(artist__name__icontains=query)
-        ).select_related('artist')[:10]
+        # Поиск по релизам (название и исполнитель)
+        results['releases'] = search_index.search_releases(
+            query, columns=('title', 'artist_name'), limit=10
+        )
     
     context = {
         'query': query,
@@ -1123,4 +1168,389 @@ def search(request):
         'title': f'Поиск: {query}'
     }
     
-    return render(request, 'catalog/search.html', context)
\ No newline at end of file
+    return render(request, 'catalog/search.html', context)
+
+
+def autocomplete_view(request):
+    """JSON-автодополнение по префиксу: топ исполнителей, релизов и треков"""
+    query = request.GET.get('q', '')
+    try:
+        limit = min(max(int(request.GET.get('limit', 5)), 1), autocomplete.MAX_LIMIT)
+    except ValueError:
+        limit = 5
+    
+    results = autocomplete.index.complete(query, limit=limit)
+    
+    return JsonResponse({
+        'query': query,
+        'artists': results['artist'],
+        'releases': results['release'],
+        'tracks': results['track'],
+    })
+
+
+def browse_tracks(request):
+    """Фасетный просмотр треков: жанр, формат, годы, статус, лейбл в любой комбинации"""
+    filters = facets.parse_filters(request.GET)
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        page = 1
+    
+    data = facets.browse(filters, page=page)
+    
+    return render(request, 'catalog/browse.html', {
+        'title': 'Каталог треков',
+        'filters': filters,
+        'data': data,
+    })
+
+
+def browse_tracks_api(request):
+    """То же, что browse_tracks, в JSON"""
+    filters = facets.parse_filters(request.GET)
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        page = 1
+    
+    data = facets.browse(filters, page=page)
+    
+    return JsonResponse({
+        'filters': filters,
+        'total': data['total'],
+        'page': data['page'],
+        'pages': data['pages'],
+        'facets': data['facets'],
+        'tracks': [
+            {
+                'id': track.pk,
+                'title': track.title,
+                'artist': track.release.artist.name,
+                'release': track.release.title,
+                'release_year': track.release.release_year,
+                'format': track.release.format,
+                'label': track.release.label.name if track.release.label else None,
+                'status': track.status,
+                'url': track.get_absolute_url(),
+            }
+            for track in data['tracks']
+        ],
+    })
+
+
+@csrf_exempt
+@require_POST
+def scrobble_ingest_view(request):
+    """Прием прослушиваний: один объект, JSON-массив или NDJSON.
+    
+    Записи попадают в буфер и пишутся в базу пачками, поэтому ответ - 202.
+    Сервисы передают токен CATALOG_SCROBBLE_INGEST_TOKEN в заголовке
+    Authorization и указывают user в записях; пользователи сайта пишут
+    прослушивания от своего имени (сессия, с проверкой CSRF).
+    """
+    if scrobble_ingest.has_service_token(request):
+        return _ingest_scrobbles(request, default_user_id=None, allow_user=True)
+    return _session_scrobble_ingest(request)
+
+
+@csrf_protect
+def _session_scrobble_ingest(request):
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Нужна авторизация'}, status=401)
+    return _ingest_scrobbles(request, request.user.pk, allow_user=request.user.is_staff)
+
+
+def _ingest_scrobbles(request, default_user_id, allow_user):
+    try:
+        items = scrobble_ingest.parse_payload(request.body)
+        if len(items) > scrobble_ingest.MAX_REQUEST_SIZE:
+            raise scrobble_ingest.InvalidScrobble(
+                f'Не более {scrobble_ingest.MAX_REQUEST_SIZE} записей в запросе'
+            )
+        scrobbles = [scrobble_ingest.build_scrobble(item, default_user_id, allow_user) for item in items]
+    except scrobble_ingest.InvalidScrobble as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    
+    scrobble_ingest.buffer.add(scrobbles)
+    
+    return JsonResponse({'accepted': len(scrobbles)}, status=202)
+
+
+def trending_view(request):
+    """JSON-тренды: kind=track (можно с genre=<id>), artist или genre"""
+    kind = request.GET.get('kind', 'track')
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), trending.top_k())
+        genre_id = int(request.GET['genre']) if request.GET.get('genre') else None
+    except ValueError:
+        return JsonResponse({'error': 'limit и genre должны быть числами'}, status=400)
+    
+    if kind == 'track':
+        results = [
+            {
+                'id': track.pk,
+                'title': track.title,
+                'artist': track.release.artist.name,
+                'score': round(track.trending_score, 3),
+                'url': track.get_absolute_url(),
+            }
+            for track in trending.tracks(limit, genre_id)
+        ]
+    elif kind == 'artist':
+        results = [
+            {'id': artist.pk, 'name': artist.name, 'score': round(artist.trending_score, 3),
+             'url': artist.get_absolute_url()}
+            for artist in trending.artists(limit)
+        ]
+    elif kind == 'genre':
+        results = [
+            {'id': genre.pk, 'name': genre.name, 'score': round(genre.trending_score, 3)}
+            for genre in trending.genres(limit)
+        ]
+    else:
+        return JsonResponse({'error': 'kind: track, artist или genre'}, status=400)
+    
+    return JsonResponse({
+        'kind': kind,
+        'genre': genre_id,
+        'computed_at': trending.computed_at(),
+        'results': results,
+    })
+
+
+def live_top_view(request):
+    """JSON-снимок живого топа: window=5m|60m, kind=track|artist"""
+    window = request.GET.get('window', '5m')
+    kind = request.GET.get('kind', 'track')
+    if window not in heavy_hitters.WINDOWS or kind not in heavy_hitters.KINDS:
+        return JsonResponse({'error': 'window: 5m или 60m, kind: track или artist'}, status=400)
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), heavy_hitters.TOP_SIZE)
+    except ValueError:
+        limit = 10
+    
+    top = heavy_hitters.tracker.snapshot(window, kind, limit)
+    ids = [pk for pk, _ in top]
+    if kind == 'track':
+        names = {
+            pk: f'{track.release.artist.name} - {track.title}'
+            for pk, track in Track.objects.select_related('release__artist').in_bulk(ids).items()
+        }
+    else:
+        names = {pk: artist.name for pk, artist in Artist.objects.in_bulk(ids).items()}
+    
+    return JsonResponse({
+        'window': window,
+        'kind': kind,
+        'results': [
+            {'id': pk, 'name': names[pk], 'count': count}
+            for pk, count in top
+            if pk in names
+        ],
+    })
+
+
+def _is_owner(request, user_id):
+    """Запрос от пользователя user_id или от сотрудника"""
+    return request.user.is_authenticated and (request.user.pk == user_id or request.user.is_staff)
+
+
+def _access_error(request, user_id):
+    """JSON-ответ 401/403, если запрос не от пользователя user_id и не от сотрудника, иначе None"""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Нужна авторизация'}, status=401)
+    if not _is_owner(request, user_id):
+        return JsonResponse({'error': 'Нет доступа'}, status=403)
+    return None
+
+
+@login_required
+def user_scrobble_history(request, user_id):
+    """История прослушиваний пользователя, новые сверху (keyset-пагинация): только своя или для staff"""
+    if not _is_owner(request, user_id):
+        raise PermissionDenied
+    user = get_object_or_404(User, pk=user_id)
+    scrobbles = Scrobble.objects.filter(user=user).select_related('track__release__artist')
+    
+    page = keyset.paginate(scrobbles, request.GET.get('cursor'), ordering=['-scrobbled_at'])
+    
+    return render(request, 'catalog/scrobble_history.html', {
+        'title': f'История прослушиваний: {user.username}',
+        'history_user': user,
+        'scrobbles': page['items'],
+        'page': page,
+    })
+
+
+def user_recommendations_view(request, user_id):
+    """JSON-рекомендации пользователю по соседям его треков: только свои или для staff"""
+    error = _access_error(request, user_id)
+    if error:
+        return error
+    user = get_object_or_404(User, pk=user_id)
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 100)
+    except ValueError:
+        limit = 10
+    
+    tracks = recommendations.for_user(user, limit)
+    
+    return JsonResponse({
+        'user': user.pk,
+        'results': [
+            {
+                'id': track.pk,
+                'title': track.title,
+                'artist': track.release.artist.name,
+                'url': track.get_absolute_url(),
+                'score': round(track.recommendation_score, 4),
+            }
+            for track in tracks
+        ],
+    })
+
+
+def _json_track_ids(value):
+    if not isinstance(value, list) or not all(isinstance(item, int) for item in value):
+        raise ValueError('tracks - список id треков')
+    return value
+
+
+@require_POST
+def playlist_append_view(request, pk):
+    """Добавление треков в конец плейлиста: {"tracks": [id, ...]} (владелец или staff)"""
+    playlist = get_object_or_404(Playlist, pk=pk)
+    error = _access_error(request, playlist.user_id)
+    if error:
+        return error
+    try:
+        track_ids = _json_track_ids(json.loads(request.body).get('tracks'))
+    except (ValueError, AttributeError) as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    
+    # Несуществующие и уже добавленные треки append пропускает сам
+    added = playlist_order.append(playlist, track_ids)
+    
+    return JsonResponse({'added': added, 'skipped': len(set(track_ids)) - added})
+
+
+@require_POST
+def playlist_reorder_view(request, pk):
+    """Порядок плейлиста: {"tracks": [id, ...]} - новый порядок
+    (остальные треки - следом), или {"track": id, "after": id | null} - перемещение одного трека.
+    Менять порядок может владелец или staff
+    """
+    playlist = get_object_or_404(Playlist, pk=pk)
+    error = _access_error(request, playlist.user_id)
+    if error:
+        return error
+    try:
+        payload = json.loads(request.body)
+        if 'tracks' in payload:
+            changed = playlist_order.reorder(playlist, _json_track_ids(payload['tracks']))
+        else:
+            track_id, after = payload['track'], payload.get('after')
+            if not playlist.entries.filter(track_id=track_id).exists():
+                return JsonResponse({'error': f'Трека {track_id} нет в плейлисте'}, status=400)
+            playlist_order.move(playlist, track_id, after)
+            changed = 1
+    except (ValueError, KeyError, TypeError, AttributeError, PlaylistEntry.DoesNotExist) as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    
+    return JsonResponse({'changed': changed})
+
+
+def playlist_track_picker(request, pk):
+    """JSON-подборщик треков для плейлиста: q - поиск по названию и исполнителю,
+    cursor - следующая страница; треки плейлиста не показываются
+    """
+    playlist = get_object_or_404(Playlist, pk=pk)
+    page = playlist_order.candidates(playlist, request.GET.get('q', ''), request.GET.get('cursor'))
+    
+    return JsonResponse({
+        'results': [
+            {
+                'id': track.pk,
+                'title': track.title,
+                'artist': track.release.artist.name,
+                'release': track.release.title,
+                'duration': track.get_duration(),
+            }
+            for track in page['items']
+        ],
+        'next': page['next'],
+    })
+
+
+def playlist_export(request, pk, file_format):
+    """Выгрузка плейлиста в M3U, XSPF или JSON потоком (треки читаются порциями)"""
+    playlist = get_object_or_404(Playlist, pk=pk)
+    if file_format not in playlist_io.FORMATS:
+        return JsonResponse({'error': f'Формат: {", ".join(playlist_io.FORMATS)}'}, status=400)
+    content_type, extension = playlist_io.FORMATS[file_format]
+    
+    def location(track):
+        return request.build_absolute_uri(track.get_absolute_url())
+    
+    response = StreamingHttpResponse(playlist_io.export(playlist, file_format, location), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="playlist-{playlist.pk}.{extension}"'
+    return response
+
+
+@require_POST
+def playlist_import(request, pk):
+    """Загрузка файла плейлиста (поле file: M3U, XSPF или JSON): найденные в каталоге треки
+    добавляются в конец, итоги - в JSON. Загружать может владелец или staff
+    """
+    playlist = get_object_or_404(Playlist, pk=pk)
+    error = _access_error(request, playlist.user_id)
+    if error:
+        return error
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({'error': 'Нужен файл в поле file'}, status=400)
+    file_format = request.POST.get('format') or playlist_io.guess_format(upload.name)
+    if file_format not in playlist_io.FORMATS:
+        return JsonResponse({'error': f'Формат: {", ".join(playlist_io.FORMATS)}'}, status=400)
+    
+    # XSPF разбирает iterparse по байтам, остальные форматы - текст
+    stream = upload if file_format == 'xspf' else io.TextIOWrapper(upload, encoding='utf-8-sig')
+    try:
+        totals = playlist_io.import_entries(playlist, playlist_io.read_entries(stream, file_format))
+    except (ValueError, UnicodeDecodeError, ElementTree.ParseError) as error:
+        return JsonResponse({'error': f'Не удалось разобрать файл: {error}'}, status=400)
+    
+    return JsonResponse(totals)
+
+
+def smart_playlist_view(request, pk):
+    """Треки смарт-плейлиста в JSON: состав уже материализован, читается по индексу.
+    Непубличный плейлист виден только владельцу и сотрудникам
+    """
+    playlist = get_object_or_404(SmartPlaylist.objects.select_related('user'), pk=pk)
+    if not playlist.is_public and not _is_owner(request, playlist.user_id):
+        raise Http404('Плейлист не найден')
+    tracks = smart_playlists.tracks(playlist).select_related('release__artist')
+    
+    return JsonResponse({
+        'id': playlist.pk,
+        'title': playlist.title,
+        'user': playlist.user.username,
+        'rules': playlist.rules,
+        'order_by': playlist.order_by,
+        'limit': playlist.limit,
+        'track_count': playlist.track_count,
+        'tracks': [
+            {
+                'id': track.pk,
+                'title': track.title,
+                'artist': track.release.artist.name,
+                'release': track.release.title,
+                'duration': track.get_duration(),
+                'play_count': track.play_count,
+                'url': track.get_absolute_url(),
+            }
+            for track in tracks
+        ],
+    })
@@ -0,0 +1,173 @@
+"""Кэш виджетов главной страницы
+
+Каждый виджет - функция, вычисляющая готовые для шаблона данные (списки,
+а не ленивые queryset'ы). Значение хранится в кэше Django вместе со
+временем расчета и версией. Версия увеличивается сигналами при изменении
+моделей, от которых зависит виджет (catalog/signals.py); кроме того,
+значение старше max_age пересчитывается в любом случае - это граница
+устаревания для изменений без сигналов (queryset.update, F()-счетчики).
+
+Защита от "стампеды": пересчитывает только тот, кто взял блокировку
+через cache.add(); остальные отдают прошлое значение, а если его нет -
+недолго ждут результата. Для защиты между процессами нужен общий бэкенд
+кэша (Redis, Memcached); с LocMemCache блокировка действует в процессе.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from . import stats, trending
+from .models import Artist, Genre, Release, Track, TrendingScore
+
+KEY_PREFIX = 'catalog:widget'
+
+# Сколько секунд держится блокировка пересчета (если воркер упал посреди расчета)
+LOCK_TIMEOUT = 30
+
+# Как часто и сколько ждать чужой пересчет, если отдать нечего
+WAIT_INTERVAL = 0.05
+WAIT_TIMEOUT = 5
+
+# Граница устаревания по умолчанию, секунд (переопределяется CATALOG_WIDGET_MAX_AGE)
+DEFAULT_MAX_AGE = 60
+
+WIDGETS = {}
+
+
+def widget(name, depends_on, max_age=DEFAULT_MAX_AGE):
+    """Регистрирует функцию расчета виджета"""
+    def decorator(func):
+        WIDGETS[name] = {
+            'compute': func,
+            'depends_on': tuple(depends_on),
+            'max_age': max_age,
+        }
+        return func
+    return decorator
+
+
+def _max_age(name):
+    overrides = getattr(settings, 'CATALOG_WIDGET_MAX_AGE', {})
+    return overrides.get(name, WIDGETS[name]['max_age'])
+
+
+def _value_key(name):
+    return f'{KEY_PREFIX}:{name}:value'
+
+
+def _version_key(name):
+    return f'{KEY_PREFIX}:{name}:version'
+
+
+def _lock_key(name):
+    return f'{KEY_PREFIX}:{name}:lock'
+
+
+def get(name):
+    """Значение виджета из кэша; пересчитывает не чаще, чем нужно"""
+    entries = cache.get_many([_value_key(name), _version_key(name)])
+    entry = entries.get(_value_key(name))
+    version = entries.get(_version_key(name), 0)
+
+    if entry is not None and entry['version'] == version:
+        if time.time() - entry['computed_at'] < _max_age(name):
+            return entry['value']
+
+    if cache.add(_lock_key(name), True, LOCK_TIMEOUT):
+        try:
+            return _recompute(name, version)
+        finally:
+            cache.delete(_lock_key(name))
+
+    # Пересчитывает другой воркер
+    if entry is not None:
+        return entry['value']
+
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        entry = cache.get(_value_key(name))
+        if entry is not None:
+            return entry['value']
+    return WIDGETS[name]['compute']()
+
+
+def _recompute(name, version):
+    value = WIDGETS[name]['compute']()
+    cache.set(
+        _value_key(name),
+        {'value': value, 'version': version, 'computed_at': time.time()},
+        timeout=None,
+    )
+    return value
+
+
+def get_many(names):
+    return {name: get(name) for name in names}
+
+
+def invalidate(name):
+    """Помечает виджет устаревшим (прошлое значение еще отдается, пока идет пересчет)"""
+    try:
+        cache.incr(_version_key(name))
+    except ValueError:
+        cache.set(_version_key(name), 1, timeout=None)
+
+
+def invalidate_for(model):
+    """Помечает устаревшими виджеты, зависящие от модели"""
+    for name, options in WIDGETS.items():
+        if model in options['depends_on']:
+            invalidate(name)
+
+
+# Виджеты главной страницы
+
+@widget('new_releases', depends_on=[Release, Artist])
+def new_releases():
+    """Новые релизы (последние 5)"""
+    return list(Release.objects.select_related('artist').order_by('-id')[:5])
+
+
+@widget('featured_artists', depends_on=[Artist])
+def featured_artists():
+    """Избранные исполнители"""
+    return list(Artist.objects.filter(featured=True)[:4])
+
+
+@widget('popular_tracks', depends_on=[Track, Release, Artist, TrendingScore], max_age=30)
+def popular_tracks():
+    """Трендовые треки (затухающий счет), пока трендов нет - по play_count"""
+    tracks = trending.tracks(limit=5)
+    if tracks:
+        return tracks
+    return list(
+        Track.objects.select_related('release__artist').filter(
+            play_count__gt=0
+        ).order_by('-play_count')[:5]
+    )
+
+
+@widget('genres_with_stats', depends_on=[Genre, Track, Track.genres.through])
+def genres_with_stats():
+    """Жанры с количеством треков"""
+    return list(
+        Genre.objects.annotate(
+            track_count=Count('tracks')
+        ).order_by('-track_count')[:6]
+    )
+
+
+@widget('stats', depends_on=[Artist, Release, Track])
+def overall_stats():
+    """Общая статистика каталога"""
+    catalog_stats = stats.get()  # одна строка CatalogStats
+    return {
+        'total_artists': catalog_stats.artist_count,
+        'total_tracks': catalog_stats.track_count,
+        'total_releases': catalog_stats.release_count,
+        'most_popular_track': Track.objects.select_related('release__artist').order_by('-play_count').first(),
+        'avg_track_duration': catalog_stats.avg_duration,
+    }
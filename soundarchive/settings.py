@@ -131,4 +131,62 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Медиа файлы
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Своей страницы входа нет - страницы для авторизованных ведут на вход админки
+LOGIN_URL = 'admin:login'
+
+# Настройки каталога
+
+# Через сколько секунд индекс автодополнения перечитывается из базы
+CATALOG_AUTOCOMPLETE_TTL = 300
+
+# Граница устаревания виджетов главной страницы, секунд (по имени виджета,
+# см. catalog/widget_cache.py). Для защиты от одновременного пересчета
+# между воркерами нужен общий бэкенд CACHES (Redis, Memcached)
+CATALOG_WIDGET_MAX_AGE = {
+    'popular_tracks': 30,
+    'stats': 60,
+}
+
+# Пакетный прием прослушиваний (catalog/scrobble_ingest.py): сброс буфера
+# каждые N строк или T миллисекунд; 0 - писать синхронно в каждом запросе
+CATALOG_SCROBBLE_FLUSH_SIZE = 500
+CATALOG_SCROBBLE_FLUSH_INTERVAL_MS = 200
+
+# Сервисный токен для приема прослушиваний от имени любых пользователей
+# (заголовок "Authorization: Token <токен>"); None - только пользователи
+# сайта от своего имени
+CATALOG_SCROBBLE_INGEST_TOKEN = os.environ.get('CATALOG_SCROBBLE_INGEST_TOKEN')
+
+# Холодный архив прослушиваний (catalog/scrobble_archive.py): сколько последних
+# месяцев остается в таблице и куда пишутся файлы (None - MEDIA_ROOT/scrobble_archive)
+CATALOG_SCROBBLE_HOT_MONTHS = 3
+CATALOG_SCROBBLE_ARCHIVE_DIR = None
+
+# Тренды (catalog/trending.py): период полураспада веса прослушивания, часов,
+# и сколько мест хранится в каждом топе
+CATALOG_TRENDING_HALF_LIFE_HOURS = 24
+CATALOG_TRENDING_TOP_K = 50
+
+# Живой топ за 5/60 минут (catalog/heavy_hitters.py): как часто, секунд,
+# сохранять окна в базу, чтобы не терять их при перезапуске (0 - не сохранять)
+CATALOG_LIVE_PERSIST_INTERVAL = 60
+
+# Большие списки админки (catalog/approximate_counts.py): до скольких строк
+# считается отфильтрованный список (дальше - "больше N") и сколько секунд
+# кэшируется гистограмма дат для date_hierarchy
+CATALOG_ADMIN_COUNT_LIMIT = 10000
+CATALOG_ADMIN_HISTOGRAM_TTL = 3600
+
+# Фоновые выгрузки PDF (catalog/export_jobs.py, команда run_export_worker):
+# сколько задач выполняется одновременно (всего и у одного пользователя),
+# число попыток и задержка перед повтором (удваивается с каждой попыткой),
+# через сколько секунд без отклика задача воркера возвращается в очередь
+# и сколько секунд хранятся готовые файлы
+CATALOG_EXPORT_CONCURRENCY = 2
+CATALOG_EXPORT_USER_CONCURRENCY = 1
+CATALOG_EXPORT_MAX_ATTEMPTS = 3
+CATALOG_EXPORT_RETRY_DELAY = 30
+CATALOG_EXPORT_STALE_AFTER = 600
+CATALOG_EXPORT_TTL = 86400